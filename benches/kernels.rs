@@ -0,0 +1,160 @@
+//! 核心吞吐量基準測試（criterion）
+//!
+//!     cargo bench --bench kernels
+//!     cargo bench --bench kernels -- --save-baseline main   # 儲存基準
+//!     cargo bench --bench kernels -- --baseline main        # 與基準比較
+//!
+//! 預設資料量為 1e4–1e6 列，設定 BENCH_MAX_ROWS=100000000 可量測到 1e8 列。
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use polars::prelude::*;
+use polars_indicator::bench;
+
+const SIZES: [usize; 5] = [10_000, 100_000, 1_000_000, 10_000_000, 100_000_000];
+
+fn sizes() -> Vec<usize> {
+    let max_rows = std::env::var("BENCH_MAX_ROWS")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(1_000_000);
+    SIZES.into_iter().filter(|&n| n <= max_rows).collect()
+}
+
+/// 可重現的線性同餘亂數，返回 [0, 1) 的均勻分佈
+struct Lcg(u64);
+
+impl Lcg {
+    fn next(&mut self) -> f64 {
+        self.0 = self
+            .0
+            .wrapping_mul(6364136223846793005)
+            .wrapping_add(1442695040888963407);
+        (self.0 >> 11) as f64 / (1u64 << 53) as f64
+    }
+}
+
+/// 隨機漫步的 high, low, close, atr；null_ratio 比例的 atr 為 null，切成 n_chunks 個 chunk
+fn random_walk(n: usize, null_ratio: f64, n_chunks: usize) -> [Series; 4] {
+    let mut rng = Lcg(42);
+    let mut close = 100.0;
+    let (mut high, mut low, mut closes, mut atr) = (
+        Vec::with_capacity(n),
+        Vec::with_capacity(n),
+        Vec::with_capacity(n),
+        Vec::with_capacity(n),
+    );
+    for _ in 0..n {
+        close += rng.next() - 0.5;
+        let spread = 0.1 + rng.next() * 0.5;
+        high.push(close + spread);
+        low.push(close - spread);
+        closes.push(close);
+        atr.push((rng.next() >= null_ratio).then_some(spread * 2.0));
+    }
+    [
+        chunked(Series::new("high".into(), high), n_chunks),
+        chunked(Series::new("low".into(), low), n_chunks),
+        chunked(Series::new("close".into(), closes), n_chunks),
+        chunked(Series::new("atr".into(), atr), n_chunks),
+    ]
+}
+
+/// 以 n_chunks 段等長切片重新串接，模擬 pl.concat(rechunk=False) 的輸入
+fn chunked(s: Series, n_chunks: usize) -> Series {
+    let len = s.len();
+    let step = len.div_ceil(n_chunks.max(1)).max(1);
+    let mut out = s.slice(0, step.min(len));
+    let mut offset = step;
+    while offset < len {
+        out.append(&s.slice(offset as i64, step.min(len - offset)))
+            .unwrap();
+        offset += step;
+    }
+    out
+}
+
+fn signals(n: usize, density: f64, seed: u64) -> Series {
+    let mut rng = Lcg(seed);
+    let values: Vec<bool> = (0..n).map(|_| rng.next() < density).collect();
+    Series::new("signal".into(), values)
+}
+
+fn group_key(n: usize, n_groups: usize) -> Series {
+    let per_group = n.div_ceil(n_groups.max(1)).max(1);
+    let values: Vec<u32> = (0..n).map(|i| (i / per_group) as u32).collect();
+    Series::new("symbol".into(), values)
+}
+
+fn bench_supertrend(c: &mut Criterion) {
+    let mut group = c.benchmark_group("supertrend");
+    for n in sizes() {
+        group.throughput(Throughput::Elements(n as u64));
+        for (null_ratio, n_chunks) in [(0.0, 1), (0.01, 1), (0.0, 64)] {
+            let [high, low, close, atr] = random_walk(n, null_ratio, n_chunks);
+            let id = BenchmarkId::new(format!("nulls={null_ratio}/chunks={n_chunks}"), n);
+            group.bench_with_input(id, &n, |b, _| {
+                b.iter(|| bench::supertrend(&high, &low, &close, &atr, 2.0, 2.0).unwrap())
+            });
+        }
+    }
+    group.finish();
+}
+
+fn bench_clean_enex_position(c: &mut Criterion) {
+    let mut group = c.benchmark_group("clean_enex_position");
+    for n in sizes() {
+        group.throughput(Throughput::Elements(n as u64));
+        for density in [0.001, 0.3] {
+            let entries = signals(n, density, 1);
+            let exits = signals(n, density, 2);
+            for n_groups in [1, 100] {
+                let by = (n_groups > 1).then(|| group_key(n, n_groups));
+                let id = BenchmarkId::new(format!("density={density}/groups={n_groups}"), n);
+                group.bench_with_input(id, &n, |b, _| {
+                    b.iter(|| bench::clean_enex_position(&entries, &exits, by.as_ref()).unwrap())
+                });
+            }
+        }
+    }
+    group.finish();
+}
+
+fn bench_reshape_position_id_array(c: &mut Criterion) {
+    let mut group = c.benchmark_group("reshape_position_id_array");
+    for n in sizes() {
+        group.throughput(Throughput::Elements(n as u64));
+        for density in [0.001, 0.05] {
+            // 由 clean_enex_position 的結果產生不重疊的交易列表
+            let mut rng = Lcg(7);
+            let (mut position_id, mut entry_idx, mut exit_idx) = (vec![], vec![], vec![]);
+            let mut i = 0usize;
+            while i < n {
+                let hold = 1 + (rng.next() / density) as usize;
+                if rng.next() < 0.5 {
+                    position_id.push(position_id.len() as i64);
+                    entry_idx.push(i as i64);
+                    exit_idx.push((i + hold).min(n - 1) as i64);
+                }
+                i += hold + 1;
+            }
+            let position_id = Series::new("position_id".into(), position_id);
+            let entry_idx = Series::new("entry_idx".into(), entry_idx);
+            let exit_idx = Series::new("exit_idx".into(), exit_idx);
+            let id = BenchmarkId::new(format!("density={density}"), n);
+            group.bench_with_input(id, &n, |b, &n| {
+                b.iter(|| {
+                    bench::reshape_position_id_array(n, &position_id, &entry_idx, &exit_idx, "last")
+                        .unwrap()
+                })
+            });
+        }
+    }
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    bench_supertrend,
+    bench_clean_enex_position,
+    bench_reshape_position_id_array
+);
+criterion_main!(benches);
@@ -0,0 +1,36 @@
+"""
+indicator_bundle 與分別呼叫各指標的比較
+
+    uv run maturin develop --release
+    uv run pytest benchmarks/bench_bundle.py
+"""
+
+import pytest
+from conftest import BENCH_SIZES, random_walk_ohlcv
+from polars_indicator import atr, indicator_bundle, supertrend
+
+MULTIPLIERS = [1.5, 2.0, 2.5, 3.0]
+
+
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_separate_calls(benchmark, n):
+    df = random_walk_ohlcv(n)
+    exprs = [
+        supertrend(upper_multiplier=m, lower_multiplier=m).alias(f"st_{m}")
+        for m in MULTIPLIERS
+    ]
+    exprs.append(atr(period=14).alias("atr_14"))
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, exprs)
+
+
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_indicator_bundle(benchmark, n):
+    df = random_walk_ohlcv(n)
+    specs = {
+        f"st_{m}": {"kind": "supertrend", "upper_multiplier": m, "lower_multiplier": m}
+        for m in MULTIPLIERS
+    }
+    specs["atr_14"] = {"kind": "atr", "period": 14}
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, indicator_bundle(specs))
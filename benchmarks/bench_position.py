@@ -0,0 +1,55 @@
+"""
+clean_enex_position 與 reshape_position_id_array 吞吐量基準測試
+
+涵蓋稀疏（每根約 0.1% 機率）到密集（每根約 30% 機率）的信號、chunk 數與分組數：
+
+    uv run maturin develop --release
+    uv run pytest benchmarks/bench_position.py
+"""
+
+import polars as pl
+import pytest
+from conftest import BENCH_SIZES, random_signals, with_chunks, with_groups
+from polars_indicator import clean_enex_position, extract_trades, reshape_position_id_array
+
+DENSITIES = {"sparse": 0.001, "medium": 0.05, "dense": 0.3}
+
+
+@pytest.mark.parametrize("density", list(DENSITIES))
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_clean_enex_position(benchmark, n, density):
+    df = random_signals(n, DENSITIES[density])
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, clean_enex_position("entry", "exit", True))
+
+
+@pytest.mark.parametrize("n_chunks", [16, 256])
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_clean_enex_position_chunks(benchmark, n, n_chunks):
+    df = with_chunks(random_signals(n, DENSITIES["medium"]), n_chunks)
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, clean_enex_position("entry", "exit", True))
+
+
+@pytest.mark.parametrize("n_groups", [10, 1000])
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_clean_enex_position_by(benchmark, n, n_groups):
+    df = with_groups(random_signals(n, DENSITIES["medium"]), n_groups)
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, clean_enex_position("entry", "exit", True, by="symbol"))
+
+
+@pytest.mark.parametrize("density", ["sparse", "medium"])
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_reshape_position_id_array(benchmark, n, density):
+    signals = random_signals(n, DENSITIES[density])
+    trades = (
+        signals.with_columns(price=pl.lit(1.0))
+        .select(extract_trades(clean_enex_position("entry", "exit", True), "price"))
+        .unnest("trades")
+    )
+    benchmark.extra_info["rows"] = n
+    benchmark(
+        trades.select,
+        reshape_position_id_array(n, "position_id", "entry_idx", "exit_idx"),
+    )
@@ -0,0 +1,36 @@
+"""
+supertrend 吞吐量基準測試
+
+涵蓋資料量、缺值比例（快速路徑與遮罩路徑）、chunk 數與分組數：
+
+    uv run maturin develop --release
+    uv run pytest benchmarks/bench_supertrend.py
+"""
+
+import pytest
+from conftest import BENCH_SIZES, random_walk_ohlcv, with_chunks, with_groups
+from polars_indicator import supertrend
+
+
+@pytest.mark.parametrize("null_ratio", [0.0, 0.01])
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_supertrend(benchmark, n, null_ratio):
+    df = random_walk_ohlcv(n, null_ratio)
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, supertrend())
+
+
+@pytest.mark.parametrize("n_chunks", [16, 256])
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_supertrend_chunks(benchmark, n, n_chunks):
+    df = with_chunks(random_walk_ohlcv(n), n_chunks)
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, supertrend())
+
+
+@pytest.mark.parametrize("n_groups", [10, 1000])
+@pytest.mark.parametrize("n", BENCH_SIZES)
+def bench_supertrend_by(benchmark, n, n_groups):
+    df = with_groups(random_walk_ohlcv(n), n_groups)
+    benchmark.extra_info["rows"] = n
+    benchmark(df.select, supertrend(by="symbol"))
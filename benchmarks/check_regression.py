@@ -0,0 +1,60 @@
+"""
+比較 pytest-benchmark 的 JSON 結果與基準，任一項目變慢超過門檻即以非零狀態結束
+
+    uv run python benchmarks/check_regression.py benchmarks/baseline.json \
+        benchmarks/.results/latest.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: Path, stat: str) -> dict[str, float]:
+    """讀取每個基準測試項目的統計值（秒）"""
+    data = json.loads(path.read_text())
+    return {bench["fullname"]: bench["stats"][stat] for bench in data["benchmarks"]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1, help="允許的變慢比例")
+    parser.add_argument("--stat", default="median", choices=["min", "median", "mean"])
+    args = parser.parse_args()
+
+    if not args.baseline.exists():
+        print(f"找不到基準 {args.baseline}，請先執行 make bench-baseline", file=sys.stderr)
+        return 2
+
+    baseline = load(args.baseline, args.stat)
+    current = load(args.current, args.stat)
+
+    regressions = []
+    print(f"{'benchmark':<72} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, value in sorted(current.items()):
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<72} {'-':>10} {value:>10.4g} {'new':>8}")
+            continue
+        change = value / base - 1.0
+        flag = " !" if change > args.threshold else ""
+        print(f"{name:<72} {base:>10.4g} {value:>10.4g} {change:>+8.1%}{flag}")
+        if change > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(
+            f"\n{len(regressions)} 項變慢超過 {args.threshold:.0%}：",
+            *regressions,
+            sep="\n  ",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
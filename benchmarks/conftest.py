@@ -0,0 +1,64 @@
+"""
+基準測試共用的合成資料
+
+資料量預設為 1e4–1e6 列，設定 BENCH_MAX_ROWS 可延伸到 1e8 列：
+
+    BENCH_MAX_ROWS=100000000 uv run pytest benchmarks
+"""
+
+import os
+
+import numpy as np
+import polars as pl
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000, 100_000_000]
+MAX_ROWS = int(float(os.environ.get("BENCH_MAX_ROWS", "1e6")))
+BENCH_SIZES = [n for n in SIZES if n <= MAX_ROWS]
+
+
+def random_walk_ohlcv(n: int, null_ratio: float = 0.0, seed: int = 42) -> pl.DataFrame:
+    """產生隨機漫步的 OHLCV 與 ATR，null_ratio 比例的 atr 為 null"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0.0, 0.5, n))
+    spread = np.abs(rng.normal(0.0, 0.3, n))
+    df = pl.DataFrame(
+        {
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "volume": rng.integers(1, 10_000, n),
+            "atr": spread * 2.0 + 0.1,
+        }
+    )
+    if null_ratio > 0.0:
+        mask = pl.Series(rng.random(n) < null_ratio)
+        df = df.with_columns(
+            pl.when(mask).then(None).otherwise(pl.col("atr")).alias("atr")
+        )
+    return df
+
+
+def random_signals(n: int, density: float, seed: int = 42) -> pl.DataFrame:
+    """產生指定密度的隨機進出場信號"""
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame(
+        {
+            "entry": rng.random(n) < density,
+            "exit": rng.random(n) < density,
+        }
+    )
+
+
+def with_chunks(df: pl.DataFrame, n_chunks: int) -> pl.DataFrame:
+    """切成 n_chunks 段後不合併地串接，模擬 pl.concat 多個日檔的輸入"""
+    if n_chunks <= 1:
+        return df.rechunk()
+    step = -(-df.height // n_chunks)
+    parts = [df.slice(offset, step) for offset in range(0, df.height, step)]
+    return pl.concat(parts, rechunk=False)
+
+
+def with_groups(df: pl.DataFrame, n_groups: int) -> pl.DataFrame:
+    """加入依序排列的分組鍵 symbol，共 n_groups 組"""
+    per_group = -(-df.height // n_groups)
+    return df.with_columns(symbol=pl.int_range(pl.len(), dtype=pl.UInt32) // per_group)
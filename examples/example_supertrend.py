@@ -1,6 +1,5 @@
 import polars as pl
-import polars_talib as plta
-from polars_indicator import supertrend
+from polars_indicator import atr, supertrend
 
 # 創建示例數據
 df = pl.DataFrame(
@@ -59,8 +58,8 @@ df = pl.DataFrame(
     }
 )
 
-# 計算 ATR (使用簡單的方法)
-df = df.lazy().with_columns(atr=plta.atr(timeperiod=12))
+# 計算 ATR（原生實作，結果與 TA-Lib 相同）
+df = df.lazy().with_columns(atr(period=12))
 
 # 使用 supertrend 函數 - 返回 4 個欄位
 result = df.with_columns(supertrend())
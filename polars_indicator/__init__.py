@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import itertools
+from datetime import timedelta
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Mapping, Sequence
 
 import polars as pl
 from polars.plugins import register_plugin_function
 
+from polars_indicator._internal import AtrState, EnexPositionState, SuperTrendState
 from polars_indicator._internal import __version__ as __version__
 
 if TYPE_CHECKING:
@@ -15,9 +18,30 @@ LIB = Path(__file__).parent
 
 __all__ = [
     "pig_latinnify",
+    "rma",
+    "ema",
+    "sma",
+    "rolling_max",
+    "rolling_min",
+    "true_range",
+    "atr",
+    "AtrState",
     "supertrend",
+    "supertrend_from_ohlc",
+    "supertrend_grid",
+    "indicator_bundle",
+    "SuperTrendState",
+    "align_timeframe",
     "clean_enex_position",
+    "clean_enex_position_state",
+    "EnexPositionState",
+    "extract_trades",
+    "intrade_context",
+    "advanced_exit",
+    "trade_excursions",
+    "performance_summary",
     "reshape_position_id_array",
+    "reshape_position_id_diagnostics",
 ]
 
 
@@ -30,6 +54,183 @@ def pig_latinnify(expr: IntoExprColumn) -> pl.Expr:
     )
 
 
+def _moving_average(
+    expr: IntoExprColumn, period: int, smoothing: str, output_dtype: str
+) -> pl.Expr:
+    return register_plugin_function(
+        args=[expr],
+        kwargs={
+            "period": int(period),
+            "smoothing": smoothing,
+            "output_dtype": output_dtype,
+        },
+        plugin_path=LIB,
+        function_name="moving_average",
+        is_elementwise=False,
+    )
+
+
+def rma(expr: IntoExprColumn, period: int, output_dtype: str = "float64") -> pl.Expr:
+    """
+    Wilder 移動平均（RMA），以前 period 個有效值的簡單平均作為初始值
+
+    缺值（null 或 NaN）不更新狀態且該列輸出 null，尚未累積滿 period 個有效值時為 null。
+
+    Args:
+        expr: 數值序列（整數或浮點數）
+        period: 週期
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return _moving_average(expr, period, "rma", output_dtype)
+
+
+def ema(expr: IntoExprColumn, period: int, output_dtype: str = "float64") -> pl.Expr:
+    """
+    指數移動平均（EMA，alpha = 2 / (period + 1)），初始值與缺值處理同 rma
+
+    Args:
+        expr: 數值序列（整數或浮點數）
+        period: 週期
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return _moving_average(expr, period, "ema", output_dtype)
+
+
+def sma(expr: IntoExprColumn, period: int, output_dtype: str = "float64") -> pl.Expr:
+    """
+    簡單移動平均（SMA），以最近 period 個有效值計算，缺值處理同 rma
+
+    Args:
+        expr: 數值序列（整數或浮點數）
+        period: 週期
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return _moving_average(expr, period, "sma", output_dtype)
+
+
+def _rolling_extremum(
+    expr: IntoExprColumn, period: int, maximum: bool, output_dtype: str
+) -> pl.Expr:
+    return register_plugin_function(
+        args=[expr],
+        kwargs={
+            "period": int(period),
+            "maximum": maximum,
+            "output_dtype": output_dtype,
+        },
+        plugin_path=LIB,
+        function_name="rolling_extremum",
+        is_elementwise=False,
+    )
+
+
+def rolling_max(
+    expr: IntoExprColumn, period: int, output_dtype: str = "float64"
+) -> pl.Expr:
+    """
+    最近 period 列的滾動最大值，以單調佇列計算，每列攤銷 O(1)
+
+    缺值不參與計算；累積不足 period 列或視窗內全為缺值時為 null。
+
+    Args:
+        expr: 數值序列（整數或浮點數）
+        period: 視窗列數
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return _rolling_extremum(expr, period, True, output_dtype)
+
+
+def rolling_min(
+    expr: IntoExprColumn, period: int, output_dtype: str = "float64"
+) -> pl.Expr:
+    """
+    最近 period 列的滾動最小值，計算方式同 rolling_max
+
+    Args:
+        expr: 數值序列（整數或浮點數）
+        period: 視窗列數
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return _rolling_extremum(expr, period, False, output_dtype)
+
+
+def true_range(
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    close: IntoExprColumn = pl.col("close"),
+    output_dtype: str = "float64",
+) -> pl.Expr:
+    """
+    True Range，第一根沒有前收盤價因此為 null（與 TA-Lib TRANGE 相同）
+
+    Args:
+        high: 最高價序列
+        low: 最低價序列
+        close: 收盤價序列
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return register_plugin_function(
+        args=[high, low, close],
+        kwargs={"output_dtype": output_dtype},
+        plugin_path=LIB,
+        function_name="true_range",
+        is_elementwise=False,
+    ).alias("true_range")
+
+
+def atr(
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    close: IntoExprColumn = pl.col("close"),
+    period: int = 14,
+    smoothing: str = "rma",
+    output_dtype: str = "float64",
+) -> pl.Expr:
+    """
+    單次掃描計算 ATR，預設 Wilder 平滑，結果與 TA-Lib ATR 相同，不需經過 NumPy 轉換
+
+    Args:
+        high: 最高價序列
+        low: 最低價序列
+        close: 收盤價序列
+        period: ATR 週期，預設為 14
+        smoothing: 平滑方式，"rma"、"sma" 或 "ema"
+        output_dtype: 輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        Float64（或 Float32）表達式
+    """
+    return register_plugin_function(
+        args=[high, low, close],
+        kwargs={
+            "period": int(period),
+            "smoothing": smoothing,
+            "output_dtype": output_dtype,
+        },
+        plugin_path=LIB,
+        function_name="atr",
+        is_elementwise=False,
+    ).alias("atr")
+
+
 def supertrend(
     high: IntoExprColumn = pl.col("high"),
     low: IntoExprColumn = pl.col("low"),
@@ -37,6 +238,10 @@ def supertrend(
     atr: IntoExprColumn = pl.col("atr"),
     upper_multiplier: float = 2.0,
     lower_multiplier: float = 2.0,
+    by: IntoExprColumn | None = None,
+    bucket: IntoExprColumn | None = None,
+    developing: bool = False,
+    output_dtype: str = "float64",
 ) -> pl.Expr:
     """
     計算 SuperTrend 指標
@@ -48,20 +253,46 @@ def supertrend(
         atr: ATR 值序列
         upper_multiplier: 上軌倍數，預設為 2.0
         lower_multiplier: 下軌倍數，預設為 2.0
+        by: 分組鍵（例如 symbol），資料需依分組鍵排序；每組重新計算且各組平行處理，
+            結果等同於 .over(by) 但不需逐組呼叫插件
+        bucket: 高時間框架的區間鍵（例如 pl.col("timestamp").dt.truncate("5m")），
+            指定時在核心內聚合 OHLC 後計算，每列輸出最近一根已完成 K 棒的值；
+            此時 atr 需為高時間框架尺度（例如以 align_timeframe 對齊）
+        developing: 搭配 bucket 使用，改為輸出包含當列在內、尚未完成的 K 棒的試算值
+        output_dtype: 浮點字段的輸出精度，"float64"（預設）或 "float32"；
+            輸入可為 Float64/Float32/Int32/Int64，原生緩衝區直接讀取，內部一律以 f64 計算
 
     Returns:
         包含 direction, long, short, trend 四個字段的結構體表達式
     """
+    if bucket is not None:
+        return _supertrend_resampled(
+            [high, low, close, bucket, atr],
+            upper_multiplier,
+            lower_multiplier,
+            atr_period=None,
+            smoothing="rma",
+            developing=developing,
+            include_atr=False,
+            output_dtype=output_dtype,
+            by=by,
+        )
+
+    args = [
+        high,
+        low,
+        close,
+        atr,
+        pl.lit(upper_multiplier),
+        pl.lit(lower_multiplier),
+    ]
+    if by is not None:
+        args.append(by)
+
     # 註冊插件函數以獲取結構
     st_struct = register_plugin_function(
-        args=[
-            high,
-            low,
-            close,
-            atr,
-            pl.lit(upper_multiplier),
-            pl.lit(lower_multiplier),
-        ],
+        args=args,
+        kwargs={"output_dtype": output_dtype},
         plugin_path=LIB,
         function_name="supertrend",
         is_elementwise=False,
@@ -72,10 +303,347 @@ def supertrend(
     return st_struct.alias("supertrend")
 
 
+def supertrend_from_ohlc(
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    close: IntoExprColumn = pl.col("close"),
+    atr_period: int = 14,
+    smoothing: str = "rma",
+    upper_multiplier: float = 2.0,
+    lower_multiplier: float = 2.0,
+    include_atr: bool = False,
+    by: IntoExprColumn | None = None,
+    bucket: IntoExprColumn | None = None,
+    developing: bool = False,
+    output_dtype: str = "float64",
+) -> pl.Expr:
+    """
+    由 high, low, close 直接計算 SuperTrend，於同一次掃描內完成 TR、ATR 與上下軌
+
+    Args:
+        high: 最高價序列
+        low: 最低價序列
+        close: 收盤價序列
+        atr_period: ATR 週期，預設為 14
+        smoothing: ATR 平滑方式，"rma"（Wilder，與 TA-Lib ATR 相同）、"sma" 或 "ema"
+        upper_multiplier: 上軌倍數，預設為 2.0
+        lower_multiplier: 下軌倍數，預設為 2.0
+        include_atr: 是否在結構體中額外輸出 atr 字段，預設為 False
+        by: 分組鍵（例如 symbol），資料需依分組鍵排序；每組重新計算 ATR 與 SuperTrend
+        bucket: 高時間框架的區間鍵（例如 pl.col("timestamp").dt.truncate("5m")），
+            指定時在核心內聚合 OHLC 並以聚合後的 K 棒計算 ATR 與 SuperTrend，
+            每列輸出最近一根已完成 K 棒的值，取代 group_by_dynamic 與 join
+        developing: 搭配 bucket 使用，改為輸出包含當列在內、尚未完成的 K 棒的試算值
+        output_dtype: 浮點字段的輸出精度，"float64"（預設）或 "float32"；
+            輸入可為 Float64/Float32/Int32/Int64，原生緩衝區直接讀取，內部一律以 f64 計算
+
+    Returns:
+        包含 direction, long, short, trend（以及可選 atr）字段的結構體表達式
+    """
+    if bucket is not None:
+        return _supertrend_resampled(
+            [high, low, close, bucket, pl.lit(None, dtype=pl.Float64)],
+            upper_multiplier,
+            lower_multiplier,
+            atr_period=atr_period,
+            smoothing=smoothing,
+            developing=developing,
+            include_atr=include_atr,
+            output_dtype=output_dtype,
+            by=by,
+        )
+
+    args = [
+        high,
+        low,
+        close,
+        pl.lit(atr_period),
+        pl.lit(smoothing),
+        pl.lit(upper_multiplier, dtype=pl.Float64),
+        pl.lit(lower_multiplier, dtype=pl.Float64),
+    ]
+    if by is not None:
+        args.append(by)
+
+    return register_plugin_function(
+        args=args,
+        kwargs={"include_atr": include_atr, "output_dtype": output_dtype},
+        plugin_path=LIB,
+        function_name="supertrend_from_ohlc",
+        is_elementwise=False,
+    ).alias("supertrend")
+
+
+def _supertrend_resampled(
+    args: list,
+    upper_multiplier: float,
+    lower_multiplier: float,
+    atr_period: int | None,
+    smoothing: str,
+    developing: bool,
+    include_atr: bool,
+    output_dtype: str,
+    by: IntoExprColumn | None,
+) -> pl.Expr:
+    if by is not None:
+        args.append(by)
+    return register_plugin_function(
+        args=args,
+        kwargs={
+            "upper_multiplier": float(upper_multiplier),
+            "lower_multiplier": float(lower_multiplier),
+            "atr_period": atr_period,
+            "smoothing": smoothing,
+            "developing": developing,
+            "include_atr": include_atr,
+            "output_dtype": output_dtype,
+        },
+        plugin_path=LIB,
+        function_name="supertrend_resampled",
+        is_elementwise=False,
+    ).alias("supertrend")
+
+
+def supertrend_grid(
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    close: IntoExprColumn = pl.col("close"),
+    atr: IntoExprColumn = pl.col("atr"),
+    upper_multipliers: Sequence[float] = (2.0,),
+    lower_multipliers: Sequence[float] | None = None,
+    atr_periods: Sequence[int] | None = None,
+    smoothing: str = "rma",
+    output_dtype: str = "float64",
+) -> pl.Expr:
+    """
+    單次掃描計算多組參數的 SuperTrend，參數組合分散到多個執行緒平行計算
+
+    未指定 lower_multipliers 時上下軌使用相同倍數，否則取 upper × lower 的所有組合；
+    指定 atr_periods 時忽略 atr 欄位，改由 high, low, close 計算各週期的 ATR。
+
+    Args:
+        high: 最高價序列
+        low: 最低價序列
+        close: 收盤價序列
+        atr: ATR 值序列，僅在未指定 atr_periods 時使用
+        upper_multipliers: 上軌倍數列表
+        lower_multipliers: 下軌倍數列表，預設與上軌相同
+        atr_periods: ATR 週期列表，預設使用 atr 欄位
+        smoothing: ATR 平滑方式，"rma"、"sma" 或 "ema"
+        output_dtype: 浮點字段的輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        每個參數組合一個字段的結構體表達式，字段名稱為 "{upper}_{lower}"
+        （指定 atr_periods 時為 "{period}_{upper}_{lower}"，例如 "14_2.0_2.0"），
+        倍數以 Python 的 float 格式表示（如 "1e-05_1e-05"），可直接用 f-string 組出；
+        每個字段都是包含 direction, long, short, trend 的結構體
+    """
+    args = [high, low, close]
+    if atr_periods is None:
+        args.append(atr)
+    uppers = [float(m) for m in upper_multipliers]
+    lowers = (
+        None if lower_multipliers is None else [float(m) for m in lower_multipliers]
+    )
+    periods = None if atr_periods is None else [int(p) for p in atr_periods]
+    # 字段名稱在 Python 端依 repr 產生（如 1e-05），順序與 Rust 端展開的組合一致
+    pairs = (
+        [(m, m) for m in uppers]
+        if lowers is None
+        else list(itertools.product(uppers, lowers))
+    )
+    names = [
+        f"{upper}_{lower}" if period is None else f"{period}_{upper}_{lower}"
+        for period in (periods or [None])
+        for upper, lower in pairs
+    ]
+    return register_plugin_function(
+        args=args,
+        kwargs={
+            "upper_multipliers": uppers,
+            "lower_multipliers": lowers,
+            "atr_periods": periods,
+            "names": names,
+            "smoothing": smoothing,
+            "output_dtype": output_dtype,
+        },
+        plugin_path=LIB,
+        function_name="supertrend_grid",
+        is_elementwise=False,
+    ).alias("supertrend_grid")
+
+
+# 各指標種類的輸入欄位（依序）與預設欄位名稱、可設定的參數
+_BUNDLE_INPUTS = {
+    "supertrend": ("high", "low", "close", "atr"),
+    "supertrend_from_ohlc": ("high", "low", "close"),
+    "atr": ("high", "low", "close"),
+    "clean_enex_position": ("entries", "exits"),
+}
+_BUNDLE_COLUMNS = {
+    "high": "high",
+    "low": "low",
+    "close": "close",
+    "atr": "atr",
+    "entries": "entry",
+    "exits": "exit",
+}
+_BUNDLE_PARAMS = {
+    "supertrend": {"upper_multiplier": float, "lower_multiplier": float},
+    "supertrend_from_ohlc": {
+        "atr_period": int,
+        "smoothing": str,
+        "upper_multiplier": float,
+        "lower_multiplier": float,
+    },
+    "atr": {"period": int, "smoothing": str},
+    "clean_enex_position": {"entry_first": bool},
+}
+
+
+def indicator_bundle(
+    specs: Mapping[str, Mapping[str, IntoExprColumn | float | bool]],
+    output_dtype: str = "float64",
+) -> pl.Expr:
+    """
+    單次插件呼叫內平行計算多個獨立指標
+
+    相同的輸入欄位只傳入插件一次，各指標分散到多個執行緒計算，
+    取代多個各自排程、各自讀取輸入的 supertrend / atr / clean_enex_position 呼叫：
+
+        indicator_bundle({
+            "st_2": {"kind": "supertrend", "upper_multiplier": 2.0, "lower_multiplier": 2.0},
+            "st_3": {"kind": "supertrend", "upper_multiplier": 3.0, "lower_multiplier": 3.0},
+            "st_ohlc": {"kind": "supertrend_from_ohlc", "atr_period": 10},
+            "atr_14": {"kind": "atr", "period": 14},
+            "pos_fast": {"kind": "clean_enex_position", "entries": "fast_entry", "exits": "fast_exit"},
+        })
+
+    同一次呼叫內各字段互相獨立，atr 字段的輸出不能作為 supertrend 字段的輸入；
+    資料中沒有 atr 欄位時改用 "supertrend_from_ohlc"，在核心內由 high, low, close 計算 ATR。
+
+    Args:
+        specs: 字段名稱對應指標設定，"kind" 為 "supertrend"、"supertrend_from_ohlc"、"atr"
+            或 "clean_enex_position"；其餘鍵為該指標的輸入欄位（high, low, close, atr 或
+            entries, exits，預設為同名欄位與 "entry"、"exit"）與參數（upper_multiplier,
+            lower_multiplier、atr_period, smoothing、period 或 entry_first，預設與對應函數相同）
+        output_dtype: 浮點字段的輸出精度，"float64"（預設）或 "float32"
+
+    Returns:
+        每個設定一個字段的結構體表達式，各字段與對應函數的輸出相同
+    """
+    if not specs:
+        msg = "indicator_bundle: specs must not be empty"
+        raise ValueError(msg)
+
+    args: list[pl.Expr] = []
+    bundle = []
+    for name, spec in specs.items():
+        kind = spec.get("kind")
+        if kind not in _BUNDLE_INPUTS:
+            msg = (
+                f"indicator_bundle: unknown kind {kind!r} for {name!r}, "
+                f"expected one of {sorted(_BUNDLE_INPUTS)}"
+            )
+            raise ValueError(msg)
+        unknown = set(spec) - {"kind", *_BUNDLE_INPUTS[kind], *_BUNDLE_PARAMS[kind]}
+        if unknown:
+            msg = f"indicator_bundle: unexpected keys {sorted(unknown)} for {name!r}"
+            raise ValueError(msg)
+
+        # 相同的輸入表達式只傳入一次
+        inputs = []
+        for role in _BUNDLE_INPUTS[kind]:
+            expr = spec.get(role, _BUNDLE_COLUMNS[role])
+            if isinstance(expr, str):
+                expr = pl.col(expr)
+            index = next((i for i, arg in enumerate(args) if arg.meta.eq(expr)), None)
+            if index is None:
+                index = len(args)
+                args.append(expr)
+            inputs.append(index)
+
+        entry = {"name": name, "kind": kind, "inputs": inputs}
+        for key, cast in _BUNDLE_PARAMS[kind].items():
+            if key in spec:
+                entry[key] = cast(spec[key])
+        bundle.append(entry)
+
+    return register_plugin_function(
+        args=args,
+        kwargs={"specs": bundle, "output_dtype": output_dtype},
+        plugin_path=LIB,
+        function_name="indicator_bundle",
+        is_elementwise=False,
+    ).alias("indicator_bundle")
+
+
+def align_timeframe(
+    higher: pl.DataFrame,
+    time: IntoExprColumn = pl.col("timestamp"),
+    on: str = "timestamp",
+    higher_period: timedelta | int | None = None,
+    columns: Sequence[str] | None = None,
+) -> pl.Expr:
+    """
+    將高時間框架（例如 5m）的指標對齊到低時間框架（例如 1m）的每一列
+
+    兩邊時間戳皆需遞增排序，以合併方式各掃描一次，不需 full outer join 與
+    fill_null(strategy="forward")。每一列只取已完成的高時間框架 K 棒，避免前視：
+    指定 higher_period 時 higher[on] 視為 K 棒開始時間，K 棒於 on + higher_period 完成；
+    未指定時 higher[on] 視為 K 棒完成時間。
+
+    higher 只接受 eager DataFrame：插件表達式的輸入只能來自低時間框架所在的 frame，
+    因此高時間框架的時間戳與欄位以常值（長度為高時間框架列數）嵌入表達式，
+    整張表會在建立表達式時實體化並隨查詢計畫複製。返回的表達式可用於低時間框架的
+    LazyFrame，但高時間框架本身是 LazyFrame 時需先 collect；高時間框架過大、
+    不適合放進記憶體時改用 join_asof。
+
+    Args:
+        higher: 高時間框架 DataFrame（不接受 LazyFrame）
+        time: 低時間框架的時間戳欄位，型別需與 higher[on] 相同
+        on: higher 的時間戳欄位名稱
+        higher_period: 高時間框架週期，整數時間戳時為整數
+        columns: 要對齊的欄位，預設為 on 以外的所有欄位
+
+    Returns:
+        結構體表達式，包含對齊後的各欄位（尚無已完成的 K 棒時為 null）與 is_gap 字段；
+        is_gap 表示尚無已完成的 K 棒，或指定 higher_period 時下一根高時間框架 K 棒缺失
+    """
+    if not isinstance(higher, pl.DataFrame):
+        msg = (
+            "align_timeframe: higher must be an eager DataFrame, got "
+            f"{type(higher).__name__}; collect it first or use join_asof"
+        )
+        raise TypeError(msg)
+    if columns is None:
+        columns = [name for name in higher.columns if name != on]
+    start = higher.get_column(on)
+    if higher_period is None:
+        available_at, expires_at = start, None
+    else:
+        available_at = start + higher_period
+        expires_at = available_at + higher_period
+    return register_plugin_function(
+        args=[
+            time,
+            pl.lit(available_at),
+            pl.lit(expires_at),
+            pl.lit(higher.select(pl.struct(columns)).to_series()),
+        ],
+        plugin_path=LIB,
+        function_name="align_timeframe",
+        is_elementwise=False,
+    ).alias("aligned")
+
+
 def clean_enex_position(
     entries: IntoExprColumn,
     exits: IntoExprColumn,
     entry_first: bool = True,
+    initial_phase: int = -1,
+    initial_position_id: int = -1,
+    by: IntoExprColumn | None = None,
 ) -> pl.Expr:
     """
     清理進場和出場信號數組，返回包含清理後信號和位置ID的結構體
@@ -84,35 +652,365 @@ def clean_enex_position(
         entries: 進場信號數組，可能包含連續的 True 值
         exits: 出場信號數組，可能包含連續的 True 值
         entry_first: 當進場和出場信號同時出現時的優先順序，預設為 True
+        initial_phase: 初始狀態，-1 為初始、1 為已進場、0 為已出場；
+            分段處理時傳入前一段 clean_enex_position_state 的 phase
+        initial_position_id: 初始位置ID，分段處理時傳入前一段的 position_id；
+            initial_phase 不為 -1 時必須 >= 0
+        by: 分組鍵（例如 symbol），資料需依分組鍵排序；每組從頭開始，position id 重新編號。
+            初始狀態只屬於單一延續的序列，因此不能與 initial_phase、initial_position_id 同時指定
 
     Returns:
         包含 entries_out, exits_out, positions_out 三個字段的結構體表達式
     """
+    if by is not None and (initial_phase != -1 or initial_position_id != -1):
+        msg = (
+            "clean_enex_position: by cannot be combined with initial_phase or "
+            "initial_position_id"
+        )
+        raise ValueError(msg)
+    args = [
+        entries,
+        exits,
+        pl.lit(entry_first),
+        pl.lit(initial_phase),
+        pl.lit(initial_position_id),
+    ]
+    if by is not None:
+        args.append(by)
+
     return register_plugin_function(
-        args=[entries, exits, pl.lit(entry_first)],
+        args=args,
         plugin_path=LIB,
         function_name="clean_enex_position",
         is_elementwise=False,
     ).alias("clean_enex_position")
 
 
+def clean_enex_position_state(
+    entries: IntoExprColumn,
+    exits: IntoExprColumn,
+    entry_first: bool = True,
+    initial_phase: int = -1,
+    initial_position_id: int = -1,
+) -> pl.Expr:
+    """
+    計算處理完整段信號後的最終狀態，作為下一段 clean_enex_position 的初始狀態
+
+    只推進狀態機而不產生逐列輸出，分段平行處理時可先依序以此算出各段起始狀態，
+    再平行計算各段的 clean_enex_position，結果與整段一次計算完全一致。
+
+    Args:
+        entries: 進場信號數組
+        exits: 出場信號數組
+        entry_first: 當進場和出場信號同時出現時的優先順序，預設為 True
+        initial_phase: 初始狀態，預設為 -1
+        initial_position_id: 初始位置ID，預設為 -1
+
+    Returns:
+        單列結構體表達式，包含 phase, position_id 兩個字段
+    """
+    return register_plugin_function(
+        args=[
+            entries,
+            exits,
+            pl.lit(entry_first),
+            pl.lit(initial_phase),
+            pl.lit(initial_position_id),
+        ],
+        plugin_path=LIB,
+        function_name="clean_enex_position_state",
+        is_elementwise=False,
+        returns_scalar=True,
+    ).alias("clean_enex_position_state")
+
+
+def extract_trades(
+    cleaned: IntoExprColumn = pl.col("clean_enex_position"),
+    entry_price: IntoExprColumn = pl.col("close"),
+    exit_price: IntoExprColumn | None = None,
+) -> pl.Expr:
+    """
+    由 clean_enex_position 的結果單次掃描產生交易列表，取代對 positions_out 的 group_by
+
+    原始進出場信號可直接傳入 clean_enex_position("entry", "exit") 作為 cleaned。
+    輸出長度為交易筆數，需搭配 select 使用，結果可直接傳給 reshape_position_id_array。
+
+    Args:
+        cleaned: clean_enex_position 產生的結構體欄位或表達式
+        entry_price: 進場價格序列，預設為 close
+        exit_price: 出場價格序列，預設與 entry_price 相同
+
+    Returns:
+        每筆交易一列的結構體表達式，包含 position_id, entry_idx, exit_idx,
+        entry_price, exit_price, bars_held, closed 字段；
+        closed 為 False 表示資料結尾仍持倉，此時 exit_idx 為最後一根 K 棒
+    """
+    if isinstance(cleaned, str):
+        cleaned = pl.col(cleaned)
+    if exit_price is None:
+        exit_price = entry_price
+    return register_plugin_function(
+        args=[
+            cleaned.struct.field("exits_out"),
+            cleaned.struct.field("positions_out"),
+            entry_price,
+            exit_price,
+        ],
+        plugin_path=LIB,
+        function_name="extract_trades",
+        is_elementwise=False,
+        changes_length=True,
+    ).alias("trades")
+
+
+def intrade_context(
+    cleaned: IntoExprColumn = pl.col("clean_enex_position"),
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    entry_price: IntoExprColumn = pl.col("close"),
+) -> pl.Expr:
+    """
+    單次掃描計算持倉期間的運行欄位，取代多個 cum_max().over(position_id)
+
+    以 positions_out 區分交易，positions_out 改變即視為新的一筆交易；
+    最高價與最低價包含進場當根，不在持倉中的列輸出 null。
+
+    Args:
+        cleaned: clean_enex_position 產生的結構體欄位或表達式
+        high: 最高價序列
+        low: 最低價序列
+        entry_price: 進場價格序列，取進場當根的值，預設為 close
+
+    Returns:
+        結構體表達式，包含 entry_idx, entry_price, highest_high, lowest_low,
+        holding_idx（進場當根為 0）字段
+    """
+    if isinstance(cleaned, str):
+        cleaned = pl.col(cleaned)
+    return register_plugin_function(
+        args=[
+            cleaned.struct.field("positions_out"),
+            high,
+            low,
+            entry_price,
+        ],
+        plugin_path=LIB,
+        function_name="intrade_context",
+        is_elementwise=False,
+    ).alias("intrade_context")
+
+
+_EXIT_PARAMS = ("stop_loss", "take_profit", "trailing_stop", "break_even")
+
+
+def _exit_param(value: IntoExprColumn | float | None) -> IntoExprColumn:
+    if value is None:
+        return pl.lit(None, dtype=pl.Float64)
+    if isinstance(value, (int, float)):
+        return pl.lit(float(value), dtype=pl.Float64)
+    return value
+
+
+def advanced_exit(
+    cleaned: IntoExprColumn = pl.col("clean_enex_position"),
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    entry_price: IntoExprColumn = pl.col("close"),
+    stop_loss: IntoExprColumn | float | None = None,
+    take_profit: IntoExprColumn | float | None = None,
+    trailing_stop: IntoExprColumn | float | None = None,
+    break_even: IntoExprColumn | float | None = None,
+    direction: str = "long",
+    params: Sequence[Mapping[str, float | None]] | None = None,
+) -> pl.Expr:
+    """
+    進階出場：單次掃描解析停損、停利、移動停損與保本停損的首次觸發
+
+    所有參數皆為相對進場價的比例（例如 0.02 表示 2%），可為純量或逐列欄位，
+    逐列欄位取進場當根的值；None 表示停用。以進場當根收盤進場，自下一根開始檢查：
+    移動停損與保本只使用前一根為止的最高/最低價，同一根同時觸及停損與停利時視為先停損，
+    並假設以觸發價成交。每筆交易只輸出第一次觸發，之後的 K 棒忽略。
+
+    Args:
+        cleaned: clean_enex_position 產生的結構體欄位或表達式
+        high: 最高價序列
+        low: 最低價序列
+        entry_price: 進場價格序列，取進場當根的值，預設為 close
+        stop_loss: 停損比例
+        take_profit: 停利比例
+        trailing_stop: 移動停損比例，相對進場後的最高價（空單為最低價）
+        break_even: 浮盈達到此比例後將停損移至進場價
+        direction: "long" 或 "short"
+        params: 參數列表模式，每個元素為包含 stop_loss, take_profit, trailing_stop,
+            break_even（可省略，不可有其他鍵）的字典；指定時不可再傳入逐列參數，不可重複，
+            所有組合在同一次掃描中平行計算
+
+    Returns:
+        結構體表達式，包含 exit_mask（觸發當根為 True）, exit_price, exit_reason
+        （"stop_loss"、"take_profit"、"trailing_stop" 或 "break_even"）字段；
+        指定 params 時為每組參數一個字段的寬結構體，字段名稱如 "sl=0.02_tp=0.05"
+    """
+    if isinstance(cleaned, str):
+        cleaned = pl.col(cleaned)
+    row_params = [stop_loss, take_profit, trailing_stop, break_even]
+    if params is not None:
+        if any(value is not None for value in row_params):
+            msg = "advanced_exit: params cannot be combined with per-row parameters"
+            raise ValueError(msg)
+        for p in params:
+            unknown = set(p) - set(_EXIT_PARAMS)
+            if unknown:
+                msg = f"advanced_exit: unexpected keys {sorted(unknown)} in params: {p}"
+                raise ValueError(msg)
+        params = [
+            {key: None if p.get(key) is None else float(p[key]) for key in _EXIT_PARAMS}
+            for p in params
+        ]
+        # 相同的參數組合會產生同名字段
+        seen = set()
+        for p in params:
+            key = tuple(p.values())
+            if key in seen:
+                msg = f"advanced_exit: duplicate entry in params: {p}"
+                raise ValueError(msg)
+            seen.add(key)
+    return register_plugin_function(
+        args=[
+            cleaned.struct.field("positions_out"),
+            high,
+            low,
+            entry_price,
+            *(_exit_param(value) for value in row_params),
+        ],
+        kwargs={"direction": direction, "params": params},
+        plugin_path=LIB,
+        function_name="advanced_exit",
+        is_elementwise=False,
+    ).alias("advanced_exit")
+
+
+def trade_excursions(
+    cleaned: IntoExprColumn = pl.col("clean_enex_position"),
+    high: IntoExprColumn = pl.col("high"),
+    low: IntoExprColumn = pl.col("low"),
+    entry_price: IntoExprColumn = pl.col("close"),
+    exit_price: IntoExprColumn | None = None,
+    direction: str = "long",
+) -> pl.Expr:
+    """
+    單次掃描計算每筆交易的最大不利偏移（MAE）與最大有利偏移（MFE）
+
+    每個連續且相同的 positions_out（>= 0）區段為一筆交易。偏移為相對進場價的比例，
+    以進場價為起點（0），只計入進場後到出場當根的最高/最低價；MAE <= 0 <= MFE。
+    輸出長度為交易筆數，需搭配 select 使用。已有交易列表時可先以
+    reshape_position_id_array 還原為位置ID數組再傳入。
+
+    Args:
+        cleaned: clean_enex_position 產生的結構體欄位或表達式
+        high: 最高價序列
+        low: 最低價序列
+        entry_price: 進場價格序列，預設為 close
+        exit_price: 出場價格序列，預設與 entry_price 相同
+        direction: "long" 或 "short"
+
+    Returns:
+        每筆交易一列的結構體表達式，包含 position_id, entry_idx, exit_idx, entry_price,
+        exit_price, mae, mfe, mae_offset, mfe_offset（相對進場的 K 棒數）字段
+    """
+    if isinstance(cleaned, str):
+        cleaned = pl.col(cleaned)
+    if exit_price is None:
+        exit_price = entry_price
+    return register_plugin_function(
+        args=[
+            cleaned.struct.field("positions_out"),
+            high,
+            low,
+            entry_price,
+            exit_price,
+        ],
+        kwargs={"direction": direction},
+        plugin_path=LIB,
+        function_name="trade_excursions",
+        is_elementwise=False,
+        changes_length=True,
+    ).alias("trade_excursions")
+
+
+def performance_summary(
+    returns: IntoExprColumn | None = None,
+    price: IntoExprColumn | None = None,
+    position: IntoExprColumn | None = None,
+    periods_per_year: float = 252.0,
+    risk_free: float = 0.0,
+) -> pl.Expr:
+    """
+    單次掃描計算績效摘要，以常數記憶體完成，可直接用於 group_by(strategy_id).agg()
+
+    傳入 returns 時視為每筆交易的報酬；否則以 price 與 position（部位曝險，
+    1 為多、-1 為空、0 為空手）計算每根報酬，即前一根的曝險乘上當根價格變動。
+    權益曲線以複利累積，缺值的期數略過。
+
+    count, wins, losses, win_rate, profit_factor 為交易統計：傳入 returns 時每個值為一筆交易；
+    傳入 price 與 position 時在曝險改變處切分交易，每筆交易的報酬為持有期間的複利累積，
+    只計入已平倉的交易，空手的期數不計入。
+
+    Args:
+        returns: 報酬序列
+        price: 價格序列，未傳入 returns 時使用
+        position: 部位曝險序列，未傳入 returns 時使用
+        periods_per_year: 年化 Sharpe/Sortino 使用的每年期數，預設為 252
+        risk_free: 每期無風險報酬率，預設為 0.0
+
+    Returns:
+        單列結構體表達式，包含 total_return, max_drawdown（<= 0）,
+        max_drawdown_duration（期數）, sharpe, sortino, profit_factor,
+        count, wins, losses, win_rate 字段；分母為 0 的比率為 null
+    """
+    if returns is not None:
+        args = [returns]
+    elif price is not None and position is not None:
+        args = [price, position]
+    else:
+        msg = "performance_summary: pass either returns or both price and position"
+        raise ValueError(msg)
+    return register_plugin_function(
+        args=args,
+        kwargs={
+            "periods_per_year": float(periods_per_year),
+            "risk_free": float(risk_free),
+        },
+        plugin_path=LIB,
+        function_name="performance_summary",
+        is_elementwise=False,
+        returns_scalar=True,
+    ).alias("performance_summary")
+
+
 def reshape_position_id_array(
     ohlcv_lens: int,
     position_id_arr: IntoExprColumn,
     entry_idx_arr: IntoExprColumn,
     exit_idx_arr: IntoExprColumn,
+    overlap: str = "last",
 ) -> pl.Expr:
     """
     從 trades 建立 position_id array
 
+    成本與 K 棒數加交易數成線性，與持倉長度無關；索引可為任意整數型別。
+    null、越界或進場晚於出場的交易會被略過，可用 reshape_position_id_diagnostics 檢查。
+
     Args:
         ohlcv_lens: 需與 ohlcv 長度相符
         position_id_arr: 長度與 trades 一致的位置ID數組
         entry_idx_arr: 長度與 trades 一致的進場索引數組
         exit_idx_arr: 長度與 trades 一致的出場索引數組
+        overlap: 交易重疊時的處理方式，"last"（後出現的覆蓋，預設）、"first"
+            （先出現的優先）、"error"（報錯）或 "count"（改為輸出每根 K 棒被幾筆交易涵蓋）
 
     Returns:
-        長度與 ohlcv 一致的位置ID數組
+        長度與 ohlcv 一致的位置ID數組，名稱為 "_position_id"；
+        overlap="count" 時為涵蓋筆數，名稱為 "overlap_count"
     """
     return register_plugin_function(
         args=[
@@ -121,7 +1019,41 @@ def reshape_position_id_array(
             entry_idx_arr,
             exit_idx_arr,
         ],
+        kwargs={"overlap": overlap},
         plugin_path=LIB,
         function_name="reshape_position_id_array",
         is_elementwise=False,
     )
+
+
+def reshape_position_id_diagnostics(
+    ohlcv_lens: int,
+    position_id_arr: IntoExprColumn,
+    entry_idx_arr: IntoExprColumn,
+    exit_idx_arr: IntoExprColumn,
+) -> pl.Expr:
+    """
+    統計 reshape_position_id_array 會拒絕或重疊的交易數
+
+    Args:
+        ohlcv_lens: 需與 ohlcv 長度相符
+        position_id_arr: 長度與 trades 一致的位置ID數組
+        entry_idx_arr: 長度與 trades 一致的進場索引數組
+        exit_idx_arr: 長度與 trades 一致的出場索引數組
+
+    Returns:
+        單列結構體表達式，包含 trades（交易總數）, applied（有效交易數）, null,
+        out_of_range, inverted（被拒絕的原因）與 overlapping（與其他交易重疊的有效交易數）
+    """
+    return register_plugin_function(
+        args=[
+            pl.lit(ohlcv_lens),
+            position_id_arr,
+            entry_idx_arr,
+            exit_idx_arr,
+        ],
+        plugin_path=LIB,
+        function_name="reshape_position_id_diagnostics",
+        is_elementwise=False,
+        returns_scalar=True,
+    ).alias("reshape_position_id_diagnostics")
@@ -1 +1,114 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import polars as pl
+
 __version__: str
+
+class SuperTrendState:
+    def __init__(
+        self, upper_multiplier: float = 2.0, lower_multiplier: float = 2.0
+    ) -> None: ...
+    @staticmethod
+    def from_history(
+        high: pl.Series,
+        low: pl.Series,
+        close: pl.Series,
+        atr: pl.Series,
+        upper_multiplier: float = 2.0,
+        lower_multiplier: float = 2.0,
+    ) -> SuperTrendState: ...
+    @staticmethod
+    def from_bands(
+        direction: int,
+        upper_band: float,
+        lower_band: float,
+        close: Optional[float],
+        upper_multiplier: float = 2.0,
+        lower_multiplier: float = 2.0,
+    ) -> SuperTrendState: ...
+    def update(
+        self,
+        high: Optional[float],
+        low: Optional[float],
+        close: Optional[float],
+        atr: Optional[float],
+    ) -> Optional[Tuple[int, Optional[float], Optional[float], float]]: ...
+    def update_batch(
+        self, high: pl.Series, low: pl.Series, close: pl.Series, atr: pl.Series
+    ) -> pl.Series: ...
+    def to_dict(self) -> dict: ...
+    @staticmethod
+    def from_dict(state: dict) -> SuperTrendState: ...
+    def copy(self) -> SuperTrendState: ...
+    @property
+    def direction(self) -> int: ...
+    @property
+    def upper_band(self) -> float: ...
+    @property
+    def lower_band(self) -> float: ...
+
+class AtrState:
+    def __init__(self, period: int = 14, smoothing: str = "rma") -> None: ...
+    def update(
+        self, high: Optional[float], low: Optional[float], close: Optional[float]
+    ) -> Optional[float]: ...
+    def update_batch(
+        self, high: pl.Series, low: pl.Series, close: pl.Series
+    ) -> pl.Series: ...
+    def to_dict(self) -> dict: ...
+    @staticmethod
+    def from_dict(state: dict) -> AtrState: ...
+    def copy(self) -> AtrState: ...
+    @property
+    def period(self) -> int: ...
+    @property
+    def smoothing(self) -> str: ...
+    @property
+    def value(self) -> Optional[float]: ...
+
+class EnexPositionState:
+    def __init__(
+        self, entry_first: bool = True, phase: int = -1, position_id: int = -1
+    ) -> None: ...
+    def update_batch(self, entries: pl.Series, exits: pl.Series) -> pl.Series: ...
+    def to_dict(self) -> dict: ...
+    @staticmethod
+    def from_dict(state: dict) -> EnexPositionState: ...
+    def copy(self) -> EnexPositionState: ...
+    @property
+    def phase(self) -> int: ...
+    @property
+    def position_id(self) -> int: ...
+
+def fingerprint_blocks(
+    inputs: list[pl.Series], block_size: int = 65536
+) -> list[str]: ...
+def profiling_enable() -> None: ...
+def profiling_disable() -> None: ...
+def profiling_is_enabled() -> bool: ...
+def profiling_reset() -> None: ...
+def profiling_stats() -> list[tuple[str, int, int, int, int, int]]: ...
+def supertrend_np(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    atr: np.ndarray,
+    direction: np.ndarray,
+    long: np.ndarray,
+    short: np.ndarray,
+    trend: np.ndarray,
+    upper_multiplier: float = 2.0,
+    lower_multiplier: float = 2.0,
+    state: Optional[SuperTrendState] = None,
+) -> None: ...
+def clean_enex_position_np(
+    entries: np.ndarray,
+    exits: np.ndarray,
+    entries_out: np.ndarray,
+    exits_out: np.ndarray,
+    positions_out: np.ndarray,
+    entry_first: bool = True,
+    initial_phase: int = -1,
+    initial_position_id: int = -1,
+) -> Tuple[int, int]: ...
@@ -0,0 +1,198 @@
+"""
+參數網格批次回測
+
+共用的上游欄位（各 ATR 週期）只計算一次，之後各參數組合在執行緒池中平行計算
+supertrend → clean_enex_position → advanced_exit → 交易列表 → 績效摘要。
+Rust 插件在計算時會釋放 GIL，因此執行緒池即可平行利用多核心。
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence, Tuple, Union
+
+import polars as pl
+
+from polars_indicator import (
+    advanced_exit,
+    atr,
+    clean_enex_position,
+    extract_trades,
+    performance_summary,
+    supertrend,
+)
+
+__all__ = ["expand_grid", "run_grid"]
+
+PARAMS: Dict[str, Any] = {
+    "atr_period": 14,
+    "upper_multiplier": 2.0,
+    "lower_multiplier": 2.0,
+    "direction": "long",
+    "stop_loss": None,
+    "take_profit": None,
+    "trailing_stop": None,
+    "break_even": None,
+}
+
+Grid = Union[Mapping[str, Sequence[Any]], Sequence[Mapping[str, Any]]]
+
+
+def expand_grid(grid: Grid) -> List[Dict[str, Any]]:
+    """
+    展開參數網格
+
+    Args:
+        grid: 參數名稱對應候選值列表的字典（取笛卡兒積），或已展開的參數字典列表；
+            未指定的參數使用 PARAMS 中的預設值
+
+    Returns:
+        每個參數組合一個完整的參數字典
+    """
+    if isinstance(grid, Mapping):
+        keys = list(grid)
+        variants = [
+            dict(zip(keys, values))
+            for values in itertools.product(*(grid[key] for key in keys))
+        ]
+    else:
+        variants = [dict(variant) for variant in grid]
+
+    for variant in variants:
+        unknown = set(variant) - set(PARAMS)
+        if unknown:
+            msg = f"expand_grid: unknown parameters {sorted(unknown)}"
+            raise ValueError(msg)
+    return [{**PARAMS, **variant} for variant in variants]
+
+
+def _atr_column(period: int) -> str:
+    return f"atr_{period}"
+
+
+def _prepare(ohlcv: pl.DataFrame, variants: List[Dict[str, Any]]) -> pl.DataFrame:
+    """計算各參數組合共用的 ATR 欄位，每個週期只計算一次"""
+    periods = sorted({int(variant["atr_period"]) for variant in variants})
+    return ohlcv.select(
+        "high",
+        "low",
+        "close",
+        *(atr(period=period).alias(_atr_column(period)) for period in periods),
+    )
+
+
+def _evaluate(
+    frame: pl.DataFrame, variant: Dict[str, Any], periods_per_year: float
+) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    """計算單一參數組合，返回 (績效摘要, 交易列表)"""
+    direction = pl.col("supertrend").struct.field("direction")
+    turned_long = (direction == 1) & (direction.shift(1) == -1)
+    turned_short = (direction == -1) & (direction.shift(1) == 1)
+    entries, exits = turned_long, turned_short
+    sign = 1.0
+    if variant["direction"] == "short":
+        entries, exits = turned_short, turned_long
+        sign = -1.0
+
+    exit_params = {
+        key: variant[key]
+        for key in ("stop_loss", "take_profit", "trailing_stop", "break_even")
+    }
+    lf = frame.lazy().with_columns(
+        supertrend(
+            atr=pl.col(_atr_column(int(variant["atr_period"]))),
+            upper_multiplier=float(variant["upper_multiplier"]),
+            lower_multiplier=float(variant["lower_multiplier"]),
+        ),
+    )
+    exit_price = pl.col("close")
+    if any(value is not None for value in exit_params.values()):
+        # 進階出場與信號出場取先發生者，再重新清理一次信號
+        lf = lf.with_columns(
+            clean_enex_position(entries, exits),
+        ).with_columns(
+            advanced_exit(direction=variant["direction"], **exit_params),
+        )
+        mask = pl.col("advanced_exit").struct.field("exit_mask")
+        exits = exits | mask
+        exit_price = (
+            pl.when(mask)
+            .then(pl.col("advanced_exit").struct.field("exit_price"))
+            .otherwise(pl.col("close"))
+        )
+
+    trades = (
+        lf.with_columns(clean_enex_position(entries, exits))
+        .select(extract_trades(entry_price=pl.col("close"), exit_price=exit_price))
+        .unnest("trades")
+        .with_columns(
+            returns=sign * (pl.col("exit_price") / pl.col("entry_price") - 1.0),
+        )
+        .collect()
+    )
+    summary = trades.select(
+        performance_summary("returns", periods_per_year=periods_per_year)
+    ).unnest("performance_summary")
+    return summary, trades
+
+
+def run_grid(
+    ohlcv: pl.DataFrame,
+    grid: Grid,
+    max_workers: int | None = None,
+    trades_dir: str | Path | None = None,
+    periods_per_year: float = 252.0,
+) -> pl.DataFrame:
+    """
+    以執行緒池平行回測整個參數網格
+
+    進場為 SuperTrend 方向翻轉（多單由 -1 轉 1，空單相反），出場為反向翻轉或
+    advanced_exit 的首次觸發；績效以每筆交易的報酬計算。同時最多只有 2 × max_workers
+    個組合在計算中，完成後只保留摘要，記憶體用量與網格大小無關。
+
+    Args:
+        ohlcv: 包含 high, low, close 欄位的 DataFrame
+        grid: 參數網格，參數包含 atr_period, upper_multiplier, lower_multiplier,
+            direction, stop_loss, take_profit, trailing_stop, break_even，詳見 expand_grid
+        max_workers: 執行緒數，預設為 CPU 核心數
+        trades_dir: 指定時將每個組合的交易列表寫入 "{trades_dir}/variant_{i}.parquet"
+        periods_per_year: 傳給 performance_summary 的年化期數
+
+    Returns:
+        每個參數組合一列的摘要 DataFrame，包含 variant 編號、參數與績效指標欄位；
+        指定 trades_dir 時額外包含 trades_path 欄位
+    """
+    variants = expand_grid(grid)
+    frame = _prepare(ohlcv, variants)
+    if trades_dir is not None:
+        trades_dir = Path(trades_dir)
+        trades_dir.mkdir(parents=True, exist_ok=True)
+
+    def task(i: int) -> pl.DataFrame:
+        summary, trades = _evaluate(frame, variants[i], periods_per_year)
+        columns: Dict[str, Any] = {"variant": i, **variants[i]}
+        if trades_dir is not None:
+            path = trades_dir / f"variant_{i}.parquet"
+            trades.write_parquet(path)
+            columns["trades_path"] = str(path)
+        return pl.DataFrame([columns]).hstack(summary)
+
+    workers = max_workers or os.cpu_count() or 1
+    results: List[pl.DataFrame] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # 限制同時提交的組合數，避免一次建立所有組合的中間結果
+        limit = 2 * workers
+        pending = set()
+        for i in range(len(variants)):
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(future.result() for future in done)
+            pending.add(pool.submit(task, i))
+        results.extend(future.result() for future in pending)
+
+    if not results:
+        return pl.DataFrame()
+    return pl.concat(results, how="diagonal_relaxed").sort("variant")
@@ -0,0 +1,341 @@
+"""
+指標結果的磁碟快取
+
+以輸入欄位的分塊內容指紋、函數名稱與參數作為鍵，結果存成未壓縮的 Arrow IPC 檔，
+命中時以 memory map 讀回、不複製資料；超過 max_bytes 時依最近使用時間淘汰：
+
+    from polars_indicator.cache import IndicatorCache
+
+    cache = IndicatorCache("~/.cache/polars_indicator", max_bytes=20 * 2**30)
+    df = pl.read_parquet("bars.parquet")
+    df = df.with_columns(
+        cache.supertrend(df, upper_multiplier=3.0, lower_multiplier=3.0),
+        cache.select(df, atr(period=14)).to_series(),
+    )
+
+只在尾端附加資料時，atr、supertrend、supertrend_from_ohlc 與 clean_enex_position
+會讀回已快取的前綴，從保存的狀態接續計算新增的部分；select 的任意表達式只做完全命中。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any
+
+import polars as pl
+
+from polars_indicator import _internal
+from polars_indicator._internal import AtrState, EnexPositionState, SuperTrendState
+
+__all__ = ["IndicatorCache"]
+
+
+def _key(function: str, params: Any) -> str:
+    payload = json.dumps(
+        {
+            "function": function,
+            "params": params,
+            "version": _internal.__version__,
+            "polars": pl.__version__,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _input_columns(df: pl.DataFrame, exprs: tuple[pl.Expr, ...]) -> list[str]:
+    """
+    表達式實際讀取的 df 欄位
+
+    逐層展開到葉節點，每個葉節點（欄位、萬用字元、nth、正規表示式、選擇器等）
+    依 df 的 schema 展開成實際的欄位；無法解析的表達式會報錯，而不是只以列數作為鍵。
+    """
+    lf = df.lazy()
+    columns: set[str] = set()
+    stack = list(exprs)
+    while stack:
+        expr = stack.pop()
+        children = expr.meta.pop()
+        if children:
+            stack.extend(children)
+            continue
+        # list.eval 內的 element() 指的是串列元素，不是 df 的欄位
+        if expr.meta.eq(pl.element()):
+            continue
+        try:
+            names = lf.select(expr).collect_schema().names()
+        except pl.exceptions.PolarsError as err:
+            msg = f"IndicatorCache.select: cannot resolve input columns of {expr}"
+            raise ValueError(msg) from err
+        # 字面值、len() 等不讀取任何欄位，輸出名稱不在 df 中
+        columns.update(name for name in names if name in df.columns)
+    return [name for name in df.columns if name in columns]
+
+
+class IndicatorCache:
+    """
+    指標結果的磁碟快取
+
+    Args:
+        path: 快取目錄，不存在時自動建立
+        max_bytes: 快取檔案的總大小上限，超過時淘汰最久未使用的項目
+        block_size: 內容指紋的分塊列數，附加資料時以塊為單位比對前綴
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 10 * 2**30,
+        block_size: int = 65536,
+    ) -> None:
+        self.path = Path(path).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+
+    def supertrend(
+        self,
+        df: pl.DataFrame,
+        high: str = "high",
+        low: str = "low",
+        close: str = "close",
+        atr: str = "atr",
+        upper_multiplier: float = 2.0,
+        lower_multiplier: float = 2.0,
+    ) -> pl.Series:
+        """與 supertrend 表達式相同的結構體欄位，附加資料時從快取的狀態接續計算"""
+        columns = [high, low, close, atr]
+
+        def compute(frame: pl.DataFrame, state: dict | None):
+            st = (
+                SuperTrendState.from_dict(state)
+                if state is not None
+                else SuperTrendState(upper_multiplier, lower_multiplier)
+            )
+            result = st.update_batch(*(frame[c] for c in columns))
+            return result.alias("supertrend"), st.to_dict()
+
+        params = {
+            "upper_multiplier": upper_multiplier,
+            "lower_multiplier": lower_multiplier,
+        }
+        return self._cached(df, columns, "supertrend", params, compute).to_series()
+
+    def atr(
+        self,
+        df: pl.DataFrame,
+        high: str = "high",
+        low: str = "low",
+        close: str = "close",
+        period: int = 14,
+        smoothing: str = "rma",
+    ) -> pl.Series:
+        """與 atr 表達式相同的 Float64 欄位，附加資料時從快取的狀態接續計算"""
+        columns = [high, low, close]
+
+        def compute(frame: pl.DataFrame, state: dict | None):
+            atr_state = (
+                AtrState.from_dict(state)
+                if state is not None
+                else AtrState(period, smoothing)
+            )
+            result = atr_state.update_batch(*(frame[c] for c in columns))
+            return result.alias("atr"), atr_state.to_dict()
+
+        params = {"period": period, "smoothing": smoothing}
+        return self._cached(df, columns, "atr", params, compute).to_series()
+
+    def supertrend_from_ohlc(
+        self,
+        df: pl.DataFrame,
+        high: str = "high",
+        low: str = "low",
+        close: str = "close",
+        atr_period: int = 14,
+        smoothing: str = "rma",
+        upper_multiplier: float = 2.0,
+        lower_multiplier: float = 2.0,
+        include_atr: bool = False,
+    ) -> pl.Series:
+        """
+        與 supertrend_from_ohlc 表達式相同的結構體欄位，不需預先計算 atr 欄位
+
+        快取同時保存 ATR 與 SuperTrend 的狀態，附加資料時兩者都從快取的前綴接續計算。
+        """
+        columns = [high, low, close]
+
+        def compute(frame: pl.DataFrame, state: dict | None):
+            if state is None:
+                atr_state = AtrState(atr_period, smoothing)
+                st = SuperTrendState(upper_multiplier, lower_multiplier)
+            else:
+                atr_state = AtrState.from_dict(state["atr"])
+                st = SuperTrendState.from_dict(state["supertrend"])
+            inputs = [frame[c] for c in columns]
+            atr = atr_state.update_batch(*inputs)
+            result = st.update_batch(*inputs, atr)
+            if include_atr:
+                result = result.struct.unnest().with_columns(atr).to_struct()
+            state = {"atr": atr_state.to_dict(), "supertrend": st.to_dict()}
+            return result.alias("supertrend"), state
+
+        params = {
+            "atr_period": atr_period,
+            "smoothing": smoothing,
+            "upper_multiplier": upper_multiplier,
+            "lower_multiplier": lower_multiplier,
+            "include_atr": include_atr,
+        }
+        return self._cached(
+            df, columns, "supertrend_from_ohlc", params, compute
+        ).to_series()
+
+    def clean_enex_position(
+        self,
+        df: pl.DataFrame,
+        entries: str = "entry",
+        exits: str = "exit",
+        entry_first: bool = True,
+    ) -> pl.Series:
+        """與 clean_enex_position 表達式相同的結構體欄位，附加資料時從快取的狀態接續計算"""
+        columns = [entries, exits]
+
+        def compute(frame: pl.DataFrame, state: dict | None):
+            enex = (
+                EnexPositionState.from_dict(state)
+                if state is not None
+                else EnexPositionState(entry_first)
+            )
+            result = enex.update_batch(frame[entries], frame[exits])
+            return result.alias("clean_enex_position"), enex.to_dict()
+
+        params = {"entry_first": entry_first}
+        return self._cached(
+            df, columns, "clean_enex_position", params, compute
+        ).to_series()
+
+    def select(self, df: pl.DataFrame, *exprs: pl.Expr) -> pl.DataFrame:
+        """
+        任意表達式的快取版 df.select(*exprs)
+
+        以表達式的序列化結果作為參數，輸入為表達式實際讀取的欄位（pl.all()、nth、
+        選擇器等依 df 的 schema 展開）；只做完全命中。
+        """
+        columns = _input_columns(df, exprs)
+        params = {
+            "exprs": [e.meta.serialize(format="json") for e in exprs],
+            # 萬用字元等展開後的輸出名稱取自欄位名稱，指紋只涵蓋內容與型別
+            "columns": columns,
+            "height": df.height,
+        }
+
+        def compute(frame: pl.DataFrame, state: dict | None):
+            return df.select(*exprs), None
+
+        return self._cached(df, columns, "select", params, compute)
+
+    def size(self) -> int:
+        """快取檔案的總位元組數"""
+        return sum(p.stat().st_size for p in self.path.glob("*/*.arrow"))
+
+    def clear(self) -> None:
+        """刪除所有快取項目"""
+        for p in self.path.glob("*/*"):
+            p.unlink(missing_ok=True)
+
+    def _cached(self, df, columns, function, params, compute) -> pl.DataFrame:
+        directory = self.path / _key(function, params)
+        inputs = [df[c] for c in columns]
+        digests = _internal.fingerprint_blocks(inputs, self.block_size)
+        name = hashlib.sha256("".join(digests).encode()).hexdigest()[:32]
+        entry = directory / f"{name}.arrow"
+
+        if entry.exists():
+            os.utime(entry)
+            return pl.read_ipc(entry, memory_map=True, rechunk=False)
+
+        prefix = self._find_prefix(directory, df, columns, digests)
+        if prefix is None:
+            result, state = compute(df, None)
+            result = result.to_frame() if isinstance(result, pl.Series) else result
+        else:
+            cached, meta = prefix
+            rows = meta["rows"]
+            suffix, state = compute(df.slice(rows), meta["state"])
+            result = pl.concat([cached, suffix.to_frame()], rechunk=False)
+
+        meta = {"rows": df.height, "digests": digests, "state": state}
+        self._store(directory, name, result, meta)
+        return result
+
+    def _find_prefix(self, directory, df, columns, digests):
+        """找出內容為目前輸入前綴的最長快取項目，沒有可接續的狀態時不使用"""
+        best = None
+        for meta_path in directory.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                continue
+            rows = meta["rows"]
+            if meta.get("state") is None or meta.get("block_size") != self.block_size:
+                continue
+            if not 0 < rows < df.height or (
+                best is not None and rows <= best[1]["rows"]
+            ):
+                continue
+            full, partial = divmod(rows, self.block_size)
+            if meta["digests"][:full] != digests[:full]:
+                continue
+            if partial:
+                tail = [df[c].slice(full * self.block_size, partial) for c in columns]
+                if (
+                    _internal.fingerprint_blocks(tail, self.block_size)
+                    != meta["digests"][full:]
+                ):
+                    continue
+            best = (meta_path.with_suffix(".arrow"), meta)
+
+        if best is None:
+            return None
+        entry, meta = best
+        try:
+            cached = pl.read_ipc(entry, memory_map=True, rechunk=False)
+        except OSError:
+            return None
+        os.utime(entry)
+        return cached, meta
+
+    def _store(
+        self, directory: Path, name: str, result: pl.DataFrame, meta: dict
+    ) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        # 先寫入暫存檔再改名，避免其他行程讀到寫到一半的檔案
+        token = uuid.uuid4().hex
+        tmp_arrow = directory / f"{name}.{token}.arrow.tmp"
+        tmp_meta = directory / f"{name}.{token}.json.tmp"
+        result.write_ipc(tmp_arrow, compression="uncompressed")
+        tmp_meta.write_text(json.dumps({**meta, "block_size": self.block_size}))
+        os.replace(tmp_meta, directory / f"{name}.json")
+        os.replace(tmp_arrow, directory / f"{name}.arrow")
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for p in self.path.glob("*/*.arrow"):
+            try:
+                stat = p.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            p.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
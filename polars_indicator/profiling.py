@@ -0,0 +1,80 @@
+"""
+插件函數的效能統計
+
+預設關閉；開啟後每個插件函數記錄呼叫次數、處理列數、整體耗時 ns、其中輸出建構
+（builder 轉為 Series 與結構體組裝）的耗時 build_ns，以及期間配置的位元組數，
+可用來區分時間花在插件核心、輸出建構，還是 Polars 的規劃、轉型與結構體處理：
+
+    from polars_indicator import profiling
+
+    profiling.enable()
+    df.select(supertrend_from_ohlc())
+    print(profiling.stats())
+    profiling.disable()
+
+多個表達式同時執行時 bytes 與 build_ns 會互相計入；平行建構的輸出以各執行緒的耗時相加，
+build_ns 可能超過 ns，僅供參考。
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Iterator
+
+import polars as pl
+
+from polars_indicator import _internal
+
+__all__ = ["enable", "disable", "is_enabled", "reset", "stats", "profile"]
+
+
+def enable() -> None:
+    """開啟統計，已累計的數值保留"""
+    _internal.profiling_enable()
+
+
+def disable() -> None:
+    """關閉統計，已累計的數值保留"""
+    _internal.profiling_disable()
+
+
+def is_enabled() -> bool:
+    return _internal.profiling_is_enabled()
+
+
+def reset() -> None:
+    """清除已累計的數值"""
+    _internal.profiling_reset()
+
+
+def stats() -> pl.DataFrame:
+    """
+    返回各插件函數的累計統計
+
+    Returns:
+        DataFrame，欄位為 function, calls, rows, ns, build_ns, bytes，依函數名稱排序
+    """
+    return pl.DataFrame(
+        _internal.profiling_stats(),
+        schema={
+            "function": pl.String,
+            "calls": pl.UInt64,
+            "rows": pl.UInt64,
+            "ns": pl.UInt64,
+            "build_ns": pl.UInt64,
+            "bytes": pl.UInt64,
+        },
+        orient="row",
+    )
+
+
+@contextmanager
+def profile(clear: bool = True) -> Iterator[None]:
+    """在區塊內開啟統計，clear 為 True 時先清除先前的數值"""
+    if clear:
+        reset()
+    enable()
+    try:
+        yield
+    finally:
+        disable()
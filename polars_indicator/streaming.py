@@ -0,0 +1,275 @@
+"""
+有界記憶體的分批處理
+
+Polars 的插件介面無法在串流引擎的 morsel 之間保存狀態，supertrend、clean_enex_position
+這類遞迴指標在 collect(engine="streaming") 時會讓整條管線退回記憶體內執行。
+這裡改以顯式狀態依序處理批次：每批計算後把狀態帶到下一批，結果與整段計算完全一致，
+記憶體用量只與批次大小有關：
+
+    import polars as pl
+    from polars_indicator import streaming
+
+    direction = pl.col("supertrend").struct.field("direction")
+    streaming.sink_parquet(
+        pl.scan_parquet("bars/*.parquet"),
+        "positions/",
+        [
+            streaming.SuperTrendFromOhlc(atr_period=14),
+            streaming.WithColumns(
+                entry=(direction == 1) & (direction.shift(1) == -1),
+                exit=(direction == -1) & (direction.shift(1) == 1),
+                lookback=1,
+            ),
+            streaming.CleanEnexPosition("entry", "exit"),
+        ],
+        batch_size=1_000_000,
+    )
+"""
+
+from __future__ import annotations
+
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator, Protocol
+
+import polars as pl
+
+from polars_indicator._internal import AtrState, EnexPositionState, SuperTrendState
+
+__all__ = [
+    "Step",
+    "SuperTrend",
+    "SuperTrendFromOhlc",
+    "CleanEnexPosition",
+    "WithColumns",
+    "iter_batches",
+    "process",
+    "sink_parquet",
+]
+
+
+class Step(Protocol):
+    """分批處理的一個步驟，依序接收每一批並返回加上結果欄位的批次"""
+
+    def __call__(self, batch: pl.DataFrame) -> pl.DataFrame: ...
+
+
+class SuperTrend:
+    """
+    以 SuperTrendState 跨批次延續狀態的 supertrend，輸出與 supertrend 表達式相同的結構體欄位
+
+    Args:
+        high, low, close, atr: 欄位名稱
+        upper_multiplier: 上軌倍數，預設為 2.0
+        lower_multiplier: 下軌倍數，預設為 2.0
+        name: 輸出欄位名稱
+        state: 接續計算的初始狀態，預設從頭開始
+    """
+
+    def __init__(
+        self,
+        high: str = "high",
+        low: str = "low",
+        close: str = "close",
+        atr: str = "atr",
+        upper_multiplier: float = 2.0,
+        lower_multiplier: float = 2.0,
+        name: str = "supertrend",
+        state: SuperTrendState | None = None,
+    ) -> None:
+        self.columns = (high, low, close, atr)
+        self.name = name
+        self.state = state or SuperTrendState(upper_multiplier, lower_multiplier)
+
+    def __call__(self, batch: pl.DataFrame) -> pl.DataFrame:
+        high, low, close, atr = (batch[c] for c in self.columns)
+        result = self.state.update_batch(high, low, close, atr)
+        return batch.with_columns(result.alias(self.name))
+
+
+class SuperTrendFromOhlc:
+    """
+    以 AtrState 與 SuperTrendState 跨批次延續狀態的 supertrend_from_ohlc，不需預先計算 atr 欄位
+
+    Args:
+        high, low, close: 欄位名稱
+        atr_period: ATR 週期，預設為 14
+        smoothing: ATR 平滑方式，"rma"、"sma" 或 "ema"
+        upper_multiplier: 上軌倍數，預設為 2.0
+        lower_multiplier: 下軌倍數，預設為 2.0
+        include_atr: 是否在結構體中額外輸出 atr 字段
+        name: 輸出欄位名稱
+        atr_state, state: 接續計算的初始狀態，預設從頭開始
+    """
+
+    def __init__(
+        self,
+        high: str = "high",
+        low: str = "low",
+        close: str = "close",
+        atr_period: int = 14,
+        smoothing: str = "rma",
+        upper_multiplier: float = 2.0,
+        lower_multiplier: float = 2.0,
+        include_atr: bool = False,
+        name: str = "supertrend",
+        atr_state: AtrState | None = None,
+        state: SuperTrendState | None = None,
+    ) -> None:
+        self.columns = (high, low, close)
+        self.include_atr = include_atr
+        self.name = name
+        self.atr_state = atr_state or AtrState(atr_period, smoothing)
+        self.state = state or SuperTrendState(upper_multiplier, lower_multiplier)
+
+    def __call__(self, batch: pl.DataFrame) -> pl.DataFrame:
+        high, low, close = (batch[c] for c in self.columns)
+        atr = self.atr_state.update_batch(high, low, close)
+        result = self.state.update_batch(high, low, close, atr)
+        if self.include_atr:
+            result = result.struct.unnest().with_columns(atr).to_struct()
+        return batch.with_columns(result.alias(self.name))
+
+
+class CleanEnexPosition:
+    """
+    以 EnexPositionState 跨批次延續狀態的 clean_enex_position，position id 跨批次連續編號
+
+    Args:
+        entries, exits: 信號欄位名稱
+        entry_first: 同時有進出場信號時是否以進場優先
+        name: 輸出欄位名稱
+        state: 接續計算的初始狀態，預設從頭開始
+    """
+
+    def __init__(
+        self,
+        entries: str = "entry",
+        exits: str = "exit",
+        entry_first: bool = True,
+        name: str = "clean_enex_position",
+        state: EnexPositionState | None = None,
+    ) -> None:
+        self.entries = entries
+        self.exits = exits
+        self.name = name
+        self.state = state or EnexPositionState(entry_first)
+
+    def __call__(self, batch: pl.DataFrame) -> pl.DataFrame:
+        result = self.state.update_batch(batch[self.entries], batch[self.exits])
+        return batch.with_columns(result.alias(self.name))
+
+
+class WithColumns:
+    """
+    逐批套用一般的 Polars 表達式
+
+    lookback 為表達式需要往前看的列數（例如 shift(1) 為 1），每批計算時會帶上前一批的
+    最後 lookback 列，使跨批次邊界的結果與整段計算一致；累積型表達式（cum_sum 等）不適用。
+    """
+
+    def __init__(
+        self, *exprs: pl.Expr, lookback: int = 0, **named_exprs: pl.Expr
+    ) -> None:
+        self.exprs = exprs
+        self.named_exprs = named_exprs
+        self.lookback = lookback
+        self.tail: pl.DataFrame | None = None
+
+    def __call__(self, batch: pl.DataFrame) -> pl.DataFrame:
+        if self.lookback <= 0:
+            return batch.with_columns(*self.exprs, **self.named_exprs)
+
+        frame = batch if self.tail is None else pl.concat([self.tail, batch])
+        offset = frame.height - batch.height
+        self.tail = frame.tail(self.lookback)
+        result = frame.with_columns(*self.exprs, **self.named_exprs)
+        return result.slice(offset)
+
+
+def iter_batches(
+    source: pl.LazyFrame | pl.DataFrame, batch_size: int = 1_000_000
+) -> Iterator[pl.DataFrame]:
+    """
+    依序產生最多 batch_size 列的批次
+
+    LazyFrame 的查詢計畫只執行一次：支援 collect_batches 的 Polars 版本直接以串流引擎
+    逐批取出；較舊的版本先以 sink_parquet 串流寫入暫存檔（每 batch_size 列一個 row group），
+    再從暫存檔逐段讀回。上游的 filter、join、with_columns 不會因批次數而重複執行。
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive")
+    if isinstance(source, pl.DataFrame):
+        yield from source.iter_slices(batch_size)
+        return
+
+    if hasattr(source, "collect_batches"):
+        for batch in source.collect_batches(chunk_size=batch_size, maintain_order=True):
+            yield from batch.iter_slices(batch_size)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "source.parquet"
+        source.sink_parquet(path, row_group_size=batch_size, compression="uncompressed")
+        # 單純的 scan 才有 slice 下推，每批只讀取對應的 row group
+        scan = pl.scan_parquet(path)
+        offset = 0
+        while True:
+            batch = scan.slice(offset, batch_size).collect()
+            if batch.height == 0:
+                return
+            yield batch
+            offset += batch.height
+            if batch.height < batch_size:
+                return
+
+
+def process(
+    source: pl.LazyFrame | pl.DataFrame | Iterable[pl.DataFrame],
+    steps: Iterable[Step],
+    batch_size: int = 1_000_000,
+) -> Iterator[pl.DataFrame]:
+    """
+    依序把每一批交給各步驟處理，各步驟的狀態跨批次延續
+
+    Args:
+        source: LazyFrame、DataFrame，或已依時間排序的批次序列
+        steps: 處理步驟，依序套用
+        batch_size: source 為 LazyFrame/DataFrame 時的批次列數
+
+    Returns:
+        處理後批次的迭代器
+    """
+    steps = list(steps)
+    batches = (
+        iter_batches(source, batch_size)
+        if isinstance(source, (pl.LazyFrame, pl.DataFrame))
+        else source
+    )
+    for batch in batches:
+        for step in steps:
+            batch = step(batch)
+        yield batch
+
+
+def sink_parquet(
+    source: pl.LazyFrame | pl.DataFrame | Iterable[pl.DataFrame],
+    path: str | Path,
+    steps: Iterable[Step],
+    batch_size: int = 1_000_000,
+) -> int:
+    """
+    分批處理並將每一批寫成 path 目錄下的 part-00000.parquet、part-00001.parquet ...
+
+    可再以 pl.scan_parquet(f"{path}/*.parquet") 讀回，檔名順序即為資料順序。
+
+    Returns:
+        寫入的總列數
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    for i, batch in enumerate(process(source, steps, batch_size)):
+        batch.write_parquet(path / f"part-{i:05d}.parquet")
+        rows += batch.height
+    return rows
@@ -0,0 +1,47 @@
+//! 供 criterion 基準測試（benches/kernels.rs）呼叫的核心入口，不屬於公開 API
+//!
+//! 直接以 Series 呼叫與表達式相同的核心，略過 Python 與插件 FFI 的開銷。
+use polars::prelude::*;
+
+use crate::position::{clean_enex_series, reshape_position_id_series, EnexState, OverlapPolicy};
+use crate::supertrend::{supertrend_with_state, SuperTrendState};
+use crate::values::Precision;
+
+/// 等同 supertrend(high, low, close, atr, upper_multiplier, lower_multiplier)
+pub fn supertrend(
+    high: &Series,
+    low: &Series,
+    close: &Series,
+    atr: &Series,
+    upper_multiplier: f64,
+    lower_multiplier: f64,
+) -> PolarsResult<Series> {
+    let mut state = SuperTrendState::new(upper_multiplier, lower_multiplier);
+    supertrend_with_state(&[high, low, close, atr], &mut state, Precision::Float64)
+}
+
+/// 等同 clean_enex_position(entries, exits, entry_first=True, by=by)
+pub fn clean_enex_position(
+    entries: &Series,
+    exits: &Series,
+    by: Option<&Series>,
+) -> PolarsResult<Series> {
+    clean_enex_series(entries, exits, by, EnexState::new(true))
+}
+
+/// 等同 reshape_position_id_array(len, position_id, entry_idx, exit_idx, overlap)
+pub fn reshape_position_id_array(
+    len: usize,
+    position_id: &Series,
+    entry_idx: &Series,
+    exit_idx: &Series,
+    overlap: &str,
+) -> PolarsResult<Series> {
+    reshape_position_id_series(
+        len,
+        position_id,
+        entry_idx,
+        exit_idx,
+        OverlapPolicy::parse(overlap)?,
+    )
+}
@@ -0,0 +1,231 @@
+//! 不經過 DataFrame 的直接入口，供以 NumPy 陣列保存 K 棒的呼叫端使用
+//!
+//! 輸入與輸出皆透過 buffer protocol 零複製存取（NumPy 陣列，或 pyarrow 陣列的
+//! `to_numpy(zero_copy_only=True)`），需為 C-contiguous；計算期間釋放 GIL，
+//! 結果直接寫入呼叫端提供的輸出陣列。狀態機與表達式版本共用。
+use std::ops::Range;
+
+use pyo3::buffer::{Element, PyBuffer};
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+
+use crate::position::EnexState;
+use crate::state::PySuperTrendState;
+use crate::supertrend::SuperTrendState;
+
+/// 取得 C-contiguous 的輸入緩衝區，型別不符時由 PyBuffer 報錯
+fn input<T: Element>(obj: &Bound<'_, PyAny>, name: &str) -> PyResult<PyBuffer<T>> {
+    let buf = PyBuffer::<T>::get(obj)?;
+    if !buf.is_c_contiguous() {
+        return Err(PyValueError::new_err(format!("{name} must be C-contiguous")));
+    }
+    Ok(buf)
+}
+
+/// 取得可寫入的輸出緩衝區
+fn output<T: Element>(obj: &Bound<'_, PyAny>, name: &str) -> PyResult<PyBuffer<T>> {
+    let buf = input::<T>(obj, name)?;
+    if buf.readonly() {
+        return Err(PyValueError::new_err(format!("{name} must be writable")));
+    }
+    Ok(buf)
+}
+
+fn byte_range<T>(buf: &PyBuffer<T>) -> Range<usize> {
+    let start = buf.buf_ptr() as usize;
+    start..start + buf.len_bytes()
+}
+
+/// 檢查長度一致，且輸出不與任何輸入或其他輸出重疊
+fn check_layout(
+    len: usize,
+    inputs: &[(&str, Range<usize>, usize)],
+    outputs: &[(&str, Range<usize>, usize)],
+) -> PyResult<()> {
+    for (name, _, n) in inputs.iter().chain(outputs) {
+        if *n != len {
+            return Err(PyValueError::new_err(format!(
+                "{name} has length {n}, expected {len}"
+            )));
+        }
+    }
+    for (i, (name, range, _)) in outputs.iter().enumerate() {
+        let others = inputs.iter().chain(&outputs[i + 1..]);
+        for (other, other_range, _) in others {
+            if range.start < other_range.end && other_range.start < range.end {
+                return Err(PyValueError::new_err(format!(
+                    "{name} must not overlap {other}"
+                )));
+            }
+        }
+    }
+    Ok(())
+}
+
+fn layout<'a, T>(name: &'a str, buf: &PyBuffer<T>) -> (&'a str, Range<usize>, usize) {
+    (name, byte_range(buf), buf.item_count())
+}
+
+/// # Safety
+/// 緩衝區需為 C-contiguous，且在使用期間不被其他程式碼修改
+unsafe fn as_slice<T: Element>(buf: &PyBuffer<T>) -> &[T] {
+    std::slice::from_raw_parts(buf.buf_ptr() as *const T, buf.item_count())
+}
+
+/// # Safety
+/// 緩衝區需為 C-contiguous、可寫入，且不與其他正在使用的切片重疊
+#[allow(clippy::mut_from_ref)]
+unsafe fn as_mut_slice<T: Element>(buf: &PyBuffer<T>) -> &mut [T] {
+    std::slice::from_raw_parts_mut(buf.buf_ptr() as *mut T, buf.item_count())
+}
+
+/// 計算 SuperTrend 並寫入 direction (int32) 與 long, short, trend (float64)
+///
+/// 輸入為 float64 陣列，缺值以 NaN 表示；輸出中缺值的列 direction 為 0、其餘為 NaN。
+/// 傳入 state 時從該狀態接續計算並就地更新（此時忽略倍數參數），可用於逐批推進。
+#[pyfunction]
+#[pyo3(signature = (
+    high, low, close, atr, direction, long, short, trend,
+    upper_multiplier=2.0, lower_multiplier=2.0, state=None,
+))]
+#[allow(clippy::too_many_arguments)]
+pub(crate) fn supertrend_np(
+    py: Python<'_>,
+    high: &Bound<'_, PyAny>,
+    low: &Bound<'_, PyAny>,
+    close: &Bound<'_, PyAny>,
+    atr: &Bound<'_, PyAny>,
+    direction: &Bound<'_, PyAny>,
+    long: &Bound<'_, PyAny>,
+    short: &Bound<'_, PyAny>,
+    trend: &Bound<'_, PyAny>,
+    upper_multiplier: f64,
+    lower_multiplier: f64,
+    state: Option<PyRefMut<'_, PySuperTrendState>>,
+) -> PyResult<()> {
+    let high = input::<f64>(high, "high")?;
+    let low = input::<f64>(low, "low")?;
+    let close = input::<f64>(close, "close")?;
+    let atr = input::<f64>(atr, "atr")?;
+    let direction = output::<i32>(direction, "direction")?;
+    let long = output::<f64>(long, "long")?;
+    let short = output::<f64>(short, "short")?;
+    let trend = output::<f64>(trend, "trend")?;
+    check_layout(
+        high.item_count(),
+        &[
+            layout("high", &high),
+            layout("low", &low),
+            layout("close", &close),
+            layout("atr", &atr),
+        ],
+        &[
+            layout("direction", &direction),
+            layout("long", &long),
+            layout("short", &short),
+            layout("trend", &trend),
+        ],
+    )?;
+
+    if high.item_count() == 0 {
+        return Ok(());
+    }
+
+    let mut inner = match &state {
+        Some(state) => state.inner,
+        None => SuperTrendState::new(upper_multiplier, lower_multiplier),
+    };
+    py.allow_threads(|| {
+        // SAFETY: 已檢查 C-contiguous、可寫入、長度一致且輸出互不重疊
+        let (high, low, close, atr) =
+            unsafe { (as_slice(&high), as_slice(&low), as_slice(&close), as_slice(&atr)) };
+        let (direction, long, short, trend) = unsafe {
+            (
+                as_mut_slice(&direction),
+                as_mut_slice(&long),
+                as_mut_slice(&short),
+                as_mut_slice(&trend),
+            )
+        };
+        for i in 0..high.len() {
+            match inner.update(high[i], low[i], close[i], atr[i]) {
+                Some(bar) => {
+                    direction[i] = bar.direction;
+                    long[i] = if bar.direction > 0 { bar.lower_band } else { f64::NAN };
+                    short[i] = if bar.direction < 0 { bar.upper_band } else { f64::NAN };
+                    trend[i] = bar.trend();
+                },
+                None => {
+                    direction[i] = 0;
+                    long[i] = f64::NAN;
+                    short[i] = f64::NAN;
+                    trend[i] = f64::NAN;
+                },
+            }
+        }
+    });
+    if let Some(mut state) = state {
+        state.inner = inner;
+    }
+    Ok(())
+}
+
+/// 清理進出場信號並寫入 entries_out, exits_out (bool) 與 positions_out (int64)
+///
+/// 返回處理完後的 (phase, position_id)，可作為下一批的 initial_phase 與 initial_position_id。
+#[pyfunction]
+#[pyo3(signature = (
+    entries, exits, entries_out, exits_out, positions_out,
+    entry_first=true, initial_phase=-1, initial_position_id=-1,
+))]
+#[allow(clippy::too_many_arguments)]
+pub(crate) fn clean_enex_position_np(
+    py: Python<'_>,
+    entries: &Bound<'_, PyAny>,
+    exits: &Bound<'_, PyAny>,
+    entries_out: &Bound<'_, PyAny>,
+    exits_out: &Bound<'_, PyAny>,
+    positions_out: &Bound<'_, PyAny>,
+    entry_first: bool,
+    initial_phase: i32,
+    initial_position_id: i64,
+) -> PyResult<(i32, i64)> {
+    let entries = input::<bool>(entries, "entries")?;
+    let exits = input::<bool>(exits, "exits")?;
+    let entries_out = output::<bool>(entries_out, "entries_out")?;
+    let exits_out = output::<bool>(exits_out, "exits_out")?;
+    let positions_out = output::<i64>(positions_out, "positions_out")?;
+    check_layout(
+        entries.item_count(),
+        &[layout("entries", &entries), layout("exits", &exits)],
+        &[
+            layout("entries_out", &entries_out),
+            layout("exits_out", &exits_out),
+            layout("positions_out", &positions_out),
+        ],
+    )?;
+
+    let mut state = EnexState::with_state(entry_first, initial_phase, initial_position_id)
+        .map_err(|err| PyValueError::new_err(err.to_string()))?;
+    if entries.item_count() == 0 {
+        return Ok((state.phase(), state.position_id()));
+    }
+    py.allow_threads(|| {
+        // SAFETY: 已檢查 C-contiguous、可寫入、長度一致且輸出互不重疊
+        let (entries, exits) = unsafe { (as_slice(&entries), as_slice(&exits)) };
+        let (entries_out, exits_out, positions_out) = unsafe {
+            (
+                as_mut_slice(&entries_out),
+                as_mut_slice(&exits_out),
+                as_mut_slice(&positions_out),
+            )
+        };
+        for i in 0..entries.len() {
+            let (entry, exit, position) = state.update(entries[i], exits[i]);
+            entries_out[i] = entry;
+            exits_out[i] = exit;
+            positions_out[i] = position;
+        }
+    });
+    Ok((state.phase(), state.position_id()))
+}
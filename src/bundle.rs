@@ -0,0 +1,248 @@
+#![allow(clippy::unused_unit)]
+use polars::prelude::*;
+use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
+use serde::Deserialize;
+
+use crate::position::{clean_enex_dtype, clean_enex_series, EnexState};
+use crate::profiling;
+use crate::rolling::{atr_prices, AtrState, Smoothing};
+use crate::supertrend::{
+    supertrend_dtype, supertrend_ohlc_range, supertrend_range, SuperTrendBuilder, SuperTrendState,
+};
+use crate::values::{Precision, Prices};
+
+/// 單一指標的設定，inputs 為共用輸入欄位的索引
+#[derive(Deserialize)]
+struct BundleSpec {
+    name: String,
+    kind: String,
+    inputs: Vec<usize>,
+    upper_multiplier: Option<f64>,
+    lower_multiplier: Option<f64>,
+    period: Option<usize>,
+    atr_period: Option<usize>,
+    smoothing: Option<String>,
+    entry_first: Option<bool>,
+}
+
+#[derive(Deserialize)]
+struct IndicatorBundleKwargs {
+    specs: Vec<BundleSpec>,
+    output_dtype: String,
+}
+
+/// 解析後的指標，與對應的獨立表達式共用核心
+enum Indicator {
+    SuperTrend {
+        upper_multiplier: f64,
+        lower_multiplier: f64,
+    },
+    SuperTrendFromOhlc {
+        atr_period: usize,
+        smoothing: Smoothing,
+        upper_multiplier: f64,
+        lower_multiplier: f64,
+    },
+    Atr {
+        period: usize,
+        smoothing: Smoothing,
+    },
+    CleanEnexPosition {
+        entry_first: bool,
+    },
+}
+
+impl Indicator {
+    fn parse(spec: &BundleSpec, n_inputs: usize) -> PolarsResult<Self> {
+        let indicator = match spec.kind.as_str() {
+            "supertrend" => Self::SuperTrend {
+                upper_multiplier: spec.upper_multiplier.unwrap_or(2.0),
+                lower_multiplier: spec.lower_multiplier.unwrap_or(2.0),
+            },
+            // 同一組 spec 的輸出無法作為其他 spec 的輸入，需要 ATR 的 SuperTrend 以此在核心內計算
+            "supertrend_from_ohlc" => Self::SuperTrendFromOhlc {
+                atr_period: spec.atr_period.unwrap_or(14),
+                smoothing: Smoothing::parse(spec.smoothing.as_deref().unwrap_or("rma"))?,
+                upper_multiplier: spec.upper_multiplier.unwrap_or(2.0),
+                lower_multiplier: spec.lower_multiplier.unwrap_or(2.0),
+            },
+            "atr" => Self::Atr {
+                period: spec.period.unwrap_or(14),
+                smoothing: Smoothing::parse(spec.smoothing.as_deref().unwrap_or("rma"))?,
+            },
+            "clean_enex_position" => Self::CleanEnexPosition {
+                entry_first: spec.entry_first.unwrap_or(true),
+            },
+            kind => polars_bail!(
+                InvalidOperation: "indicator_bundle: unknown kind '{}' for '{}', expected one of \
+                'supertrend', 'supertrend_from_ohlc', 'atr', 'clean_enex_position'", kind, spec.name
+            ),
+        };
+        polars_ensure!(
+            spec.inputs.len() == indicator.n_inputs(),
+            InvalidOperation: "indicator_bundle: '{}' expects {} inputs, got {}",
+            spec.name, indicator.n_inputs(), spec.inputs.len()
+        );
+        polars_ensure!(
+            spec.inputs.iter().all(|&i| i < n_inputs),
+            OutOfBounds: "indicator_bundle: input index out of bounds for '{}'", spec.name
+        );
+        Ok(indicator)
+    }
+
+    fn n_inputs(&self) -> usize {
+        match self {
+            Self::SuperTrend { .. } => 4,
+            Self::SuperTrendFromOhlc { .. } | Self::Atr { .. } => 3,
+            Self::CleanEnexPosition { .. } => 2,
+        }
+    }
+
+    /// 輸入是否為價格序列（以 Prices 讀取），否則為布林信號
+    fn uses_prices(&self) -> bool {
+        !matches!(self, Self::CleanEnexPosition { .. })
+    }
+
+    fn dtype(&self, output_dtype: &str) -> PolarsResult<DataType> {
+        match self {
+            Self::SuperTrend { .. } | Self::SuperTrendFromOhlc { .. } => {
+                supertrend_dtype(output_dtype, false)
+            },
+            Self::Atr { .. } => Ok(Precision::parse(output_dtype)?.dtype()),
+            Self::CleanEnexPosition { .. } => Ok(clean_enex_dtype()),
+        }
+    }
+
+    /// args 為此指標的輸入索引；價格輸入讀取共用的 Prices 檢視，信號輸入讀取原始 Series
+    fn compute(
+        &self,
+        args: &[usize],
+        inputs: &[Series],
+        prices: &[Option<Prices>],
+        precision: Precision,
+    ) -> PolarsResult<Series> {
+        let price = |k: usize| {
+            prices[args[k]]
+                .as_ref()
+                .expect("indicator_bundle: Prices are built for every price input")
+        };
+        let len = inputs[args[0]].len();
+        match *self {
+            Self::SuperTrend {
+                upper_multiplier,
+                lower_multiplier,
+            } => {
+                let mut state = SuperTrendState::new(upper_multiplier, lower_multiplier);
+                let mut builder = SuperTrendBuilder::with_capacity(len).with_precision(precision);
+                let (high, low, close, atr) = (price(0), price(1), price(2), price(3));
+                supertrend_range(high, low, close, atr, (0, len), &mut state, &mut builder);
+                builder.finish("supertrend")
+            },
+            Self::SuperTrendFromOhlc {
+                atr_period,
+                smoothing,
+                upper_multiplier,
+                lower_multiplier,
+            } => {
+                let mut atr_state = AtrState::new(atr_period, smoothing)?;
+                let mut state = SuperTrendState::new(upper_multiplier, lower_multiplier);
+                let mut builder = SuperTrendBuilder::with_capacity(len).with_precision(precision);
+                supertrend_ohlc_range(
+                    price(0),
+                    price(1),
+                    price(2),
+                    (0, len),
+                    &mut atr_state,
+                    &mut state,
+                    &mut builder,
+                );
+                builder.finish("supertrend")
+            },
+            Self::Atr { period, smoothing } => {
+                let mut state = AtrState::new(period, smoothing)?;
+                let (high, low, close) = (price(0), price(1), price(2));
+                Ok(atr_prices(high, low, close, &mut state, precision))
+            },
+            Self::CleanEnexPosition { entry_first } => clean_enex_series(
+                &inputs[args[0]],
+                &inputs[args[1]],
+                None,
+                EnexState::new(entry_first),
+            ),
+        }
+    }
+}
+
+fn parse_specs(kwargs: &IndicatorBundleKwargs, n_inputs: usize) -> PolarsResult<Vec<Indicator>> {
+    polars_ensure!(
+        !kwargs.specs.is_empty(),
+        InvalidOperation: "indicator_bundle: specs must not be empty"
+    );
+    kwargs
+        .specs
+        .iter()
+        .map(|spec| Indicator::parse(spec, n_inputs))
+        .collect()
+}
+
+// 指標組合 - 單次插件呼叫內以 rayon 平行計算多個獨立指標，共用的輸入欄位只傳入一次
+#[polars_expr(output_type_func_with_kwargs=indicator_bundle_output_type)]
+fn indicator_bundle(inputs: &[Series], kwargs: IndicatorBundleKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("indicator_bundle", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let indicators = parse_specs(&kwargs, inputs.len())?;
+
+    let len = inputs.first().map_or(0, |s| s.len());
+    polars_ensure!(
+        inputs.iter().all(|s| s.len() == len),
+        ShapeMismatch: "indicator_bundle: input columns must have the same length"
+    );
+
+    // 每個價格輸入只建立一次 Prices 檢視，含缺值或多個 chunk 的欄位不會被每個指標各自實體化
+    let mut prices: Vec<Option<Prices>> = inputs.iter().map(|_| None).collect();
+    for (spec, indicator) in kwargs.specs.iter().zip(&indicators) {
+        if indicator.uses_prices() {
+            for &i in &spec.inputs {
+                if prices[i].is_none() {
+                    prices[i] = Some(Prices::new(&inputs[i])?);
+                }
+            }
+        }
+    }
+
+    let fields: Vec<Series> = kwargs
+        .specs
+        .par_iter()
+        .zip(indicators.par_iter())
+        .map(|(spec, indicator)| {
+            let mut out = indicator.compute(&spec.inputs, inputs, &prices, precision)?;
+            out.rename(spec.name.as_str().into());
+            Ok(out)
+        })
+        .collect::<PolarsResult<_>>()?;
+
+    profiling::build(|| {
+        Ok(StructChunked::from_series("indicator_bundle".into(), len, fields.iter())?.into_series())
+    })
+}
+
+fn indicator_bundle_output_type(
+    input_fields: &[Field],
+    kwargs: IndicatorBundleKwargs,
+) -> PolarsResult<Field> {
+    let fields = parse_specs(&kwargs, input_fields.len())?
+        .iter()
+        .zip(&kwargs.specs)
+        .map(|(indicator, spec)| {
+            Ok(Field::new(
+                spec.name.as_str().into(),
+                indicator.dtype(&kwargs.output_dtype)?,
+            ))
+        })
+        .collect::<PolarsResult<Vec<_>>>()?;
+    Ok(Field::new(
+        "indicator_bundle".into(),
+        DataType::Struct(fields),
+    ))
+}
@@ -4,8 +4,11 @@ use std::fmt::Write;
 use polars::prelude::*;
 use pyo3_polars::derive::polars_expr;
 
+use crate::profiling;
+
 #[polars_expr(output_type=String)]
 fn pig_latinnify(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("pig_latinnify", inputs);
     let ca: &StringChunked = inputs[0].str()?;
     let out: StringChunked = ca.apply_into_string_amortized(|value: &str, output: &mut String| {
         if let Some(first_char) = value.chars().next() {
@@ -0,0 +1,79 @@
+use polars::prelude::*;
+use rayon::prelude::*;
+
+/// 由分組鍵計算各組的 [start, end) 範圍
+///
+/// 輸入需依分組鍵排序（相同鍵值連續排列），每遇到鍵值變化即開始新的一組。
+pub(crate) fn group_slices(key: &Series) -> PolarsResult<Vec<(usize, usize)>> {
+    let len = key.len();
+    if len == 0 {
+        return Ok(Vec::new());
+    }
+
+    let changed = key.not_equal_missing(&key.shift(1))?;
+    let mut groups = Vec::new();
+    let mut start = 0usize;
+    for (i, is_new) in changed.into_iter().enumerate().skip(1) {
+        if is_new.unwrap_or(false) {
+            groups.push((start, i));
+            start = i;
+        }
+    }
+    groups.push((start, len));
+    Ok(groups)
+}
+
+/// 依列數將分組平均切成最多 n_parts 個連續批次
+fn partition_groups(groups: &[(usize, usize)], n_parts: usize) -> Vec<&[(usize, usize)]> {
+    let total = groups.last().map_or(0, |g| g.1);
+    let target = total.div_ceil(n_parts.max(1)).max(1);
+
+    let mut parts = Vec::with_capacity(n_parts);
+    let mut begin = 0usize;
+    let mut rows = 0usize;
+    for (i, &(start, end)) in groups.iter().enumerate() {
+        rows += end - start;
+        if rows >= target {
+            parts.push(&groups[begin..=i]);
+            begin = i + 1;
+            rows = 0;
+        }
+    }
+    if begin < groups.len() {
+        parts.push(&groups[begin..]);
+    }
+    parts
+}
+
+/// 將連續的分組切成批次後平行執行 kernel
+///
+/// kernel 收到一個批次內的分組範圍，需在每組開頭重設狀態並輸出整個批次的結果；
+/// 各批次的輸出以 chunk 形式依序串接，不做額外複製。
+pub(crate) fn par_map_groups<F>(groups: &[(usize, usize)], kernel: F) -> PolarsResult<Series>
+where
+    F: Fn(&[(usize, usize)]) -> PolarsResult<Series> + Sync,
+{
+    let parts = partition_groups(groups, rayon::current_num_threads());
+    if parts.len() <= 1 {
+        return kernel(groups);
+    }
+
+    let mut outputs = parts
+        .into_par_iter()
+        .map(|part| kernel(part))
+        .collect::<PolarsResult<Vec<_>>>()?
+        .into_iter();
+    let mut out = outputs.next().unwrap();
+    for part in outputs {
+        out.append(&part)?;
+    }
+    Ok(out)
+}
+
+/// 批次涵蓋的列範圍
+#[inline]
+pub(crate) fn batch_range(groups: &[(usize, usize)]) -> (usize, usize) {
+    let start = groups.first().map_or(0, |g| g.0);
+    let end = groups.last().map_or(start, |g| g.1);
+    (start, end)
+}
@@ -1,14 +1,40 @@
+#[doc(hidden)]
+pub mod bench;
+mod bundle;
+mod buffers;
 mod expressions;
+mod fingerprint;
+mod groups;
+mod performance;
 mod position;
+mod profiling;
+mod rolling;
+mod state;
 mod supertrend;
+mod timeframe;
+mod trade;
+mod values;
 use pyo3::prelude::*;
 use pyo3_polars::PolarsAllocator;
 
 #[pymodule]
 fn _internal(_py: Python, m: &Bound<PyModule>) -> PyResult<()> {
     m.add("__version__", env!("CARGO_PKG_VERSION"))?;
+    m.add_class::<state::PySuperTrendState>()?;
+    m.add_class::<state::PyAtrState>()?;
+    m.add_class::<state::PyEnexPositionState>()?;
+    m.add_function(wrap_pyfunction!(buffers::supertrend_np, m)?)?;
+    m.add_function(wrap_pyfunction!(buffers::clean_enex_position_np, m)?)?;
+    m.add_function(wrap_pyfunction!(fingerprint::fingerprint_blocks, m)?)?;
+    m.add_function(wrap_pyfunction!(profiling::profiling_enable, m)?)?;
+    m.add_function(wrap_pyfunction!(profiling::profiling_disable, m)?)?;
+    m.add_function(wrap_pyfunction!(profiling::profiling_is_enabled, m)?)?;
+    m.add_function(wrap_pyfunction!(profiling::profiling_reset, m)?)?;
+    m.add_function(wrap_pyfunction!(profiling::profiling_stats, m)?)?;
     Ok(())
 }
 
+// 經由 Polars 的配置器配置記憶體，profiling 開啟時額外統計配置量
 #[global_allocator]
-static ALLOC: PolarsAllocator = PolarsAllocator::new();
+static ALLOC: profiling::CountingAllocator<PolarsAllocator> =
+    profiling::CountingAllocator::new(PolarsAllocator::new());
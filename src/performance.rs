@@ -0,0 +1,212 @@
+#![allow(clippy::unused_unit)]
+use polars::prelude::*;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+
+use crate::profiling;
+use crate::values::Prices;
+
+/// 報酬序列的串流累加器，以常數記憶體一次掃描計算所有績效指標
+///
+/// 平均值與變異數使用 Welford 演算法，權益曲線以複利累積；缺值（NaN）的期數略過。
+/// 交易統計（count, wins, losses, win_rate, profit_factor）以每筆交易的報酬計算，
+/// 由 record_trade 另外累加，不計入空手的期數。
+#[derive(Clone, Copy, Debug)]
+pub(crate) struct PerformanceState {
+    risk_free: f64,
+    periods: usize,
+    mean: f64,
+    m2: f64,
+    downside_sq: f64,
+    trades: usize,
+    gross_profit: f64,
+    gross_loss: f64,
+    wins: usize,
+    losses: usize,
+    equity: f64,
+    peak: f64,
+    max_drawdown: f64,
+    drawdown_duration: usize,
+    max_drawdown_duration: usize,
+}
+
+impl PerformanceState {
+    pub(crate) fn new(risk_free: f64) -> Self {
+        Self {
+            risk_free,
+            periods: 0,
+            mean: 0.0,
+            m2: 0.0,
+            downside_sq: 0.0,
+            trades: 0,
+            gross_profit: 0.0,
+            gross_loss: 0.0,
+            wins: 0,
+            losses: 0,
+            equity: 1.0,
+            peak: 1.0,
+            max_drawdown: 0.0,
+            drawdown_duration: 0,
+            max_drawdown_duration: 0,
+        }
+    }
+
+    /// 累加一期報酬，用於權益曲線、回撤與 Sharpe/Sortino
+    #[inline(always)]
+    pub(crate) fn update(&mut self, r: f64) {
+        if r.is_nan() {
+            return;
+        }
+
+        self.periods += 1;
+        let delta = r - self.mean;
+        self.mean += delta / self.periods as f64;
+        self.m2 += delta * (r - self.mean);
+
+        let excess = r - self.risk_free;
+        if excess < 0.0 {
+            self.downside_sq += excess * excess;
+        }
+
+        self.equity *= 1.0 + r;
+        if self.equity >= self.peak {
+            self.peak = self.equity;
+            self.drawdown_duration = 0;
+        } else {
+            self.drawdown_duration += 1;
+            self.max_drawdown = self.max_drawdown.min(self.equity / self.peak - 1.0);
+            self.max_drawdown_duration = self.max_drawdown_duration.max(self.drawdown_duration);
+        }
+    }
+
+    /// 累加一筆已平倉交易的報酬，用於交易統計
+    #[inline(always)]
+    pub(crate) fn record_trade(&mut self, r: f64) {
+        if r.is_nan() {
+            return;
+        }
+
+        self.trades += 1;
+        if r > 0.0 {
+            self.gross_profit += r;
+            self.wins += 1;
+        } else if r < 0.0 {
+            self.gross_loss -= r;
+            self.losses += 1;
+        }
+    }
+
+    fn finish(&self, periods_per_year: f64) -> PolarsResult<Series> {
+        let n = self.periods as f64;
+        let annualize = periods_per_year.sqrt();
+        let excess_mean = self.mean - self.risk_free;
+        let std = if self.periods > 1 {
+            (self.m2 / (n - 1.0)).sqrt()
+        } else {
+            f64::NAN
+        };
+        let downside = (self.downside_sq / n).sqrt();
+        // 分母為 0 的比率以 null 表示
+        let ratio = |num: f64, den: f64| -> Option<f64> {
+            let value = num / den;
+            (den != 0.0 && value.is_finite()).then_some(value)
+        };
+
+        let fields = vec![
+            Series::new("total_return".into(), [self.equity - 1.0]),
+            Series::new("max_drawdown".into(), [self.max_drawdown]),
+            Series::new("max_drawdown_duration".into(), [self.max_drawdown_duration as i64]),
+            Series::new("sharpe".into(), [ratio(excess_mean * annualize, std)]),
+            Series::new("sortino".into(), [ratio(excess_mean * annualize, downside)]),
+            Series::new(
+                "profit_factor".into(),
+                [ratio(self.gross_profit, self.gross_loss)],
+            ),
+            Series::new("count".into(), [self.trades as i64]),
+            Series::new("wins".into(), [self.wins as i64]),
+            Series::new("losses".into(), [self.losses as i64]),
+            Series::new("win_rate".into(), [ratio(self.wins as f64, self.trades as f64)]),
+        ];
+        Ok(StructChunked::from_series("performance_summary".into(), 1, fields.iter())?.into_series())
+    }
+}
+
+#[derive(Deserialize)]
+struct PerformanceSummaryKwargs {
+    periods_per_year: f64,
+    risk_free: f64,
+}
+
+/// 績效摘要 - 單次掃描報酬序列，返回單列結構體，可直接用於 group_by().agg()
+///
+/// 只有一個輸入時視為每筆交易的報酬，每個非缺值各計為一筆交易；
+/// 兩個輸入時依序為價格與部位曝險，以前一根的曝險乘上當根價格變動計算每根報酬，
+/// 並在曝險改變時切分交易：每筆交易的報酬為持有期間各根報酬的複利累積，
+/// 只統計已平倉的交易，空手的期數不計入。
+#[polars_expr(output_type_func=performance_summary_output_type)]
+fn performance_summary(inputs: &[Series], kwargs: PerformanceSummaryKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("performance_summary", inputs);
+    let mut state = PerformanceState::new(kwargs.risk_free);
+
+    if inputs.len() == 1 {
+        let returns = Prices::new(&inputs[0])?;
+        for i in 0..returns.len() {
+            let r = returns.get(i);
+            state.update(r);
+            state.record_trade(r);
+        }
+    } else {
+        // 布林部位（只做多的持倉遮罩）轉為 0/1，其餘數值型別直接讀取
+        let position = match inputs[1].dtype() {
+            DataType::Boolean => inputs[1].cast(&DataType::Float64)?,
+            _ => inputs[1].clone(),
+        };
+        let price = Prices::new(&inputs[0])?;
+        let position = Prices::new(&position)?;
+        polars_ensure!(
+            price.len() == position.len(),
+            ShapeMismatch: "performance_summary: price and position must have the same length"
+        );
+
+        // 目前持有中交易的累積淨值，None 表示空手
+        let mut trade: Option<f64> = None;
+        for i in 1..price.len() {
+            let held = position.get(i - 1);
+            let r = held * (price.get(i) / price.get(i - 1) - 1.0);
+            state.update(r);
+
+            let in_market = held != 0.0 && !held.is_nan();
+            if in_market {
+                let growth = trade.get_or_insert(1.0);
+                if !r.is_nan() {
+                    *growth *= 1.0 + r;
+                }
+            }
+            // 曝險改變時平倉（反手或調整部位時同時開始下一筆）
+            let next = position.get(i);
+            if next != held && !(held.is_nan() && next.is_nan()) {
+                if let Some(growth) = trade.take() {
+                    state.record_trade(growth - 1.0);
+                }
+            }
+        }
+    }
+
+    profiling::build(|| state.finish(kwargs.periods_per_year))
+}
+
+fn performance_summary_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+    let fields = vec![
+        Field::new("total_return".into(), DataType::Float64),
+        Field::new("max_drawdown".into(), DataType::Float64),
+        Field::new("max_drawdown_duration".into(), DataType::Int64),
+        Field::new("sharpe".into(), DataType::Float64),
+        Field::new("sortino".into(), DataType::Float64),
+        Field::new("profit_factor".into(), DataType::Float64),
+        Field::new("count".into(), DataType::Int64),
+        Field::new("wins".into(), DataType::Int64),
+        Field::new("losses".into(), DataType::Int64),
+        Field::new("win_rate".into(), DataType::Float64),
+    ];
+    Ok(Field::new("performance_summary".into(), DataType::Struct(fields)))
+}
@@ -1,151 +1,842 @@
 #![allow(clippy::unused_unit)]
 use polars::prelude::*;
+use polars_arrow::array::BooleanArray;
+use polars_arrow::bitmap::{Bitmap, MutableBitmap};
 use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
 
-/// 清理進場和出場信號數組，處理交易的進場（entry）和出場（exit）信號
-/// 返回包含 entries_out, exits_out, positions_out 三個字段的結構體
-#[polars_expr(output_type_func=clean_enex_position_output_type)]
-fn clean_enex_position(inputs: &[Series]) -> PolarsResult<Series> {
-    let entries = &inputs[0];
-    let exits = &inputs[1];
-    let entry_first = &inputs[2];
+use crate::groups::{batch_range, group_slices, par_map_groups};
+use crate::profiling;
+use crate::values::{chunk_ranges, map_chunks, Prices};
 
-    let entries_ca: &BooleanChunked = entries.bool()?;
-    let exits_ca: &BooleanChunked = exits.bool()?;
-    let entry_first_value = entry_first.bool()?.get(0).unwrap_or(true);
+/// 進出場信號清理的狀態機
+#[derive(Clone, Copy, Debug)]
+pub(crate) struct EnexState {
+    entry_first: bool,
+    phase: i32, // -1: 初始, 1: 已進場, 0: 已出場
+    position_id: i64,
+}
 
-    let len = entries_ca.len();
-    if len == 0 {
-        let empty_bool = BooleanChunked::new("".into(), Vec::<Option<bool>>::new()).into_series();
-        let empty_int64 = Int64Chunked::new("".into(), Vec::<Option<i64>>::new()).into_series();
+impl EnexState {
+    pub(crate) fn new(entry_first: bool) -> Self {
+        Self {
+            entry_first,
+            phase: -1,
+            position_id: -1,
+        }
+    }
 
-        return Ok(StructChunked::from_series(
-            "clean_enex_position".into(),
-            0,
-            vec![
-                empty_bool.clone().with_name("entries_out".into()),
-                empty_bool.with_name("exits_out".into()),
-                empty_int64.with_name("positions_out".into()),
-            ]
-            .iter(),
-        )?
-        .into_series());
+    /// 以延續自前一段資料的狀態建立，用於分段或串流處理
+    pub(crate) fn with_state(entry_first: bool, phase: i32, position_id: i64) -> PolarsResult<Self> {
+        polars_ensure!(
+            matches!(phase, -1..=1),
+            InvalidOperation: "initial_phase must be -1, 0 or 1, got {}", phase
+        );
+        polars_ensure!(
+            position_id >= -1,
+            InvalidOperation: "initial_position_id must be >= -1, got {}", position_id
+        );
+        // 已進場或已出場的狀態必須對應到一個實際的倉位編號
+        polars_ensure!(
+            phase == -1 || position_id >= 0,
+            InvalidOperation: "initial_position_id must be >= 0 when initial_phase is {}, got {}", phase, position_id
+        );
+        Ok(Self {
+            entry_first,
+            phase,
+            position_id,
+        })
     }
 
-    let mut entries_out = Vec::with_capacity(len);
-    let mut exits_out = Vec::with_capacity(len);
-    let mut positions_out = Vec::with_capacity(len);
+    pub(crate) fn entry_first(&self) -> bool {
+        self.entry_first
+    }
 
-    let mut phase = -1i32; // -1: 初始, 1: 已進場, 0: 已出場
-    let mut _position_id = -1i64;
+    pub(crate) fn phase(&self) -> i32 {
+        self.phase
+    }
 
-    // 複製輸入陣列以便修改
-    let mut entries_temp: Vec<bool> = (0..len)
-        .map(|i| entries_ca.get(i).unwrap_or(false))
-        .collect();
-    let mut exits_temp: Vec<bool> = (0..len).map(|i| exits_ca.get(i).unwrap_or(false)).collect();
+    pub(crate) fn position_id(&self) -> i64 {
+        self.position_id
+    }
+
+    /// 沒有有效信號時每列輸出的 position
+    #[inline(always)]
+    fn idle_position(&self) -> i64 {
+        if self.phase == 1 {
+            self.position_id
+        } else {
+            -1
+        }
+    }
+
+    /// 在目前狀態下會改變狀態的信號位元
+    ///
+    /// 空手時只有進場有效、持倉時只有出場有效；同時為 True 時依 entry_first 取捨。
+    /// 其餘位元都不改變狀態，輸出等同於 idle_position。
+    #[inline(always)]
+    fn active_bits(&self, entries: u64, exits: u64) -> u64 {
+        match (self.phase == 1, self.entry_first) {
+            (false, true) => entries,
+            (false, false) => entries & !exits,
+            (true, true) => exits & !entries,
+            (true, false) => exits,
+        }
+    }
+
+    /// 推進一根 K 棒，返回 (entry_out, exit_out, position_out)
+    #[inline(always)]
+    pub(crate) fn update(&mut self, entry: bool, exit: bool) -> (bool, bool, i64) {
+        let mut entry = entry;
+        let mut exit = exit;
 
-    for i in 0..len {
         // 如果同時為 True 則以優先度選擇訊號
-        if entries_temp[i] && exits_temp[i] {
-            if entry_first_value {
-                exits_temp[i] = false;
+        if entry && exit {
+            if self.entry_first {
+                exit = false;
             } else {
-                entries_temp[i] = false;
+                entry = false;
             }
         }
 
-        // 處理進場信號
-        if entries_temp[i] {
-            if phase == -1 || phase == 0 {
-                phase = 1;
-                _position_id += 1;
-                entries_out.push(Some(true));
-                exits_out.push(Some(false));
-                positions_out.push(Some(_position_id));
+        if entry {
+            // 處理進場信號
+            if self.phase == -1 || self.phase == 0 {
+                self.phase = 1;
+                self.position_id += 1;
+                (true, false, self.position_id)
             } else {
-                entries_out.push(Some(false));
-                exits_out.push(Some(false));
-                positions_out.push(Some(_position_id));
+                (false, false, self.position_id)
             }
-        } else if exits_temp[i] {
+        } else if exit {
             // 出場信號處理
-            entries_out.push(Some(false));
-            if phase == 1 {
-                phase = 0;
-                exits_out.push(Some(true));
-                positions_out.push(Some(_position_id));
+            if self.phase == 1 {
+                self.phase = 0;
+                (false, true, self.position_id)
             } else {
-                exits_out.push(Some(false));
-                positions_out.push(Some(-1));
+                (false, false, -1)
             }
-        } else {
+        } else if self.phase == 1 {
             // 維持當前狀態
-            entries_out.push(Some(false));
-            exits_out.push(Some(false));
-            if phase == 1 {
-                positions_out.push(Some(_position_id));
-            } else {
-                positions_out.push(Some(-1));
-            }
+            (false, false, self.position_id)
+        } else {
+            (false, false, -1)
         }
     }
+}
+
+/// 狀態機輸出的接收端，只需最終狀態時可用 () 省去寫入
+pub(crate) trait EnexSink {
+    fn push(&mut self, out: (bool, bool, i64));
+    fn extend_idle(&mut self, n: usize, position: i64);
+}
 
-    let entries_series = BooleanChunked::new("entries_out".into(), entries_out).into_series();
-    let exits_series = BooleanChunked::new("exits_out".into(), exits_out).into_series();
-    let positions_series = Int64Chunked::new("positions_out".into(), positions_out).into_series();
+impl EnexSink for () {
+    #[inline(always)]
+    fn push(&mut self, _out: (bool, bool, i64)) {}
 
-    Ok(StructChunked::from_series(
-        "clean_enex_position".into(),
-        len,
-        vec![entries_series, exits_series, positions_series].iter(),
-    )?
-    .into_series())
+    #[inline(always)]
+    fn extend_idle(&mut self, _n: usize, _position: i64) {}
 }
 
-fn clean_enex_position_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+/// 預先配置的輸出緩衝區，輸出不含缺值因此不需 validity
+pub(crate) struct EnexBuilder {
+    entries_out: MutableBitmap,
+    exits_out: MutableBitmap,
+    positions_out: Vec<i64>,
+}
+
+impl EnexBuilder {
+    pub(crate) fn with_capacity(len: usize) -> Self {
+        Self {
+            entries_out: MutableBitmap::with_capacity(len),
+            exits_out: MutableBitmap::with_capacity(len),
+            positions_out: Vec::with_capacity(len),
+        }
+    }
+
+    pub(crate) fn finish(self) -> PolarsResult<Series> {
+        let len = self.positions_out.len();
+        let entries_series =
+            BooleanChunked::from_bitmap("entries_out".into(), self.entries_out.into()).into_series();
+        let exits_series =
+            BooleanChunked::from_bitmap("exits_out".into(), self.exits_out.into()).into_series();
+        let positions_series =
+            Int64Chunked::from_vec("positions_out".into(), self.positions_out).into_series();
+
+        Ok(StructChunked::from_series(
+            "clean_enex_position".into(),
+            len,
+            vec![entries_series, exits_series, positions_series].iter(),
+        )?
+        .into_series())
+    }
+}
+
+impl EnexSink for EnexBuilder {
+    #[inline(always)]
+    fn push(&mut self, (entry, exit, position): (bool, bool, i64)) {
+        self.entries_out.push(entry);
+        self.exits_out.push(exit);
+        self.positions_out.push(position);
+    }
+
+    #[inline(always)]
+    fn extend_idle(&mut self, n: usize, position: i64) {
+        self.entries_out.extend_constant(n, false);
+        self.exits_out.extend_constant(n, false);
+        self.positions_out
+            .resize(self.positions_out.len() + n, position);
+    }
+}
+
+/// 取得信號的 bitmap，缺值視為 false
+fn signal_bits(arr: &BooleanArray) -> Bitmap {
+    match arr.validity() {
+        Some(validity) if validity.unset_bits() > 0 => arr.values() & validity,
+        _ => arr.values().clone(),
+    }
+}
+
+/// 處理一個 64 位元字組內的 bits 根 K 棒
+///
+/// 以 trailing_zeros 直接跳到下一個會改變狀態的信號，中間的 K 棒整段寫入。
+#[inline(always)]
+fn clean_enex_word<S: EnexSink>(
+    entries: u64,
+    exits: u64,
+    bits: usize,
+    state: &mut EnexState,
+    sink: &mut S,
+) {
+    let valid_mask = if bits == 64 { u64::MAX } else { (1u64 << bits) - 1 };
+    let entries = entries & valid_mask;
+    let exits = exits & valid_mask;
+
+    let mut pos = 0usize;
+    while pos < bits {
+        let active = state.active_bits(entries, exits) >> pos;
+        if active == 0 {
+            sink.extend_idle(bits - pos, state.idle_position());
+            return;
+        }
+        let skip = active.trailing_zeros() as usize;
+        if skip > 0 {
+            sink.extend_idle(skip, state.idle_position());
+            pos += skip;
+        }
+        let out = state.update((entries >> pos) & 1 == 1, (exits >> pos) & 1 == 1);
+        sink.push(out);
+        pos += 1;
+    }
+}
+
+/// 直接讀取 Arrow bitmap，每次處理 64 根 K 棒，全為 false 的區段整段略過
+pub(crate) fn clean_enex_bitmaps<S: EnexSink>(
+    entries: &Bitmap,
+    exits: &Bitmap,
+    state: &mut EnexState,
+    sink: &mut S,
+) {
+    let len = entries.len();
+    let entry_words = entries.chunks::<u64>();
+    let exit_words = exits.chunks::<u64>();
+    let entry_remainder = entry_words.remainder();
+    let exit_remainder = exit_words.remainder();
+
+    for (e, x) in entry_words.zip(exit_words) {
+        clean_enex_word(e, x, 64, state, sink);
+    }
+    let rem_bits = len % 64;
+    if rem_bits > 0 {
+        clean_enex_word(entry_remainder, exit_remainder, rem_bits, state, sink);
+    }
+}
+
+/// 合併為單一 chunk 後取得 entries 與 exits 的 bitmap
+///
+/// 逐 chunk 處理時傳入的是單一 chunk 的切片，合併不會產生複製。
+fn signal_bitmaps(entries: &BooleanChunked, exits: &BooleanChunked) -> (Bitmap, Bitmap) {
+    let entries = entries.rechunk();
+    let exits = exits.rechunk();
+    let to_bits = |ca: &BooleanChunked| {
+        ca.downcast_iter()
+            .next()
+            .map(signal_bits)
+            .unwrap_or_else(|| Bitmap::new_zeroed(0))
+    };
+    (to_bits(&entries), to_bits(&exits))
+}
+
+/// 清理進場和出場信號數組，處理交易的進場（entry）和出場（exit）信號
+/// 返回包含 entries_out, exits_out, positions_out 三個字段的結構體
+#[polars_expr(output_type_func=clean_enex_position_output_type)]
+fn clean_enex_position(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("clean_enex_position", inputs);
+    let initial = initial_state(inputs, inputs[2].bool()?.get(0).unwrap_or(true))?;
+    // 初始狀態屬於單一延續的序列，套用到每個分組幾乎不會是正確的結果
+    polars_ensure!(
+        inputs.len() < 6 || (initial.phase() == -1 && initial.position_id() == -1),
+        InvalidOperation: "clean_enex_position: by cannot be combined with initial_phase or \
+        initial_position_id"
+    );
+    clean_enex_series(&inputs[0], &inputs[1], inputs.get(5), initial)
+}
+
+/// clean_enex_position 的核心，批次表達式與基準測試共用
+pub(crate) fn clean_enex_series(
+    entries: &Series,
+    exits: &Series,
+    by: Option<&Series>,
+    initial: EnexState,
+) -> PolarsResult<Series> {
+    let entries_ca: &BooleanChunked = entries.bool()?;
+    let exits_ca: &BooleanChunked = exits.bool()?;
+
+    let len = entries_ca.len();
+    polars_ensure!(
+        exits_ca.len() == len,
+        ShapeMismatch: "clean_enex_position: entries and exits must have the same length"
+    );
+
+    // 指定分組鍵時，每組以初始狀態重新開始（position id 重新編號），各組平行計算
+    if let Some(by) = by {
+        polars_ensure!(
+            by.len() == len,
+            ShapeMismatch: "clean_enex_position: by must have the same length as the inputs"
+        );
+        let groups = group_slices(by)?;
+        let (entries, exits) = signal_bitmaps(entries_ca, exits_ca);
+        return par_map_groups(&groups, |groups| {
+            let (start, end) = batch_range(groups);
+            let mut builder = EnexBuilder::with_capacity(end - start);
+            for &(s, e) in groups {
+                let mut state = initial;
+                clean_enex_bitmaps(
+                    &entries.clone().sliced(s, e - s),
+                    &exits.clone().sliced(s, e - s),
+                    &mut state,
+                    &mut builder,
+                );
+            }
+            profiling::build(|| builder.finish())
+        });
+    }
+
+    let mut state = initial;
+    clean_enex_with_state(entries, exits, &mut state)
+}
+
+/// 從給定狀態接續清理信號，批次表達式與增量狀態物件共用此核心
+///
+/// 逐 chunk 處理並跨 chunk 延續狀態，輸出保留 entries 的 chunk 佈局。
+pub(crate) fn clean_enex_with_state(
+    entries: &Series,
+    exits: &Series,
+    state: &mut EnexState,
+) -> PolarsResult<Series> {
+    map_chunks(&[entries, exits], |chunk| {
+        let (entries, exits) = signal_bitmaps(chunk[0].bool()?, chunk[1].bool()?);
+        let mut builder = EnexBuilder::with_capacity(entries.len());
+        clean_enex_bitmaps(&entries, &exits, state, &mut builder);
+        profiling::build(|| builder.finish())
+    })
+}
+
+/// 讀取 inputs[3], inputs[4] 的初始 phase 與 position id
+fn initial_state(inputs: &[Series], entry_first: bool) -> PolarsResult<EnexState> {
+    let phase = inputs[3].cast(&DataType::Int32)?.i32()?.get(0).unwrap_or(-1);
+    let position_id = inputs[4].cast(&DataType::Int64)?.i64()?.get(0).unwrap_or(-1);
+    EnexState::with_state(entry_first, phase, position_id)
+}
+
+/// 返回處理完整段信號後的最終狀態，作為下一段資料的初始狀態
+///
+/// 只推進狀態機而不產生逐列輸出，可在分段平行處理前先以此快速算出各段的起始狀態。
+#[polars_expr(output_type_func=clean_enex_position_state_output_type)]
+fn clean_enex_position_state(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("clean_enex_position_state", inputs);
+    let entries_ca: &BooleanChunked = inputs[0].bool()?;
+    let exits_ca: &BooleanChunked = inputs[1].bool()?;
+    let mut state = initial_state(inputs, inputs[2].bool()?.get(0).unwrap_or(true))?;
+
+    polars_ensure!(
+        exits_ca.len() == entries_ca.len(),
+        ShapeMismatch: "clean_enex_position_state: entries and exits must have the same length"
+    );
+
+    for (offset, len) in chunk_ranges(&inputs[0]) {
+        let entries = entries_ca.slice(offset as i64, len);
+        let exits = exits_ca.slice(offset as i64, len);
+        let (entries, exits) = signal_bitmaps(&entries, &exits);
+        clean_enex_bitmaps(&entries, &exits, &mut state, &mut ());
+    }
+
+    let phase = Int32Chunked::from_vec("phase".into(), vec![state.phase()]);
+    let position_id = Int64Chunked::from_vec("position_id".into(), vec![state.position_id()]);
+    profiling::build(|| {
+        Ok(StructChunked::from_series(
+            "clean_enex_position_state".into(),
+            1,
+            vec![phase.into_series(), position_id.into_series()].iter(),
+        )?
+        .into_series())
+    })
+}
+
+fn clean_enex_position_state_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
     let fields = vec![
-        Field::new("entries_out".into(), DataType::Boolean),
-        Field::new("exits_out".into(), DataType::Boolean),
-        Field::new("positions_out".into(), DataType::Int64),
+        Field::new("phase".into(), DataType::Int32),
+        Field::new("position_id".into(), DataType::Int64),
     ];
     Ok(Field::new(
-        "clean_enex_position".into(),
+        "clean_enex_position_state".into(),
         DataType::Struct(fields),
     ))
 }
 
+/// clean_enex_position 的結構體欄位
+pub(crate) fn clean_enex_dtype() -> DataType {
+    DataType::Struct(vec![
+        Field::new("entries_out".into(), DataType::Boolean),
+        Field::new("exits_out".into(), DataType::Boolean),
+        Field::new("positions_out".into(), DataType::Int64),
+    ])
+}
+
+fn clean_enex_position_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+    Ok(Field::new("clean_enex_position".into(), clean_enex_dtype()))
+}
+
+/// 重疊交易的處理方式
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub(crate) enum OverlapPolicy {
+    /// 先出現的交易優先
+    First,
+    /// 後出現的交易覆蓋先前的交易（原本的行為）
+    Last,
+    /// 有重疊即報錯
+    Error,
+    /// 輸出每根 K 棒被幾筆交易涵蓋
+    Count,
+}
+
+impl OverlapPolicy {
+    pub(crate) fn parse(value: &str) -> PolarsResult<Self> {
+        match value {
+            "first" => Ok(Self::First),
+            "last" => Ok(Self::Last),
+            "error" => Ok(Self::Error),
+            "count" => Ok(Self::Count),
+            _ => polars_bail!(
+                InvalidOperation: "unknown overlap policy '{}', expected one of 'first', 'last', 'error', 'count'", value
+            ),
+        }
+    }
+
+    /// 輸出欄位名稱：count 輸出的是涵蓋筆數而不是位置ID
+    pub(crate) fn output_name(self) -> &'static str {
+        match self {
+            Self::Count => "overlap_count",
+            _ => "_position_id",
+        }
+    }
+}
+
+/// 通過驗證的交易，範圍為 [start, end]
+#[derive(Clone, Copy, Debug)]
+struct Trade {
+    position_id: i64,
+    start: usize,
+    end: usize,
+}
+
+/// 被拒絕或重疊的交易統計
+#[derive(Default, Debug)]
+struct ReshapeDiagnostics {
+    trades: i64,
+    null: i64,
+    out_of_range: i64,
+    inverted: i64,
+}
+
+/// 以 i64 讀取任意整數型別的欄位，不做轉型複製
+fn int_values(s: &Series) -> PolarsResult<Box<dyn Iterator<Item = Option<i64>> + '_>> {
+    Ok(match s.dtype() {
+        DataType::Int8 => Box::new(s.i8()?.into_iter().map(|v| v.map(i64::from))),
+        DataType::Int16 => Box::new(s.i16()?.into_iter().map(|v| v.map(i64::from))),
+        DataType::Int32 => Box::new(s.i32()?.into_iter().map(|v| v.map(i64::from))),
+        DataType::Int64 => Box::new(s.i64()?.into_iter()),
+        DataType::UInt8 => Box::new(s.u8()?.into_iter().map(|v| v.map(i64::from))),
+        DataType::UInt16 => Box::new(s.u16()?.into_iter().map(|v| v.map(i64::from))),
+        DataType::UInt32 => Box::new(s.u32()?.into_iter().map(|v| v.map(i64::from))),
+        DataType::UInt64 => {
+            let ca = s.u64()?;
+            // 超過 i64 範圍的值無法表示，截斷會讓不同的 position id 合併，直接報錯
+            if let Some(max) = ca.max().filter(|&m| m > i64::MAX as u64) {
+                polars_bail!(
+                    ComputeError: "{} out of range: {} exceeds i64::MAX", s.name(), max
+                );
+            }
+            Box::new(ca.into_iter().map(|v| v.map(|x| x as i64)))
+        },
+        dt => polars_bail!(
+            InvalidOperation: "expected an integer column for '{}', got {}", s.name(), dt
+        ),
+    })
+}
+
+/// 讀取並驗證 trades，無效的交易計入 diagnostics 後略過
+fn collect_trades(
+    len: usize,
+    position_id_arr: &Series,
+    entry_idx_arr: &Series,
+    exit_idx_arr: &Series,
+) -> PolarsResult<(Vec<Trade>, ReshapeDiagnostics)> {
+    let n = position_id_arr.len();
+    polars_ensure!(
+        entry_idx_arr.len() == n && exit_idx_arr.len() == n,
+        ShapeMismatch: "position_id_arr, entry_idx_arr and exit_idx_arr must have the same length"
+    );
+
+    let mut trades = Vec::with_capacity(n);
+    let mut diagnostics = ReshapeDiagnostics {
+        trades: n as i64,
+        ..Default::default()
+    };
+
+    let rows = int_values(position_id_arr)?
+        .zip(int_values(entry_idx_arr)?)
+        .zip(int_values(exit_idx_arr)?);
+    for ((pid, entry_idx), exit_idx) in rows {
+        let (Some(pid), Some(entry_idx), Some(exit_idx)) = (pid, entry_idx, exit_idx) else {
+            diagnostics.null += 1;
+            continue;
+        };
+        let in_range = |idx: i64| idx >= 0 && (idx as u64) < len as u64;
+        if !in_range(entry_idx) || !in_range(exit_idx) {
+            diagnostics.out_of_range += 1;
+            continue;
+        }
+        if entry_idx > exit_idx {
+            diagnostics.inverted += 1;
+            continue;
+        }
+        trades.push(Trade {
+            position_id: pid,
+            start: entry_idx as usize,
+            end: exit_idx as usize,
+        });
+    }
+    Ok((trades, diagnostics))
+}
+
+/// 依起點排序後掃描，標記與其他交易重疊的交易
+fn overlapping_flags(trades: &[Trade]) -> Vec<bool> {
+    let mut order: Vec<usize> = (0..trades.len()).collect();
+    order.sort_unstable_by_key(|&i| (trades[i].start, trades[i].end));
+
+    let mut flags = vec![false; trades.len()];
+    let mut holder: Option<usize> = None;
+    for &i in &order {
+        if let Some(h) = holder {
+            if trades[i].start <= trades[h].end {
+                flags[i] = true;
+                flags[h] = true;
+            }
+            if trades[i].end > trades[h].end {
+                holder = Some(i);
+            }
+        } else {
+            holder = Some(i);
+        }
+    }
+    flags
+}
+
+/// 交易之間是否互不重疊；已依起點排序時為 O(trades)
+fn is_disjoint(trades: &[Trade]) -> bool {
+    if trades.windows(2).all(|w| w[0].end < w[1].start) {
+        return true;
+    }
+    !overlapping_flags(trades).into_iter().any(|f| f)
+}
+
+/// 以「下一個未填位置」的並查集填入交易，每根 K 棒只寫入一次
+fn paint_trades<'a>(ret: &mut [i64], trades: impl Iterator<Item = &'a Trade>) {
+    fn find(next: &mut [usize], x: usize) -> usize {
+        let mut root = x;
+        while next[root] != root {
+            root = next[root];
+        }
+        let mut x = x;
+        while next[x] != root {
+            let parent = next[x];
+            next[x] = root;
+            x = parent;
+        }
+        root
+    }
+
+    let mut next: Vec<usize> = (0..=ret.len()).collect();
+    for trade in trades {
+        let mut j = find(&mut next, trade.start);
+        while j <= trade.end {
+            ret[j] = trade.position_id;
+            next[j] = j + 1;
+            j = find(&mut next, j + 1);
+        }
+    }
+}
+
+/// 依重疊處理方式建立長度為 len 的位置ID數組，成本為 O(K 棒數 + 交易數)
+fn reshape_trades(len: usize, trades: &[Trade], policy: OverlapPolicy) -> PolarsResult<Vec<i64>> {
+    if policy == OverlapPolicy::Count {
+        // 差分數組：起點 +1、終點後 -1，前綴和即為涵蓋次數
+        let mut diff = vec![0i64; len + 1];
+        for trade in trades {
+            diff[trade.start] += 1;
+            diff[trade.end + 1] -= 1;
+        }
+        let mut running = 0i64;
+        diff.truncate(len);
+        for value in diff.iter_mut() {
+            running += *value;
+            *value = running;
+        }
+        return Ok(diff);
+    }
+
+    let mut ret = vec![-1i64; len];
+    if is_disjoint(trades) {
+        // 互不重疊時總填入長度不超過 len
+        for trade in trades {
+            ret[trade.start..=trade.end].fill(trade.position_id);
+        }
+        return Ok(ret);
+    }
+
+    match policy {
+        OverlapPolicy::Error => {
+            let overlapping = overlapping_flags(trades).into_iter().filter(|&f| f).count();
+            polars_bail!(
+                ComputeError: "reshape_position_id_array: {} trades overlap", overlapping
+            )
+        },
+        OverlapPolicy::First => paint_trades(&mut ret, trades.iter()),
+        OverlapPolicy::Last => paint_trades(&mut ret, trades.iter().rev()),
+        OverlapPolicy::Count => unreachable!(),
+    }
+    Ok(ret)
+}
+
+fn ohlcv_len(ohlcv_lens: &Series) -> PolarsResult<usize> {
+    let value = ohlcv_lens
+        .cast(&DataType::Int64)?
+        .i64()?
+        .get(0)
+        .unwrap_or(0);
+    Ok(value.max(0) as usize)
+}
+
+#[derive(Deserialize)]
+struct ReshapePositionIdKwargs {
+    overlap: String,
+}
+
 /// 從 trades 建立 _position_id array
-#[polars_expr(output_type=Int64)]
-fn reshape_position_id_array(inputs: &[Series]) -> PolarsResult<Series> {
+#[polars_expr(output_type_func_with_kwargs=reshape_position_id_array_output_type)]
+fn reshape_position_id_array(
+    inputs: &[Series],
+    kwargs: ReshapePositionIdKwargs,
+) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("reshape_position_id_array", inputs);
     let ohlcv_lens = &inputs[0];
     let _position_id_arr = &inputs[1];
     let entry_idx_arr = &inputs[2];
     let exit_idx_arr = &inputs[3];
 
-    let ohlcv_lens_value = ohlcv_lens.i32()?.get(0).unwrap_or(0) as usize;
-    let _position_id_ca: &Int64Chunked = _position_id_arr.i64()?;
-    let entry_idx_ca: &Int64Chunked = entry_idx_arr.i64()?;
-    let exit_idx_ca: &Int64Chunked = exit_idx_arr.i64()?;
-
-    let mut ret = vec![-1i64; ohlcv_lens_value];
-
-    for i in 0.._position_id_ca.len() {
-        if let (Some(pid), Some(entry_idx), Some(exit_idx)) = (
-            _position_id_ca.get(i),
-            entry_idx_ca.get(i),
-            exit_idx_ca.get(i),
-        ) {
-            let entry_idx = entry_idx as usize;
-            let exit_idx = exit_idx as usize;
-
-            if entry_idx < ret.len() && exit_idx < ret.len() && entry_idx <= exit_idx {
-                for j in entry_idx..=exit_idx {
-                    ret[j] = pid;
-                }
+    reshape_position_id_series(
+        ohlcv_len(ohlcv_lens)?,
+        _position_id_arr,
+        entry_idx_arr,
+        exit_idx_arr,
+        OverlapPolicy::parse(&kwargs.overlap)?,
+    )
+}
+
+fn reshape_position_id_array_output_type(
+    _input_fields: &[Field],
+    kwargs: ReshapePositionIdKwargs,
+) -> PolarsResult<Field> {
+    let policy = OverlapPolicy::parse(&kwargs.overlap)?;
+    Ok(Field::new(policy.output_name().into(), DataType::Int64))
+}
+
+/// reshape_position_id_array 的核心，批次表達式與基準測試共用
+pub(crate) fn reshape_position_id_series(
+    len: usize,
+    position_id_arr: &Series,
+    entry_idx_arr: &Series,
+    exit_idx_arr: &Series,
+    policy: OverlapPolicy,
+) -> PolarsResult<Series> {
+    let (trades, _) = collect_trades(len, position_id_arr, entry_idx_arr, exit_idx_arr)?;
+    let ret = reshape_trades(len, &trades, policy)?;
+    Ok(Int64Chunked::from_vec(policy.output_name().into(), ret).into_series())
+}
+
+/// 統計 reshape_position_id_array 會拒絕或重疊的交易數
+#[polars_expr(output_type_func=reshape_position_id_diagnostics_output_type)]
+fn reshape_position_id_diagnostics(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("reshape_position_id_diagnostics", inputs);
+    let ohlcv_lens_value = ohlcv_len(&inputs[0])?;
+    let (trades, diagnostics) =
+        collect_trades(ohlcv_lens_value, &inputs[1], &inputs[2], &inputs[3])?;
+    let overlapping = overlapping_flags(&trades).into_iter().filter(|&f| f).count() as i64;
+
+    let fields = [
+        ("trades", diagnostics.trades),
+        ("applied", trades.len() as i64),
+        ("null", diagnostics.null),
+        ("out_of_range", diagnostics.out_of_range),
+        ("inverted", diagnostics.inverted),
+        ("overlapping", overlapping),
+    ]
+    .into_iter()
+    .map(|(name, value)| Int64Chunked::from_vec(name.into(), vec![value]).into_series())
+    .collect::<Vec<_>>();
+
+    profiling::build(|| {
+        Ok(StructChunked::from_series(
+            "reshape_position_id_diagnostics".into(),
+            1,
+            fields.iter(),
+        )?
+        .into_series())
+    })
+}
+
+fn reshape_position_id_diagnostics_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+    let fields = ["trades", "applied", "null", "out_of_range", "inverted", "overlapping"]
+        .into_iter()
+        .map(|name| Field::new(name.into(), DataType::Int64))
+        .collect();
+    Ok(Field::new(
+        "reshape_position_id_diagnostics".into(),
+        DataType::Struct(fields),
+    ))
+}
+
+/// 掃描中的持倉區段
+struct OpenTrade {
+    position_id: i64,
+    entry_idx: usize,
+}
+
+/// 交易列表的輸出緩衝區
+#[derive(Default)]
+struct TradesBuilder {
+    position_id: Vec<i64>,
+    entry_idx: Vec<i64>,
+    exit_idx: Vec<i64>,
+    closed: MutableBitmap,
+}
+
+impl TradesBuilder {
+    fn push(&mut self, trade: &OpenTrade, exit_idx: usize, closed: bool) {
+        self.position_id.push(trade.position_id);
+        self.entry_idx.push(trade.entry_idx as i64);
+        self.exit_idx.push(exit_idx as i64);
+        self.closed.push(closed);
+    }
+
+    fn finish(self, entry_price: &Prices, exit_price: &Prices) -> PolarsResult<Series> {
+        let len = self.position_id.len();
+        // 缺值在 Prices 中為 NaN，輸出時還原為 null
+        let price_at = |name: &str, prices: &Prices, idx: &[i64]| -> Series {
+            let values: Float64Chunked = idx
+                .iter()
+                .map(|&i| Some(prices.get(i as usize)).filter(|v| !v.is_nan()))
+                .collect();
+            values.with_name(name.into()).into_series()
+        };
+        let entry_prices = price_at("entry_price", entry_price, &self.entry_idx);
+        let exit_prices = price_at("exit_price", exit_price, &self.exit_idx);
+        let bars_held: Vec<i64> = self
+            .entry_idx
+            .iter()
+            .zip(&self.exit_idx)
+            .map(|(entry, exit)| exit - entry)
+            .collect();
+
+        let fields = vec![
+            Int64Chunked::from_vec("position_id".into(), self.position_id).into_series(),
+            Int64Chunked::from_vec("entry_idx".into(), self.entry_idx).into_series(),
+            Int64Chunked::from_vec("exit_idx".into(), self.exit_idx).into_series(),
+            entry_prices,
+            exit_prices,
+            Int64Chunked::from_vec("bars_held".into(), bars_held).into_series(),
+            BooleanChunked::from_bitmap("closed".into(), self.closed.into()).into_series(),
+        ];
+        Ok(StructChunked::from_series("trades".into(), len, fields.iter())?.into_series())
+    }
+}
+
+/// 由 clean_enex_position 的結果單次掃描產生交易列表
+///
+/// 每個連續且相同的 positions_out（>= 0）區段為一筆交易，
+/// 區段最後一根的 exits_out 為 True 表示已出場，否則為資料結尾仍持倉。
+#[polars_expr(output_type_func=extract_trades_output_type)]
+fn extract_trades(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("extract_trades", inputs);
+    let exits_ca: &BooleanChunked = inputs[0].bool()?;
+    let positions_ca: &Int64Chunked = inputs[1].i64()?;
+    let entry_price = Prices::new(&inputs[2])?;
+    let exit_price = Prices::new(&inputs[3])?;
+
+    let len = positions_ca.len();
+    polars_ensure!(
+        exits_ca.len() == len && entry_price.len() == len && exit_price.len() == len,
+        ShapeMismatch: "extract_trades: inputs must have the same length"
+    );
+
+    let mut builder = TradesBuilder::default();
+    let mut current: Option<OpenTrade> = None;
+    let mut prev_exit = false;
+
+    for (i, (position, exit)) in positions_ca.into_iter().zip(exits_ca).enumerate() {
+        let position = position.unwrap_or(-1);
+        let continues = matches!(&current, Some(trade) if trade.position_id == position);
+        if !continues {
+            if let Some(trade) = current.take() {
+                builder.push(&trade, i - 1, prev_exit);
+            }
+            if position >= 0 {
+                current = Some(OpenTrade {
+                    position_id: position,
+                    entry_idx: i,
+                });
             }
         }
+        prev_exit = exit.unwrap_or(false);
+    }
+    if let Some(trade) = current.take() {
+        builder.push(&trade, len - 1, prev_exit);
     }
 
-    Ok(Int64Chunked::new("_position_id".into(), ret).into_series())
+    profiling::build(|| builder.finish(&entry_price, &exit_price))
+}
+
+fn extract_trades_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+    let fields = vec![
+        Field::new("position_id".into(), DataType::Int64),
+        Field::new("entry_idx".into(), DataType::Int64),
+        Field::new("exit_idx".into(), DataType::Int64),
+        Field::new("entry_price".into(), DataType::Float64),
+        Field::new("exit_price".into(), DataType::Float64),
+        Field::new("bars_held".into(), DataType::Int64),
+        Field::new("closed".into(), DataType::Boolean),
+    ];
+    Ok(Field::new("trades".into(), DataType::Struct(fields)))
 }
@@ -0,0 +1,184 @@
+//! 插件函數的效能統計，預設關閉
+//!
+//! 開啟後每個 `#[polars_expr]` 函數記錄呼叫次數、處理列數、整體耗時、其中輸出建構
+//! （builder 轉為 Series 與 StructChunked 組裝，以 [`build`] 包裝）的耗時，
+//! 以及期間經由全域配置器配置的位元組數。關閉時每次呼叫只多一次 relaxed atomic 讀取。
+use std::alloc::{GlobalAlloc, Layout};
+use std::collections::BTreeMap;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::Mutex;
+use std::time::Instant;
+
+use polars::prelude::*;
+use pyo3::prelude::*;
+
+static ENABLED: AtomicBool = AtomicBool::new(false);
+static ALLOCATED: AtomicU64 = AtomicU64::new(0);
+static BUILD_NANOS: AtomicU64 = AtomicU64::new(0);
+static STATS: Mutex<BTreeMap<&'static str, FunctionStats>> = Mutex::new(BTreeMap::new());
+
+#[inline(always)]
+fn enabled() -> bool {
+    ENABLED.load(Ordering::Relaxed)
+}
+
+/// 單一函數的累計統計
+#[derive(Clone, Copy, Debug, Default)]
+struct FunctionStats {
+    calls: u64,
+    rows: u64,
+    nanos: u64,
+    build_nanos: u64,
+    bytes: u64,
+}
+
+/// 包裝全域配置器，統計開啟時累計配置的位元組數（不扣除釋放）
+pub(crate) struct CountingAllocator<A> {
+    inner: A,
+}
+
+impl<A> CountingAllocator<A> {
+    pub(crate) const fn new(inner: A) -> Self {
+        Self { inner }
+    }
+}
+
+unsafe impl<A: GlobalAlloc> GlobalAlloc for CountingAllocator<A> {
+    #[inline]
+    unsafe fn alloc(&self, layout: Layout) -> *mut u8 {
+        if enabled() {
+            ALLOCATED.fetch_add(layout.size() as u64, Ordering::Relaxed);
+        }
+        self.inner.alloc(layout)
+    }
+
+    #[inline]
+    unsafe fn alloc_zeroed(&self, layout: Layout) -> *mut u8 {
+        if enabled() {
+            ALLOCATED.fetch_add(layout.size() as u64, Ordering::Relaxed);
+        }
+        self.inner.alloc_zeroed(layout)
+    }
+
+    #[inline]
+    unsafe fn dealloc(&self, ptr: *mut u8, layout: Layout) {
+        self.inner.dealloc(ptr, layout)
+    }
+
+    #[inline]
+    unsafe fn realloc(&self, ptr: *mut u8, layout: Layout, new_size: usize) -> *mut u8 {
+        if enabled() && new_size > layout.size() {
+            ALLOCATED.fetch_add((new_size - layout.size()) as u64, Ordering::Relaxed);
+        }
+        self.inner.realloc(ptr, layout, new_size)
+    }
+}
+
+/// 量測輸出建構的耗時，統計關閉時直接執行
+///
+/// 平行的 builder 各自計時後相加，因此建構耗時為各執行緒的合計，可能超過整體耗時。
+#[inline(always)]
+pub(crate) fn build<T>(f: impl FnOnce() -> T) -> T {
+    if !enabled() {
+        return f();
+    }
+    let start = Instant::now();
+    let out = f();
+    BUILD_NANOS.fetch_add(start.elapsed().as_nanos() as u64, Ordering::Relaxed);
+    out
+}
+
+/// 範圍開始時的計時與累計值
+#[derive(Clone, Copy)]
+struct Mark {
+    start: Instant,
+    allocated: u64,
+    build_nanos: u64,
+}
+
+/// 一次插件呼叫的量測範圍，離開函數（輸出已建構完成）時寫入統計
+///
+/// 位元組數與建構耗時為期間全域累計值的差值，多個表達式同時執行時會互相計入，僅供參考。
+pub(crate) struct Scope {
+    name: &'static str,
+    rows: usize,
+    mark: Option<Mark>,
+}
+
+impl Scope {
+    #[inline(always)]
+    pub(crate) fn new(name: &'static str, inputs: &[Series]) -> Self {
+        if !enabled() {
+            return Self {
+                name,
+                rows: 0,
+                mark: None,
+            };
+        }
+        Self {
+            name,
+            rows: inputs.iter().map(|s| s.len()).max().unwrap_or(0),
+            mark: Some(Mark {
+                start: Instant::now(),
+                allocated: ALLOCATED.load(Ordering::Relaxed),
+                build_nanos: BUILD_NANOS.load(Ordering::Relaxed),
+            }),
+        }
+    }
+}
+
+impl Drop for Scope {
+    #[inline(always)]
+    fn drop(&mut self) {
+        let Some(mark) = self.mark else {
+            return;
+        };
+        let nanos = mark.start.elapsed().as_nanos() as u64;
+        let build_nanos = BUILD_NANOS.load(Ordering::Relaxed).saturating_sub(mark.build_nanos);
+        let bytes = ALLOCATED.load(Ordering::Relaxed).saturating_sub(mark.allocated);
+        if let Ok(mut stats) = STATS.lock() {
+            let entry = stats.entry(self.name).or_default();
+            entry.calls += 1;
+            entry.rows += self.rows as u64;
+            entry.nanos += nanos;
+            entry.build_nanos += build_nanos;
+            entry.bytes += bytes;
+        }
+    }
+}
+
+#[pyfunction]
+pub(crate) fn profiling_enable() {
+    ENABLED.store(true, Ordering::Relaxed);
+}
+
+#[pyfunction]
+pub(crate) fn profiling_disable() {
+    ENABLED.store(false, Ordering::Relaxed);
+}
+
+#[pyfunction]
+pub(crate) fn profiling_is_enabled() -> bool {
+    enabled()
+}
+
+#[pyfunction]
+pub(crate) fn profiling_reset() {
+    if let Ok(mut stats) = STATS.lock() {
+        stats.clear();
+    }
+}
+
+/// 返回 (function, calls, rows, nanos, build_nanos, bytes) 列表，依函數名稱排序
+#[pyfunction]
+pub(crate) fn profiling_stats() -> Vec<(String, u64, u64, u64, u64, u64)> {
+    let Ok(stats) = STATS.lock() else {
+        return Vec::new();
+    };
+    stats
+        .iter()
+        .map(|(name, s)| {
+            (name.to_string(), s.calls, s.rows, s.nanos, s.build_nanos, s.bytes)
+        })
+        .collect()
+}
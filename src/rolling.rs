@@ -0,0 +1,378 @@
+#![allow(clippy::unused_unit)]
+use std::collections::VecDeque;
+
+use polars::prelude::*;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+
+use crate::profiling;
+use crate::supertrend::into_validity;
+use crate::values::{Precision, Prices};
+
+/// 移動平均的平滑方式
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub(crate) enum Smoothing {
+    /// Wilder 平滑（與 TA-Lib ATR 相同）
+    Rma,
+    Sma,
+    Ema,
+}
+
+impl Smoothing {
+    pub(crate) fn parse(value: &str) -> PolarsResult<Self> {
+        match value.to_ascii_lowercase().as_str() {
+            "rma" | "wilder" => Ok(Self::Rma),
+            "sma" => Ok(Self::Sma),
+            "ema" => Ok(Self::Ema),
+            _ => polars_bail!(
+                InvalidOperation: "unknown smoothing '{}', expected one of 'rma', 'sma', 'ema'", value
+            ),
+        }
+    }
+
+    pub(crate) fn name(self) -> &'static str {
+        match self {
+            Self::Rma => "rma",
+            Self::Sma => "sma",
+            Self::Ema => "ema",
+        }
+    }
+}
+
+/// 移動平均的遞迴狀態，每列 O(1)
+///
+/// 與 TA-Lib 相同，累積滿 period 個有效值後以簡單平均作為初始值，之後依平滑方式遞推；
+/// 尚未就緒時輸出 NaN。缺值（NaN）時該列輸出 NaN 且不更新狀態。
+#[derive(Clone, Debug)]
+pub(crate) struct MovingAverage {
+    pub(crate) period: usize,
+    pub(crate) smoothing: Smoothing,
+    pub(crate) count: usize,
+    pub(crate) sum: f64,
+    pub(crate) window: VecDeque<f64>,
+    pub(crate) value: f64,
+}
+
+impl MovingAverage {
+    pub(crate) fn new(period: usize, smoothing: Smoothing) -> PolarsResult<Self> {
+        polars_ensure!(period > 0, InvalidOperation: "period must be positive");
+        let window = match smoothing {
+            Smoothing::Sma => VecDeque::with_capacity(period),
+            _ => VecDeque::new(),
+        };
+        Ok(Self {
+            period,
+            smoothing,
+            count: 0,
+            sum: 0.0,
+            window,
+            value: f64::NAN,
+        })
+    }
+
+    #[inline(always)]
+    pub(crate) fn update(&mut self, x: f64) -> f64 {
+        if x.is_nan() {
+            return f64::NAN;
+        }
+
+        let period = self.period as f64;
+        if self.count < self.period {
+            self.count += 1;
+            self.sum += x;
+            if self.smoothing == Smoothing::Sma {
+                self.window.push_back(x);
+            }
+            if self.count == self.period {
+                self.value = self.sum / period;
+            }
+            return self.value;
+        }
+
+        self.value = match self.smoothing {
+            Smoothing::Rma => (self.value * (period - 1.0) + x) / period,
+            Smoothing::Ema => (x - self.value) * (2.0 / (period + 1.0)) + self.value,
+            Smoothing::Sma => {
+                let oldest = self.window.pop_front().unwrap_or(0.0);
+                self.window.push_back(x);
+                self.sum += x - oldest;
+                self.sum / period
+            },
+        };
+        self.value
+    }
+
+    /// 試算下一個值，不更新狀態
+    #[inline(always)]
+    pub(crate) fn peek(&self, x: f64) -> f64 {
+        if x.is_nan() {
+            return f64::NAN;
+        }
+
+        let period = self.period as f64;
+        if self.count < self.period {
+            return if self.count + 1 == self.period {
+                (self.sum + x) / period
+            } else {
+                self.value
+            };
+        }
+
+        match self.smoothing {
+            Smoothing::Rma => (self.value * (period - 1.0) + x) / period,
+            Smoothing::Ema => (x - self.value) * (2.0 / (period + 1.0)) + self.value,
+            Smoothing::Sma => {
+                let oldest = self.window.front().copied().unwrap_or(0.0);
+                (self.sum + x - oldest) / period
+            },
+        }
+    }
+}
+
+/// True Range，任一輸入缺值（包含前收盤價）時為 NaN
+#[inline(always)]
+pub(crate) fn true_range_value(h: f64, l: f64, c_prev: f64) -> f64 {
+    if h.is_nan() || l.is_nan() || c_prev.is_nan() {
+        return f64::NAN;
+    }
+    (h - l).max((c_prev - h).abs()).max((l - c_prev).abs())
+}
+
+/// True Range 與 ATR 的遞迴狀態
+///
+/// 第一根沒有前收盤價，因此與 TA-Lib 相同從第二根開始計算 TR，再交由 MovingAverage 平滑。
+#[derive(Clone, Debug)]
+pub(crate) struct AtrState {
+    pub(crate) prev_close: f64,
+    pub(crate) average: MovingAverage,
+}
+
+impl AtrState {
+    pub(crate) fn new(period: usize, smoothing: Smoothing) -> PolarsResult<Self> {
+        Ok(Self {
+            prev_close: f64::NAN,
+            average: MovingAverage::new(period, smoothing)?,
+        })
+    }
+
+    /// 推進一根 K 棒，返回當前 ATR（尚未就緒或缺值時為 NaN）
+    #[inline(always)]
+    pub(crate) fn update(&mut self, h: f64, l: f64, c: f64) -> f64 {
+        let tr = true_range_value(h, l, self.prev_close);
+        self.prev_close = c;
+        self.average.update(tr)
+    }
+
+    /// 以一根尚未完成的 K 棒試算 ATR，不更新狀態（TR 只需要前收盤價）
+    #[inline(always)]
+    pub(crate) fn peek(&self, h: f64, l: f64) -> f64 {
+        self.average.peek(true_range_value(h, l, self.prev_close))
+    }
+}
+
+/// 以單調佇列維護的滾動最大/最小值，每列攤銷 O(1)
+///
+/// 視窗為最近 period 列（以列數計），缺值不進入佇列；累積不足 period 列或
+/// 視窗內全為缺值時輸出 NaN。
+#[derive(Clone, Debug)]
+pub(crate) struct RollingExtremum {
+    period: usize,
+    maximum: bool,
+    idx: usize,
+    deque: VecDeque<(usize, f64)>,
+}
+
+impl RollingExtremum {
+    pub(crate) fn new(period: usize, maximum: bool) -> PolarsResult<Self> {
+        polars_ensure!(period > 0, InvalidOperation: "period must be positive");
+        Ok(Self {
+            period,
+            maximum,
+            idx: 0,
+            deque: VecDeque::with_capacity(period),
+        })
+    }
+
+    #[inline(always)]
+    pub(crate) fn update(&mut self, x: f64) -> f64 {
+        let i = self.idx;
+        self.idx += 1;
+
+        if !x.is_nan() {
+            let maximum = self.maximum;
+            while let Some(&(_, back)) = self.deque.back() {
+                let dominated = if maximum { back <= x } else { back >= x };
+                if !dominated {
+                    break;
+                }
+                self.deque.pop_back();
+            }
+            self.deque.push_back((i, x));
+        }
+        while let Some(&(j, _)) = self.deque.front() {
+            if j + self.period > i {
+                break;
+            }
+            self.deque.pop_front();
+        }
+
+        match self.deque.front() {
+            Some(&(_, value)) if i + 1 >= self.period => value,
+            _ => f64::NAN,
+        }
+    }
+}
+
+/// 將 NaN 視為缺值，以指定精度輸出
+fn float_series(name: PlSmallStr, values: Vec<f64>, precision: Precision) -> Series {
+    let validity = into_validity(values.iter().map(|v| !v.is_nan()).collect());
+    precision.series(name, values, validity)
+}
+
+/// 以逐列狀態機掃描單一數值序列，原生型別的連續緩衝區直接讀取
+fn scan_values(
+    s: &Series,
+    precision: Precision,
+    mut update: impl FnMut(f64) -> f64,
+) -> PolarsResult<Series> {
+    let values = Prices::new(s)?;
+    let out: Vec<f64> = (0..values.len()).map(|i| update(values.get(i))).collect();
+    Ok(float_series(s.name().clone(), out, precision))
+}
+
+#[derive(Deserialize)]
+struct MovingAverageKwargs {
+    period: usize,
+    smoothing: String,
+    output_dtype: String,
+}
+
+// 移動平均 - RMA/EMA/SMA，以前 period 個有效值的簡單平均作為初始值
+#[polars_expr(output_type_func_with_kwargs=moving_average_output_type)]
+fn moving_average(inputs: &[Series], kwargs: MovingAverageKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("moving_average", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let mut average = MovingAverage::new(kwargs.period, Smoothing::parse(&kwargs.smoothing)?)?;
+    scan_values(&inputs[0], precision, |x| average.update(x))
+}
+
+fn moving_average_output_type(
+    input_fields: &[Field],
+    kwargs: MovingAverageKwargs,
+) -> PolarsResult<Field> {
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    Ok(Field::new(input_fields[0].name().clone(), precision.dtype()))
+}
+
+#[derive(Deserialize)]
+struct RollingExtremumKwargs {
+    period: usize,
+    maximum: bool,
+    output_dtype: String,
+}
+
+// 滾動最大/最小值 - 單調佇列，每列攤銷 O(1)
+#[polars_expr(output_type_func_with_kwargs=rolling_extremum_output_type)]
+fn rolling_extremum(inputs: &[Series], kwargs: RollingExtremumKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("rolling_extremum", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let mut extremum = RollingExtremum::new(kwargs.period, kwargs.maximum)?;
+    scan_values(&inputs[0], precision, |x| extremum.update(x))
+}
+
+fn rolling_extremum_output_type(
+    input_fields: &[Field],
+    kwargs: RollingExtremumKwargs,
+) -> PolarsResult<Field> {
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    Ok(Field::new(input_fields[0].name().clone(), precision.dtype()))
+}
+
+fn ohlc_values<'a>(inputs: &'a [Series], name: &str) -> PolarsResult<[Prices<'a>; 3]> {
+    let high = Prices::new(&inputs[0])?;
+    let low = Prices::new(&inputs[1])?;
+    let close = Prices::new(&inputs[2])?;
+    polars_ensure!(
+        low.len() == high.len() && close.len() == high.len(),
+        ShapeMismatch: "{}: high, low and close must have the same length", name
+    );
+    Ok([high, low, close])
+}
+
+#[derive(Deserialize)]
+struct TrueRangeKwargs {
+    output_dtype: String,
+}
+
+// True Range - 第一根沒有前收盤價，輸出 null
+#[polars_expr(output_type_func_with_kwargs=true_range_output_type)]
+fn true_range(inputs: &[Series], kwargs: TrueRangeKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("true_range", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let [high, low, close] = ohlc_values(inputs, "true_range")?;
+
+    let mut out = Vec::with_capacity(high.len());
+    let mut c_prev = f64::NAN;
+    for i in 0..high.len() {
+        out.push(true_range_value(high.get(i), low.get(i), c_prev));
+        c_prev = close.get(i);
+    }
+    Ok(float_series("true_range".into(), out, precision))
+}
+
+fn true_range_output_type(
+    _input_fields: &[Field],
+    kwargs: TrueRangeKwargs,
+) -> PolarsResult<Field> {
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    Ok(Field::new("true_range".into(), precision.dtype()))
+}
+
+// ATR - 單次掃描計算 True Range 並平滑
+#[polars_expr(output_type_func_with_kwargs=atr_output_type)]
+fn atr(inputs: &[Series], kwargs: MovingAverageKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("atr", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let smoothing = Smoothing::parse(&kwargs.smoothing)?;
+    atr_series(inputs, kwargs.period, smoothing, precision)
+}
+
+/// atr 的核心，inputs 為 high, low, close；表達式與 indicator_bundle 共用
+pub(crate) fn atr_series(
+    inputs: &[Series],
+    period: usize,
+    smoothing: Smoothing,
+    precision: Precision,
+) -> PolarsResult<Series> {
+    let mut state = AtrState::new(period, smoothing)?;
+    atr_with_state(inputs, &mut state, precision)
+}
+
+/// 從給定狀態接續計算 ATR，批次表達式與增量狀態物件共用此核心
+pub(crate) fn atr_with_state(
+    inputs: &[Series],
+    state: &mut AtrState,
+    precision: Precision,
+) -> PolarsResult<Series> {
+    let [high, low, close] = ohlc_values(inputs, "atr")?;
+    Ok(atr_prices(&high, &low, &close, state, precision))
+}
+
+/// 以已建立的 Prices 檢視計算 ATR，供 indicator_bundle 在多個指標間共用輸入
+pub(crate) fn atr_prices(
+    high: &Prices,
+    low: &Prices,
+    close: &Prices,
+    state: &mut AtrState,
+    precision: Precision,
+) -> Series {
+    let out: Vec<f64> = (0..high.len())
+        .map(|i| state.update(high.get(i), low.get(i), close.get(i)))
+        .collect();
+    float_series("atr".into(), out, precision)
+}
+
+fn atr_output_type(_input_fields: &[Field], kwargs: MovingAverageKwargs) -> PolarsResult<Field> {
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    Ok(Field::new("atr".into(), precision.dtype()))
+}
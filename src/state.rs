@@ -0,0 +1,401 @@
+use polars::prelude::*;
+use pyo3::prelude::*;
+use pyo3::types::PyDict;
+use pyo3_polars::error::PyPolarsErr;
+use pyo3_polars::PySeries;
+
+use crate::position::{clean_enex_with_state, EnexState};
+use crate::rolling::{atr_with_state, AtrState, Smoothing};
+use crate::supertrend::{supertrend_with_state, SuperTrendState};
+use crate::values::Precision;
+
+/// SuperTrend 增量狀態物件，供即時 K 棒逐根或小批次更新
+///
+/// 與 `supertrend` 表達式共用同一個狀態機，因此逐根更新的結果與批次計算完全一致。
+#[pyclass(name = "SuperTrendState", module = "polars_indicator._internal")]
+#[derive(Clone)]
+pub struct PySuperTrendState {
+    pub(crate) inner: SuperTrendState,
+}
+
+#[pymethods]
+impl PySuperTrendState {
+    #[new]
+    #[pyo3(signature = (upper_multiplier=2.0, lower_multiplier=2.0))]
+    fn new(upper_multiplier: f64, lower_multiplier: f64) -> Self {
+        Self {
+            inner: SuperTrendState::new(upper_multiplier, lower_multiplier),
+        }
+    }
+
+    /// 以歷史資料建立狀態，會重播整段歷史（O(n)），之後以 update 逐根推進
+    ///
+    /// 已有前一次計算的結果時，改用 from_bands 或 from_dict 以 O(1) 接續。
+    #[staticmethod]
+    #[pyo3(signature = (high, low, close, atr, upper_multiplier=2.0, lower_multiplier=2.0))]
+    fn from_history(
+        py: Python<'_>,
+        high: PySeries,
+        low: PySeries,
+        close: PySeries,
+        atr: PySeries,
+        upper_multiplier: f64,
+        lower_multiplier: f64,
+    ) -> PyResult<Self> {
+        let mut state = Self::new(upper_multiplier, lower_multiplier);
+        state.update_batch(py, high, low, close, atr)?;
+        Ok(state)
+    }
+
+    /// 以前一次計算最後一根 K 棒的方向、上下軌與收盤價建立狀態，不重播歷史
+    ///
+    /// 表達式輸出只含當前方向的軌道（long 為下軌、short 為上軌），另一條軌道
+    /// 需取自前一次的狀態物件（upper_band / lower_band）。
+    #[staticmethod]
+    #[pyo3(signature = (direction, upper_band, lower_band, close, upper_multiplier=2.0, lower_multiplier=2.0))]
+    fn from_bands(
+        direction: i32,
+        upper_band: f64,
+        lower_band: f64,
+        close: Option<f64>,
+        upper_multiplier: f64,
+        lower_multiplier: f64,
+    ) -> PyResult<Self> {
+        if direction != 1 && direction != -1 {
+            return Err(pyo3::exceptions::PyValueError::new_err(format!(
+                "direction must be 1 or -1, got {direction}"
+            )));
+        }
+        Ok(Self {
+            inner: SuperTrendState {
+                is_first: false,
+                prev_close: close.unwrap_or(f64::NAN),
+                prev_direction: direction,
+                prev_upper_band: upper_band,
+                prev_lower_band: lower_band,
+                ..SuperTrendState::new(upper_multiplier, lower_multiplier)
+            },
+        })
+    }
+
+    /// 推進一根 K 棒，返回 (direction, long, short, trend)，輸入有缺值時返回 None
+    #[pyo3(signature = (high, low, close, atr))]
+    fn update(
+        &mut self,
+        high: Option<f64>,
+        low: Option<f64>,
+        close: Option<f64>,
+        atr: Option<f64>,
+    ) -> Option<(i32, Option<f64>, Option<f64>, f64)> {
+        self.inner
+            .update(
+                high.unwrap_or(f64::NAN),
+                low.unwrap_or(f64::NAN),
+                close.unwrap_or(f64::NAN),
+                atr.unwrap_or(f64::NAN),
+            )
+            .map(|bar| {
+                let long = (bar.direction > 0).then_some(bar.lower_band);
+                let short = (bar.direction < 0).then_some(bar.upper_band);
+                (bar.direction, long, short, bar.trend())
+            })
+    }
+
+    /// 推進一批 K 棒，返回與 supertrend 表達式相同的結構體 Series
+    fn update_batch(
+        &mut self,
+        py: Python<'_>,
+        high: PySeries,
+        low: PySeries,
+        close: PySeries,
+        atr: PySeries,
+    ) -> PyResult<PySeries> {
+        let state = &mut self.inner;
+        let out = py.allow_threads(|| -> PolarsResult<Series> {
+            let (high, low, close, atr) = (&high.0, &low.0, &close.0, &atr.0);
+            let len = high.len();
+            polars_ensure!(
+                low.len() == len && close.len() == len && atr.len() == len,
+                ShapeMismatch: "update_batch: high, low, close and atr must have the same length"
+            );
+            supertrend_with_state(&[high, low, close, atr], state, Precision::Float64)
+        });
+        Ok(PySeries(out.map_err(PyPolarsErr::from)?))
+    }
+
+    /// 導出完整狀態，可持久化後以 from_dict 還原
+    fn to_dict<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let s = &self.inner;
+        let dict = PyDict::new(py);
+        dict.set_item("upper_multiplier", s.upper_multiplier)?;
+        dict.set_item("lower_multiplier", s.lower_multiplier)?;
+        dict.set_item("is_first", s.is_first)?;
+        dict.set_item("prev_close", (!s.prev_close.is_nan()).then_some(s.prev_close))?;
+        dict.set_item("prev_direction", s.prev_direction)?;
+        dict.set_item("prev_upper_band", s.prev_upper_band)?;
+        dict.set_item("prev_lower_band", s.prev_lower_band)?;
+        Ok(dict)
+    }
+
+    /// 由 to_dict 的結果還原狀態
+    #[staticmethod]
+    fn from_dict(state: &Bound<'_, PyDict>) -> PyResult<Self> {
+        fn get<'py, T: FromPyObject<'py>>(state: &Bound<'py, PyDict>, key: &str) -> PyResult<T> {
+            match state.get_item(key)? {
+                Some(value) => value.extract(),
+                None => Err(pyo3::exceptions::PyKeyError::new_err(key.to_string())),
+            }
+        }
+        let prev_close: Option<f64> = get(state, "prev_close")?;
+        Ok(Self {
+            inner: SuperTrendState {
+                upper_multiplier: get(state, "upper_multiplier")?,
+                lower_multiplier: get(state, "lower_multiplier")?,
+                is_first: get(state, "is_first")?,
+                prev_close: prev_close.unwrap_or(f64::NAN),
+                prev_direction: get(state, "prev_direction")?,
+                prev_upper_band: get(state, "prev_upper_band")?,
+                prev_lower_band: get(state, "prev_lower_band")?,
+            },
+        })
+    }
+
+    fn copy(&self) -> Self {
+        self.clone()
+    }
+
+    #[getter]
+    fn direction(&self) -> i32 {
+        self.inner.prev_direction
+    }
+
+    #[getter]
+    fn upper_band(&self) -> f64 {
+        self.inner.prev_upper_band
+    }
+
+    #[getter]
+    fn lower_band(&self) -> f64 {
+        self.inner.prev_lower_band
+    }
+
+    fn __repr__(&self) -> String {
+        format!(
+            "SuperTrendState(direction={}, upper_band={}, lower_band={})",
+            self.inner.prev_direction, self.inner.prev_upper_band, self.inner.prev_lower_band
+        )
+    }
+}
+
+/// ATR 增量狀態物件，供即時 K 棒逐根或分批更新
+///
+/// 與 `atr` 表達式共用同一個狀態機，分批更新的結果與整段計算完全一致；
+/// 搭配 SuperTrendState 即可在不預先計算 atr 欄位的情況下接續 supertrend_from_ohlc。
+#[pyclass(name = "AtrState", module = "polars_indicator._internal")]
+#[derive(Clone)]
+pub struct PyAtrState {
+    pub(crate) inner: AtrState,
+}
+
+impl PyAtrState {
+    fn build(period: usize, smoothing: &str) -> PolarsResult<AtrState> {
+        AtrState::new(period, Smoothing::parse(smoothing)?)
+    }
+}
+
+#[pymethods]
+impl PyAtrState {
+    #[new]
+    #[pyo3(signature = (period=14, smoothing="rma"))]
+    fn new(period: usize, smoothing: &str) -> PyResult<Self> {
+        let inner = Self::build(period, smoothing)
+            .map_err(|err| pyo3::exceptions::PyValueError::new_err(err.to_string()))?;
+        Ok(Self { inner })
+    }
+
+    /// 推進一根 K 棒，返回當前 ATR，尚未就緒或輸入有缺值時返回 None
+    #[pyo3(signature = (high, low, close))]
+    fn update(&mut self, high: Option<f64>, low: Option<f64>, close: Option<f64>) -> Option<f64> {
+        let atr = self.inner.update(
+            high.unwrap_or(f64::NAN),
+            low.unwrap_or(f64::NAN),
+            close.unwrap_or(f64::NAN),
+        );
+        (!atr.is_nan()).then_some(atr)
+    }
+
+    /// 推進一批 K 棒，返回與 atr 表達式相同的 Float64 Series
+    fn update_batch(
+        &mut self,
+        py: Python<'_>,
+        high: PySeries,
+        low: PySeries,
+        close: PySeries,
+    ) -> PyResult<PySeries> {
+        let state = &mut self.inner;
+        let out = py
+            .allow_threads(|| atr_with_state(&[high.0, low.0, close.0], state, Precision::Float64));
+        Ok(PySeries(out.map_err(PyPolarsErr::from)?))
+    }
+
+    /// 導出完整狀態，可持久化後以 from_dict 還原
+    fn to_dict<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let s = &self.inner;
+        let average = &s.average;
+        let dict = PyDict::new(py);
+        dict.set_item("period", average.period)?;
+        dict.set_item("smoothing", average.smoothing.name())?;
+        dict.set_item("prev_close", (!s.prev_close.is_nan()).then_some(s.prev_close))?;
+        dict.set_item("count", average.count)?;
+        dict.set_item("sum", average.sum)?;
+        dict.set_item("window", average.window.iter().copied().collect::<Vec<f64>>())?;
+        dict.set_item("value", (!average.value.is_nan()).then_some(average.value))?;
+        Ok(dict)
+    }
+
+    /// 由 to_dict 的結果還原狀態
+    #[staticmethod]
+    fn from_dict(state: &Bound<'_, PyDict>) -> PyResult<Self> {
+        fn get<'py, T: FromPyObject<'py>>(state: &Bound<'py, PyDict>, key: &str) -> PyResult<T> {
+            match state.get_item(key)? {
+                Some(value) => value.extract(),
+                None => Err(pyo3::exceptions::PyKeyError::new_err(key.to_string())),
+            }
+        }
+        let period: usize = get(state, "period")?;
+        let smoothing: String = get(state, "smoothing")?;
+        let count: usize = get(state, "count")?;
+        let window: Vec<f64> = get(state, "window")?;
+        if count > period || window.len() > period {
+            return Err(pyo3::exceptions::PyValueError::new_err(format!(
+                "count and window must not exceed period {period}"
+            )));
+        }
+
+        let mut result = Self::new(period, &smoothing)?;
+        let prev_close: Option<f64> = get(state, "prev_close")?;
+        let value: Option<f64> = get(state, "value")?;
+        let inner = &mut result.inner;
+        inner.prev_close = prev_close.unwrap_or(f64::NAN);
+        inner.average.count = count;
+        inner.average.sum = get(state, "sum")?;
+        inner.average.window = window.into();
+        inner.average.value = value.unwrap_or(f64::NAN);
+        Ok(result)
+    }
+
+    fn copy(&self) -> Self {
+        self.clone()
+    }
+
+    #[getter]
+    fn period(&self) -> usize {
+        self.inner.average.period
+    }
+
+    #[getter]
+    fn smoothing(&self) -> &'static str {
+        self.inner.average.smoothing.name()
+    }
+
+    #[getter]
+    fn value(&self) -> Option<f64> {
+        let value = self.inner.average.value;
+        (!value.is_nan()).then_some(value)
+    }
+
+    fn __repr__(&self) -> String {
+        format!(
+            "AtrState(period={}, smoothing='{}', value={})",
+            self.inner.average.period,
+            self.inner.average.smoothing.name(),
+            self.inner.average.value
+        )
+    }
+}
+
+/// 進出場信號清理的增量狀態物件，供分批（例如串流讀取）依序處理
+///
+/// 與 `clean_enex_position` 表達式共用同一個狀態機，分批更新的結果與整段計算完全一致。
+#[pyclass(name = "EnexPositionState", module = "polars_indicator._internal")]
+#[derive(Clone)]
+pub struct PyEnexPositionState {
+    inner: EnexState,
+}
+
+#[pymethods]
+impl PyEnexPositionState {
+    #[new]
+    #[pyo3(signature = (entry_first=true, phase=-1, position_id=-1))]
+    fn new(entry_first: bool, phase: i32, position_id: i64) -> PyResult<Self> {
+        let inner = EnexState::with_state(entry_first, phase, position_id)
+            .map_err(|err| pyo3::exceptions::PyValueError::new_err(err.to_string()))?;
+        Ok(Self { inner })
+    }
+
+    /// 推進一批信號，返回與 clean_enex_position 表達式相同的結構體 Series
+    fn update_batch(
+        &mut self,
+        py: Python<'_>,
+        entries: PySeries,
+        exits: PySeries,
+    ) -> PyResult<PySeries> {
+        let state = &mut self.inner;
+        let out = py.allow_threads(|| -> PolarsResult<Series> {
+            let (entries, exits) = (&entries.0, &exits.0);
+            polars_ensure!(
+                exits.len() == entries.len(),
+                ShapeMismatch: "update_batch: entries and exits must have the same length"
+            );
+            clean_enex_with_state(entries, exits, state)
+        });
+        Ok(PySeries(out.map_err(PyPolarsErr::from)?))
+    }
+
+    /// 導出完整狀態，可持久化後以 from_dict 還原
+    fn to_dict<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let dict = PyDict::new(py);
+        dict.set_item("entry_first", self.inner.entry_first())?;
+        dict.set_item("phase", self.inner.phase())?;
+        dict.set_item("position_id", self.inner.position_id())?;
+        Ok(dict)
+    }
+
+    /// 由 to_dict 的結果還原狀態
+    #[staticmethod]
+    fn from_dict(state: &Bound<'_, PyDict>) -> PyResult<Self> {
+        let get = |key: &str| -> PyResult<Bound<'_, PyAny>> {
+            match state.get_item(key)? {
+                Some(value) => Ok(value),
+                None => Err(pyo3::exceptions::PyKeyError::new_err(key.to_string())),
+            }
+        };
+        Self::new(
+            get("entry_first")?.extract()?,
+            get("phase")?.extract()?,
+            get("position_id")?.extract()?,
+        )
+    }
+
+    fn copy(&self) -> Self {
+        self.clone()
+    }
+
+    #[getter]
+    fn phase(&self) -> i32 {
+        self.inner.phase()
+    }
+
+    #[getter]
+    fn position_id(&self) -> i64 {
+        self.inner.position_id()
+    }
+
+    fn __repr__(&self) -> String {
+        format!(
+            "EnexPositionState(phase={}, position_id={})",
+            self.inner.phase(),
+            self.inner.position_id()
+        )
+    }
+}
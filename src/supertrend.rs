@@ -1,236 +1,641 @@
 #![allow(clippy::unused_unit)]
 use polars::prelude::*;
+use polars_arrow::bitmap::{Bitmap, MutableBitmap};
 use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
+use serde::Deserialize;
+
+use crate::groups::{batch_range, group_slices, par_map_groups};
+use crate::profiling;
+use crate::rolling::{AtrState, Smoothing};
+use crate::values::{map_chunks, Precision, Prices};
+
+/// 單根 K 棒的 SuperTrend 計算結果
+#[derive(Clone, Copy, Debug)]
+pub(crate) struct SuperTrendBar {
+    pub(crate) direction: i32,
+    pub(crate) upper_band: f64,
+    pub(crate) lower_band: f64,
+}
 
-// SuperTrend 計算函數 - 返回結構包含 direction, long, short, trend
-#[polars_expr(output_type_func=supertrend_output_type)]
-fn supertrend(inputs: &[Series]) -> PolarsResult<Series> {
-    let high = &inputs[0];
-    let low = &inputs[1];
-    let close = &inputs[2];
-    let atr = &inputs[3];
-    let upper_multiplier = &inputs[4];
-    let lower_multiplier = &inputs[5];
-
-    let high_ca: &Float64Chunked = high.f64()?;
-    let low_ca: &Float64Chunked = low.f64()?;
-    let close_ca: &Float64Chunked = close.f64()?;
-    let atr_ca: &Float64Chunked = atr.f64()?;
-    let upper_mult = upper_multiplier.f64()?.get(0).unwrap_or(3.0);
-    let lower_mult = lower_multiplier.f64()?.get(0).unwrap_or(3.0);
-
-    let len = high_ca.len();
-
-    let mut direction_values = Vec::with_capacity(len);
-    let mut long_values = Vec::with_capacity(len);
-    let mut short_values = Vec::with_capacity(len);
-    let mut trend_values = Vec::with_capacity(len);
-
-    let mut prev_direction = 1i32;
-    let mut prev_upper_band = 0.0f64;
-    let mut prev_lower_band = 0.0f64;
+impl SuperTrendBar {
+    #[inline(always)]
+    pub(crate) fn trend(&self) -> f64 {
+        if self.direction > 0 {
+            self.lower_band
+        } else {
+            self.upper_band
+        }
+    }
+}
 
-    for i in 0..len {
-        let h = high_ca.get(i);
-        let l = low_ca.get(i);
-        let c = close_ca.get(i);
-        let atr_val = atr_ca.get(i);
-
-        // 處理 None 或 NaN 值
-        let h_valid = h.filter(|&x| !x.is_nan());
-        let l_valid = l.filter(|&x| !x.is_nan());
-        let c_valid = c.filter(|&x| !x.is_nan());
-        let atr_valid = atr_val.filter(|&x| !x.is_nan());
-
-        if h_valid.is_none() || l_valid.is_none() || c_valid.is_none() || atr_valid.is_none() {
-            direction_values.push(None);
-            long_values.push(None);
-            short_values.push(None);
-            trend_values.push(None);
-            continue;
+/// SuperTrend 遞迴狀態，保存前一根的方向與上下軌
+///
+/// 缺值（None 或 NaN）一律以 NaN 傳入，與原本逐列檢查 None/NaN 的語意相同。
+#[derive(Clone, Copy, Debug)]
+pub(crate) struct SuperTrendState {
+    pub(crate) upper_multiplier: f64,
+    pub(crate) lower_multiplier: f64,
+    pub(crate) is_first: bool,
+    pub(crate) prev_close: f64,
+    pub(crate) prev_direction: i32,
+    pub(crate) prev_upper_band: f64,
+    pub(crate) prev_lower_band: f64,
+}
+
+impl SuperTrendState {
+    pub(crate) fn new(upper_multiplier: f64, lower_multiplier: f64) -> Self {
+        Self {
+            upper_multiplier,
+            lower_multiplier,
+            is_first: true,
+            prev_close: f64::NAN,
+            prev_direction: 1,
+            prev_upper_band: 0.0,
+            prev_lower_band: 0.0,
         }
+    }
+
+    /// 推進一根 K 棒，輸入有缺值時返回 None
+    #[inline(always)]
+    pub(crate) fn update(&mut self, h: f64, l: f64, c: f64, atr: f64) -> Option<SuperTrendBar> {
+        let is_first = self.is_first;
+        let c_prev = self.prev_close;
+        self.is_first = false;
+        self.prev_close = c;
 
-        let h = h_valid.unwrap();
-        let l = l_valid.unwrap();
-        let c = c_valid.unwrap();
-        let atr_val = atr_valid.unwrap();
+        if h.is_nan() || l.is_nan() || c.is_nan() || atr.is_nan() {
+            return None;
+        }
 
         let hl2 = (h + l) / 2.0;
-        let mut upper_band = hl2 + (upper_mult * atr_val);
-        let mut lower_band = hl2 - (lower_mult * atr_val);
+        let mut upper_band = hl2 + (self.upper_multiplier * atr);
+        let mut lower_band = hl2 - (self.lower_multiplier * atr);
 
         // 計算最終的 bands
-        if i > 0 {
-            let c_prev = close_ca.get(i - 1);
-            let c_prev_valid = c_prev.filter(|&x| !x.is_nan());
-            if c_prev_valid.is_none() {
-                // 如果前一個 close 是 None 或 NaN，當前值也應該是 None
-                direction_values.push(None);
-                long_values.push(None);
-                short_values.push(None);
-                trend_values.push(None);
-                continue;
+        if !is_first {
+            // 如果前一個 close 是 None 或 NaN，當前值也應該是 None
+            if c_prev.is_nan() {
+                return None;
             }
-            let c_prev = c_prev_valid.unwrap();
 
-            if upper_band < prev_upper_band || c_prev > prev_upper_band {
-                // 保持上軌
-            } else {
-                upper_band = prev_upper_band;
+            if !(upper_band < self.prev_upper_band || c_prev > self.prev_upper_band) {
+                upper_band = self.prev_upper_band;
             }
 
-            if lower_band > prev_lower_band || c_prev < prev_lower_band {
-                // 保持下軌
-            } else {
-                lower_band = prev_lower_band;
+            if !(lower_band > self.prev_lower_band || c_prev < self.prev_lower_band) {
+                lower_band = self.prev_lower_band;
             }
         }
 
         // 確定方向
-        let direction = if i == 0 {
+        let direction = if is_first {
             1
-        } else if c > prev_upper_band {
+        } else if c > self.prev_upper_band {
             1
-        } else if c < prev_lower_band {
+        } else if c < self.prev_lower_band {
             -1
         } else {
-            prev_direction
+            self.prev_direction
         };
 
         // 如果方向改變，調整 bands
-        if direction != prev_direction {
-            if direction > 0 && lower_band < prev_lower_band {
-                lower_band = prev_lower_band;
+        if direction != self.prev_direction {
+            if direction > 0 && lower_band < self.prev_lower_band {
+                lower_band = self.prev_lower_band;
             }
-            if direction < 0 && upper_band > prev_upper_band {
-                upper_band = prev_upper_band;
+            if direction < 0 && upper_band > self.prev_upper_band {
+                upper_band = self.prev_upper_band;
             }
         }
 
-        // 確定趨勢線
-        let trend = if direction > 0 {
-            lower_band
-        } else {
-            upper_band
-        };
+        self.prev_direction = direction;
+        self.prev_upper_band = upper_band;
+        self.prev_lower_band = lower_band;
 
-        // 設定 long 和 short 值
-        let long = if direction > 0 {
-            Some(lower_band)
-        } else {
-            None
-        };
-        let short = if direction < 0 {
-            Some(upper_band)
-        } else {
-            None
-        };
+        Some(SuperTrendBar {
+            direction,
+            upper_band,
+            lower_band,
+        })
+    }
+}
+
+/// 將 MutableBitmap 轉為 validity，全部有效時返回 None 以省去遮罩
+pub(crate) fn into_validity(bitmap: MutableBitmap) -> Option<Bitmap> {
+    let bitmap: Bitmap = bitmap.into();
+    (bitmap.unset_bits() > 0).then_some(bitmap)
+}
+
+/// 預先配置的輸出緩衝區，直接寫入數值與 validity bitmap
+pub(crate) struct SuperTrendBuilder {
+    direction: Vec<i32>,
+    long: Vec<f64>,
+    short: Vec<f64>,
+    trend: Vec<f64>,
+    valid: MutableBitmap,
+    long_valid: MutableBitmap,
+    short_valid: MutableBitmap,
+    atr: Option<(Vec<f64>, MutableBitmap)>,
+    precision: Precision,
+}
 
-        direction_values.push(Some(direction));
-        long_values.push(long);
-        short_values.push(short);
-        trend_values.push(Some(trend));
+impl SuperTrendBuilder {
+    pub(crate) fn with_capacity(len: usize) -> Self {
+        Self {
+            direction: Vec::with_capacity(len),
+            long: Vec::with_capacity(len),
+            short: Vec::with_capacity(len),
+            trend: Vec::with_capacity(len),
+            valid: MutableBitmap::with_capacity(len),
+            long_valid: MutableBitmap::with_capacity(len),
+            short_valid: MutableBitmap::with_capacity(len),
+            atr: None,
+            precision: Precision::Float64,
+        }
+    }
 
-        prev_direction = direction;
-        prev_upper_band = upper_band;
-        prev_lower_band = lower_band;
+    /// 指定浮點欄位的輸出精度
+    pub(crate) fn with_precision(mut self, precision: Precision) -> Self {
+        self.precision = precision;
+        self
     }
 
-    let direction = Int32Chunked::new("direction".into(), direction_values);
-    let long = Float64Chunked::new("long".into(), long_values);
-    let short = Float64Chunked::new("short".into(), short_values);
-    let trend = Float64Chunked::new("trend".into(), trend_values);
+    /// 額外輸出 atr 欄位
+    pub(crate) fn with_atr(mut self) -> Self {
+        let len = self.direction.capacity();
+        self.atr = Some((Vec::with_capacity(len), MutableBitmap::with_capacity(len)));
+        self
+    }
 
-    Ok(StructChunked::from_series(
-        "supertrend".into(),
-        len,
-        vec![
+    #[inline(always)]
+    pub(crate) fn push_atr(&mut self, atr: f64) {
+        if let Some((values, validity)) = self.atr.as_mut() {
+            values.push(atr);
+            validity.push(!atr.is_nan());
+        }
+    }
+
+    #[inline(always)]
+    pub(crate) fn push(&mut self, bar: Option<SuperTrendBar>) {
+        match bar {
+            Some(bar) => {
+                self.direction.push(bar.direction);
+                self.long.push(bar.lower_band);
+                self.short.push(bar.upper_band);
+                self.trend.push(bar.trend());
+                self.valid.push(true);
+                self.long_valid.push(bar.direction > 0);
+                self.short_valid.push(bar.direction < 0);
+            },
+            None => {
+                self.direction.push(0);
+                self.long.push(0.0);
+                self.short.push(0.0);
+                self.trend.push(0.0);
+                self.valid.push(false);
+                self.long_valid.push(false);
+                self.short_valid.push(false);
+            },
+        }
+    }
+
+    pub(crate) fn finish(self, name: &str) -> PolarsResult<Series> {
+        let len = self.direction.len();
+        let precision = self.precision;
+        let valid = into_validity(self.valid);
+
+        let direction =
+            Int32Chunked::from_vec_validity("direction".into(), self.direction, valid.clone());
+        let mut fields = vec![
             direction.into_series(),
-            long.into_series(),
-            short.into_series(),
-            trend.into_series(),
-        ]
-        .iter(),
-    )?
-    .into_series())
+            precision.series("long".into(), self.long, into_validity(self.long_valid)),
+            precision.series("short".into(), self.short, into_validity(self.short_valid)),
+            precision.series("trend".into(), self.trend, valid),
+        ];
+        if let Some((values, validity)) = self.atr {
+            fields.push(precision.series("atr".into(), values, into_validity(validity)));
+        }
+
+        Ok(StructChunked::from_series(name.into(), len, fields.iter())?.into_series())
+    }
+}
+
+/// 逐列計算 [start, end) 範圍內的 SuperTrend，缺值以 NaN 交由狀態機處理
+pub(crate) fn supertrend_range(
+    high: &Prices,
+    low: &Prices,
+    close: &Prices,
+    atr: &Prices,
+    (start, end): (usize, usize),
+    state: &mut SuperTrendState,
+    builder: &mut SuperTrendBuilder,
+) {
+    for i in start..end {
+        builder.push(state.update(high.get(i), low.get(i), close.get(i), atr.get(i)));
+    }
 }
 
-fn supertrend_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
-    let fields = vec![
+#[derive(Deserialize)]
+struct SuperTrendKwargs {
+    output_dtype: String,
+}
+
+// SuperTrend 計算函數 - 返回結構包含 direction, long, short, trend
+#[polars_expr(output_type_func_with_kwargs=supertrend_output_type)]
+fn supertrend(inputs: &[Series], kwargs: SuperTrendKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("supertrend", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let upper_mult = Prices::new(&inputs[4])?.scalar(3.0);
+    let lower_mult = Prices::new(&inputs[5])?.scalar(3.0);
+
+    let len = inputs[0].len();
+    polars_ensure!(
+        inputs[1].len() == len && inputs[2].len() == len && inputs[3].len() == len,
+        ShapeMismatch: "supertrend: high, low, close and atr must have the same length"
+    );
+
+    // 指定分組鍵時，每組開頭重設狀態，各組平行計算
+    if let Some(by) = inputs.get(6) {
+        polars_ensure!(
+            by.len() == len,
+            ShapeMismatch: "supertrend: by must have the same length as the inputs"
+        );
+        let groups = group_slices(by)?;
+        let high = Prices::new(&inputs[0])?;
+        let low = Prices::new(&inputs[1])?;
+        let close = Prices::new(&inputs[2])?;
+        let atr = Prices::new(&inputs[3])?;
+        return par_map_groups(&groups, |groups| {
+            let (start, end) = batch_range(groups);
+            let mut builder =
+                SuperTrendBuilder::with_capacity(end - start).with_precision(precision);
+            for &range in groups {
+                let mut state = SuperTrendState::new(upper_mult, lower_mult);
+                supertrend_range(&high, &low, &close, &atr, range, &mut state, &mut builder);
+            }
+            profiling::build(|| builder.finish("supertrend"))
+        });
+    }
+
+    let mut state = SuperTrendState::new(upper_mult, lower_mult);
+    supertrend_with_state(
+        &[&inputs[0], &inputs[1], &inputs[2], &inputs[3]],
+        &mut state,
+        precision,
+    )
+}
+
+/// 從給定狀態接續計算 SuperTrend，批次表達式與增量狀態物件共用此核心
+///
+/// 輸入依序為 high, low, close, atr；逐 chunk 計算並跨 chunk 延續狀態，
+/// 輸出保留 high 的 chunk 佈局。
+pub(crate) fn supertrend_with_state(
+    inputs: &[&Series; 4],
+    state: &mut SuperTrendState,
+    precision: Precision,
+) -> PolarsResult<Series> {
+    map_chunks(inputs, |chunk| {
+        let high = Prices::new(&chunk[0])?;
+        let low = Prices::new(&chunk[1])?;
+        let close = Prices::new(&chunk[2])?;
+        let atr = Prices::new(&chunk[3])?;
+        let len = high.len();
+        let mut builder = SuperTrendBuilder::with_capacity(len).with_precision(precision);
+        supertrend_range(&high, &low, &close, &atr, (0, len), state, &mut builder);
+        profiling::build(|| builder.finish("supertrend"))
+    })
+}
+
+fn supertrend_fields(precision: Precision) -> Vec<Field> {
+    vec![
         Field::new("direction".into(), DataType::Int32),
-        Field::new("long".into(), DataType::Float64),
-        Field::new("short".into(), DataType::Float64),
-        Field::new("trend".into(), DataType::Float64),
-    ];
-    Ok(Field::new("supertrend".into(), DataType::Struct(fields)))
-}
-
-0.
-!![user defined strategy]
-*strategy
-
-!![user defined blueprint]
-*blueprint: dict[
-    triggers: list[*trigger_obj[*mask_obj]],
-]
-
-1.
-![quote service]
-(input: *instrument, *indicators)
-ohlcvs: dict[instrument_freq_key, pl.DataFrame[indicators_exprs]]
-
-2.
-![stimulate service]
-[HFQ data: collect all indicators into one HFQ DataFrame(1m)]
-(input: ohlcv_1m, ohlcv_5m_with_indicators)
-create full ts, join 1m and 5m, drop both ts is null, fill forward 5m null data,
-idx, is_gap, volatility, {other indicators: atr, atr_q3, hour, day}
-{output: ohlcv_1m_with_indicators:: pl.LazyFrame @collect and lazy}
-
-3.
-[signal stimulate]
-(input: *strategy)
-execute enex expr
-{output: ohlcv_1m_with_indicators_with_primary_entry_exit_price_idx}
-
-4.
-[intrade context]
-(input: entry expr, exit expr, direction)
-direction
-primary_status
-primary_entry_price
-primary_entry_idx
-primary_entry_price
-primary_entry_idx
-primary_highest_high_since_entry
-primary_lowest_low_since_entry
-primary_holding_idx
-
-5.
-[advanced entry]
-(advanced_entry_triggers ... etc)
-{output}
-advanced_entry_price
-advanced_entry_idx
-advanced_entry_reason
-advanced_status
-advanced_highest_high_since_entry
-advanced_lowest_low_since_entry
-advanced_holding_idx
-
-6.
-[advanced exit]
-advanced_exit_price(sl, tp, ts, be)
-advanced_exit_mask
-
--.
-[performance report]
-mae mfe report (each trade performance)
-user set trigger reference by this report
-
-strategy performance report (pnl, sharpe, drawdown, etc)
-user set risk ratio reference by this report
-
-signal order
-primary trade + trigger + mask = trade task
-trade task is a plan for user to execute trade
+        Field::new("long".into(), precision.dtype()),
+        Field::new("short".into(), precision.dtype()),
+        Field::new("trend".into(), precision.dtype()),
+    ]
+}
+
+/// SuperTrend 結構體欄位，include_atr 時附加 atr 欄位
+pub(crate) fn supertrend_dtype(output_dtype: &str, include_atr: bool) -> PolarsResult<DataType> {
+    let precision = Precision::parse(output_dtype)?;
+    let mut fields = supertrend_fields(precision);
+    if include_atr {
+        fields.push(Field::new("atr".into(), precision.dtype()));
+    }
+    Ok(DataType::Struct(fields))
+}
+
+fn supertrend_output_type(
+    _input_fields: &[Field],
+    kwargs: SuperTrendKwargs,
+) -> PolarsResult<Field> {
+    Ok(Field::new(
+        "supertrend".into(),
+        supertrend_dtype(&kwargs.output_dtype, false)?,
+    ))
+}
+
+#[derive(Deserialize)]
+struct SuperTrendFromOhlcKwargs {
+    include_atr: bool,
+    output_dtype: String,
+}
+
+/// 單次掃描內計算 [start, end) 範圍的 True Range、ATR 與 SuperTrend
+pub(crate) fn supertrend_ohlc_range(
+    high: &Prices,
+    low: &Prices,
+    close: &Prices,
+    (start, end): (usize, usize),
+    atr_state: &mut AtrState,
+    state: &mut SuperTrendState,
+    builder: &mut SuperTrendBuilder,
+) {
+    for i in start..end {
+        let (h, l, c) = (high.get(i), low.get(i), close.get(i));
+        let atr = atr_state.update(h, l, c);
+        builder.push_atr(atr);
+        builder.push(state.update(h, l, c, atr));
+    }
+}
+
+// 融合 ATR 的 SuperTrend - 直接由 high, low, close 計算
+#[polars_expr(output_type_func_with_kwargs=supertrend_from_ohlc_output_type)]
+fn supertrend_from_ohlc(
+    inputs: &[Series],
+    kwargs: SuperTrendFromOhlcKwargs,
+) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("supertrend_from_ohlc", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let atr_period = inputs[3].cast(&DataType::Int64)?.i64()?.get(0).unwrap_or(14);
+    let smoothing = Smoothing::parse(inputs[4].str()?.get(0).unwrap_or("rma"))?;
+    let upper_mult = Prices::new(&inputs[5])?.scalar(3.0);
+    let lower_mult = Prices::new(&inputs[6])?.scalar(3.0);
+
+    let len = inputs[0].len();
+    polars_ensure!(
+        inputs[1].len() == len && inputs[2].len() == len,
+        ShapeMismatch: "supertrend_from_ohlc: high, low and close must have the same length"
+    );
+    polars_ensure!(atr_period > 0, InvalidOperation: "atr_period must be positive");
+    let atr_period = atr_period as usize;
+
+    let new_builder = |len: usize| {
+        let builder = SuperTrendBuilder::with_capacity(len).with_precision(precision);
+        if kwargs.include_atr {
+            builder.with_atr()
+        } else {
+            builder
+        }
+    };
+
+    // 未分組時逐 chunk 計算並跨 chunk 延續 ATR 與 SuperTrend 狀態
+    let Some(by) = inputs.get(7) else {
+        let mut atr_state = AtrState::new(atr_period, smoothing)?;
+        let mut state = SuperTrendState::new(upper_mult, lower_mult);
+        return map_chunks(&[&inputs[0], &inputs[1], &inputs[2]], |chunk| {
+            let high = Prices::new(&chunk[0])?;
+            let low = Prices::new(&chunk[1])?;
+            let close = Prices::new(&chunk[2])?;
+            let len = high.len();
+            let mut builder = new_builder(len);
+            supertrend_ohlc_range(
+                &high,
+                &low,
+                &close,
+                (0, len),
+                &mut atr_state,
+                &mut state,
+                &mut builder,
+            );
+            profiling::build(|| builder.finish("supertrend"))
+        });
+    };
+
+    // 指定分組鍵時，每組開頭重設 ATR 與 SuperTrend 狀態，各組平行計算
+    polars_ensure!(
+        by.len() == len,
+        ShapeMismatch: "supertrend_from_ohlc: by must have the same length as the inputs"
+    );
+    let groups = group_slices(by)?;
+    let high = Prices::new(&inputs[0])?;
+    let low = Prices::new(&inputs[1])?;
+    let close = Prices::new(&inputs[2])?;
+    par_map_groups(&groups, |groups| {
+        let (start, end) = batch_range(groups);
+        let mut builder = new_builder(end - start);
+        for &range in groups {
+            let mut atr_state = AtrState::new(atr_period, smoothing)?;
+            let mut state = SuperTrendState::new(upper_mult, lower_mult);
+            supertrend_ohlc_range(
+                &high,
+                &low,
+                &close,
+                range,
+                &mut atr_state,
+                &mut state,
+                &mut builder,
+            );
+        }
+        profiling::build(|| builder.finish("supertrend"))
+    })
+}
+
+fn supertrend_from_ohlc_output_type(
+    _input_fields: &[Field],
+    kwargs: SuperTrendFromOhlcKwargs,
+) -> PolarsResult<Field> {
+    Ok(Field::new(
+        "supertrend".into(),
+        supertrend_dtype(&kwargs.output_dtype, kwargs.include_atr)?,
+    ))
+}
+
+#[derive(Deserialize)]
+struct SuperTrendGridKwargs {
+    upper_multipliers: Vec<f64>,
+    lower_multipliers: Option<Vec<f64>>,
+    atr_periods: Option<Vec<i64>>,
+    /// 各組合的字段名稱，依 atr_periods × (upper, lower) 的展開順序，由 Python 端產生
+    names: Vec<String>,
+    smoothing: String,
+    output_dtype: String,
+}
+
+/// 參數網格中的單一組合
+struct GridSpec {
+    name: String,
+    atr_period: Option<usize>,
+    upper_multiplier: f64,
+    lower_multiplier: f64,
+}
+
+/// 展開參數網格：未指定 lower_multipliers 時上下軌倍數相同，否則取笛卡兒積
+fn grid_specs(kwargs: &SuperTrendGridKwargs) -> PolarsResult<Vec<GridSpec>> {
+    let pairs: Vec<(f64, f64)> = match &kwargs.lower_multipliers {
+        None => kwargs.upper_multipliers.iter().map(|&m| (m, m)).collect(),
+        Some(lower) => kwargs
+            .upper_multipliers
+            .iter()
+            .flat_map(|&u| lower.iter().map(move |&l| (u, l)))
+            .collect(),
+    };
+    polars_ensure!(
+        !pairs.is_empty(),
+        InvalidOperation: "supertrend_grid: multipliers must not be empty"
+    );
+
+    let periods: Vec<Option<usize>> = match &kwargs.atr_periods {
+        None => vec![None],
+        Some(periods) => {
+            polars_ensure!(
+                !periods.is_empty() && periods.iter().all(|&p| p > 0),
+                InvalidOperation: "supertrend_grid: atr_periods must be positive and not empty"
+            );
+            periods.iter().map(|&p| Some(p as usize)).collect()
+        },
+    };
+
+    let count = periods.len() * pairs.len();
+    polars_ensure!(
+        kwargs.names.len() == count,
+        InvalidOperation: "supertrend_grid: expected {} names, got {}", count, kwargs.names.len()
+    );
+
+    let mut specs = Vec::with_capacity(count);
+    let mut names = PlHashSet::with_capacity(count);
+    let combinations = periods
+        .iter()
+        .flat_map(|&atr_period| pairs.iter().map(move |&pair| (atr_period, pair)));
+    for ((atr_period, (upper, lower)), name) in combinations.zip(&kwargs.names) {
+        // 重複的參數組合會產生同名字段
+        polars_ensure!(
+            names.insert(name.as_str()),
+            InvalidOperation: "supertrend_grid: duplicate parameter combination '{}'", name
+        );
+        specs.push(GridSpec {
+            name: name.clone(),
+            atr_period,
+            upper_multiplier: upper,
+            lower_multiplier: lower,
+        });
+    }
+    Ok(specs)
+}
+
+/// 單一執行緒負責一組參數：只掃描輸入一次，內層迴圈依序更新各組合的狀態
+fn supertrend_grid_task(
+    high: &Prices,
+    low: &Prices,
+    close: &Prices,
+    atr: Option<&Prices>,
+    specs: &[GridSpec],
+    smoothing: Smoothing,
+    precision: Precision,
+) -> PolarsResult<Vec<Series>> {
+    let len = high.len();
+
+    // 同一週期的 ATR 每列只計算一次
+    let mut atr_periods: Vec<usize> = specs.iter().filter_map(|s| s.atr_period).collect();
+    atr_periods.sort_unstable();
+    atr_periods.dedup();
+    let mut atr_states = atr_periods
+        .iter()
+        .map(|&p| AtrState::new(p, smoothing))
+        .collect::<PolarsResult<Vec<_>>>()?;
+    let atr_slots: Vec<usize> = specs
+        .iter()
+        .map(|s| {
+            s.atr_period
+                .and_then(|p| atr_periods.iter().position(|&q| q == p))
+                .unwrap_or(0)
+        })
+        .collect();
+    let mut atr_row = vec![f64::NAN; atr_states.len().max(1)];
+
+    let mut states: Vec<SuperTrendState> = specs
+        .iter()
+        .map(|s| SuperTrendState::new(s.upper_multiplier, s.lower_multiplier))
+        .collect();
+    let mut builders: Vec<SuperTrendBuilder> = specs
+        .iter()
+        .map(|_| SuperTrendBuilder::with_capacity(len).with_precision(precision))
+        .collect();
+
+    for i in 0..len {
+        let (h, l, c) = (high.get(i), low.get(i), close.get(i));
+        match atr {
+            Some(atr) => atr_row[0] = atr.get(i),
+            None => {
+                for (slot, atr_state) in atr_row.iter_mut().zip(atr_states.iter_mut()) {
+                    *slot = atr_state.update(h, l, c);
+                }
+            },
+        }
+
+        for ((state, builder), &slot) in states.iter_mut().zip(builders.iter_mut()).zip(&atr_slots)
+        {
+            builder.push(state.update(h, l, c, atr_row[slot]));
+        }
+    }
+
+    builders
+        .into_iter()
+        .zip(specs)
+        .map(|(builder, spec)| profiling::build(|| builder.finish(&spec.name)))
+        .collect()
+}
+
+// SuperTrend 參數網格 - 單次掃描計算所有組合，返回每個組合一個字段的寬結構體
+#[polars_expr(output_type_func_with_kwargs=supertrend_grid_output_type)]
+fn supertrend_grid(inputs: &[Series], kwargs: SuperTrendGridKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("supertrend_grid", inputs);
+    let specs = grid_specs(&kwargs)?;
+    let smoothing = Smoothing::parse(&kwargs.smoothing)?;
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+
+    let high = Prices::new(&inputs[0])?;
+    let low = Prices::new(&inputs[1])?;
+    let close = Prices::new(&inputs[2])?;
+    let atr = match kwargs.atr_periods {
+        None => Some(Prices::new(&inputs[3])?),
+        Some(_) => None,
+    };
+
+    let len = high.len();
+    polars_ensure!(
+        low.len() == len
+            && close.len() == len
+            && atr.as_ref().map_or(true, |atr| atr.len() == len),
+        ShapeMismatch: "supertrend_grid: input columns must have the same length"
+    );
+
+    // 依執行緒數切分參數組合，每個執行緒各自掃描一次輸入
+    let chunk_size = specs.len().div_ceil(rayon::current_num_threads().max(1));
+    let fields: Vec<Series> = specs
+        .par_chunks(chunk_size.max(1))
+        .map(|chunk| {
+            supertrend_grid_task(&high, &low, &close, atr.as_ref(), chunk, smoothing, precision)
+        })
+        .collect::<PolarsResult<Vec<_>>>()?
+        .into_iter()
+        .flatten()
+        .collect();
+
+    profiling::build(|| {
+        Ok(StructChunked::from_series("supertrend_grid".into(), len, fields.iter())?.into_series())
+    })
+}
+
+fn supertrend_grid_output_type(
+    _input_fields: &[Field],
+    kwargs: SuperTrendGridKwargs,
+) -> PolarsResult<Field> {
+    let dtype = supertrend_dtype(&kwargs.output_dtype, false)?;
+    let fields = grid_specs(&kwargs)?
+        .into_iter()
+        .map(|spec| Field::new(spec.name.into(), dtype.clone()))
+        .collect();
+    Ok(Field::new("supertrend_grid".into(), DataType::Struct(fields)))
+}
@@ -0,0 +1,336 @@
+#![allow(clippy::unused_unit)]
+use polars::prelude::*;
+use polars_arrow::bitmap::MutableBitmap;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+
+use crate::groups::{batch_range, group_slices, par_map_groups};
+use crate::profiling;
+use crate::rolling::{AtrState, Smoothing};
+use crate::supertrend::{
+    into_validity, supertrend_dtype, SuperTrendBar, SuperTrendBuilder, SuperTrendState,
+};
+use crate::values::{Precision, Prices};
+
+/// 時間戳轉為 i64 物理值，Datetime/Date/Duration 與整數時間戳皆可
+fn time_values(s: &Series) -> PolarsResult<Int64Chunked> {
+    Ok(s.to_physical_repr().cast(&DataType::Int64)?.i64()?.clone())
+}
+
+/// 對齊高時間框架資料到低時間框架
+///
+/// 兩邊時間戳皆需遞增排序，以合併方式各掃描一次：每個低時間框架列取
+/// available_at <= 該列時間戳的最後一根高時間框架 K 棒，不使用尚未完成的 K 棒。
+/// 輸入依序為低時間框架時間戳、高時間框架的 available_at、expires_at（可為 null）
+/// 與高時間框架的數值結構體；時間戳超過 expires_at 表示下一根高時間框架 K 棒缺失。
+/// 高時間框架的輸入由 Python 端以常值傳入，長度與低時間框架不同。
+#[polars_expr(output_type_func=align_timeframe_output_type)]
+fn align_timeframe(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("align_timeframe", inputs);
+    polars_ensure!(
+        inputs[0].dtype() == inputs[1].dtype(),
+        SchemaMismatch: "align_timeframe: lower and higher timestamps must have the same dtype, got {} and {}",
+        inputs[0].dtype(), inputs[1].dtype()
+    );
+    let lower = time_values(&inputs[0])?;
+    let available_at = time_values(&inputs[1])?;
+    let values = inputs[3].struct_()?;
+    let higher_len = available_at.len();
+    polars_ensure!(
+        available_at.null_count() == 0 && values.len() == higher_len,
+        ComputeError: "align_timeframe: higher timestamps must not contain nulls and must match the value columns"
+    );
+    let expires_at = if inputs[2].dtype() == &DataType::Null {
+        None
+    } else {
+        let expires_at = time_values(&inputs[2])?;
+        polars_ensure!(
+            expires_at.len() == higher_len,
+            ShapeMismatch: "align_timeframe: expires_at must have the same length as the higher timestamps"
+        );
+        Some(expires_at.rechunk().into_owned())
+    };
+    let available_at = available_at.rechunk();
+    let available_at = available_at.cont_slice()?;
+    let expires_at = expires_at.as_ref().map(|ca| ca.cont_slice()).transpose()?;
+
+    let len = lower.len();
+    let mut idx: Vec<IdxSize> = Vec::with_capacity(len);
+    let mut idx_valid = MutableBitmap::with_capacity(len);
+    let mut is_gap = MutableBitmap::with_capacity(len);
+
+    let mut j = 0usize;
+    let mut prev = i64::MIN;
+    for ts in lower.into_iter() {
+        let Some(ts) = ts else {
+            idx.push(0);
+            idx_valid.push(false);
+            is_gap.push(true);
+            continue;
+        };
+        polars_ensure!(
+            ts >= prev,
+            InvalidOperation: "align_timeframe: lower timestamps must be sorted"
+        );
+        prev = ts;
+
+        while j < higher_len && available_at[j] <= ts {
+            polars_ensure!(
+                j == 0 || available_at[j] >= available_at[j - 1],
+                InvalidOperation: "align_timeframe: higher timestamps must be sorted"
+            );
+            j += 1;
+        }
+
+        if j == 0 {
+            idx.push(0);
+            idx_valid.push(false);
+            is_gap.push(true);
+        } else {
+            let k = j - 1;
+            idx.push(k as IdxSize);
+            idx_valid.push(true);
+            is_gap.push(expires_at.is_some_and(|expires| ts >= expires[k]));
+        }
+    }
+
+    let idx = IdxCa::from_vec_validity("idx".into(), idx, into_validity(idx_valid));
+
+    let mut fields = values
+        .fields_as_series()
+        .iter()
+        .map(|s| s.take(&idx))
+        .collect::<PolarsResult<Vec<_>>>()?;
+    fields.push(BooleanChunked::from_bitmap("is_gap".into(), is_gap.into()).into_series());
+    profiling::build(|| {
+        Ok(StructChunked::from_series("aligned".into(), len, fields.iter())?.into_series())
+    })
+}
+
+fn align_timeframe_output_type(input_fields: &[Field]) -> PolarsResult<Field> {
+    let mut fields = match input_fields[3].dtype() {
+        DataType::Struct(fields) => fields.clone(),
+        dtype => polars_bail!(
+            SchemaMismatch: "align_timeframe: expected struct of higher timeframe values, got {}", dtype
+        ),
+    };
+    fields.push(Field::new("is_gap".into(), DataType::Boolean));
+    Ok(Field::new("aligned".into(), DataType::Struct(fields)))
+}
+
+/// 由低時間框架逐列累積的高時間框架 K 棒
+///
+/// 最高/最低價略過 NaN，收盤價與 ATR 取區間內最後一個有效值。
+#[derive(Clone, Copy, Debug)]
+struct BucketBar {
+    high: f64,
+    low: f64,
+    close: f64,
+    atr: f64,
+}
+
+impl BucketBar {
+    const EMPTY: Self = Self {
+        high: f64::NAN,
+        low: f64::NAN,
+        close: f64::NAN,
+        atr: f64::NAN,
+    };
+
+    #[inline(always)]
+    fn merge(&mut self, high: f64, low: f64, close: f64, atr: f64) {
+        self.high = self.high.max(high);
+        self.low = self.low.min(low);
+        if !close.is_nan() {
+            self.close = close;
+        }
+        if !atr.is_nan() {
+            self.atr = atr;
+        }
+    }
+}
+
+/// 高時間框架 SuperTrend 的遞迴狀態
+///
+/// atr 為 None 時使用輸入的 ATR（需為高時間框架尺度），否則由聚合後的 K 棒計算。
+struct ResampledState {
+    atr: Option<AtrState>,
+    supertrend: SuperTrendState,
+    bar: BucketBar,
+    completed: Option<SuperTrendBar>,
+    completed_atr: f64,
+}
+
+impl ResampledState {
+    /// 區間結束時以聚合後的 K 棒推進狀態
+    #[inline(always)]
+    fn complete(&mut self) {
+        let bar = self.bar;
+        let atr = match self.atr.as_mut() {
+            Some(atr_state) => atr_state.update(bar.high, bar.low, bar.close),
+            None => bar.atr,
+        };
+        self.completed = self.supertrend.update(bar.high, bar.low, bar.close, atr);
+        self.completed_atr = atr;
+        self.bar = BucketBar::EMPTY;
+    }
+
+    /// 以尚未完成的 K 棒試算，不更新狀態
+    #[inline(always)]
+    fn developing(&self) -> (Option<SuperTrendBar>, f64) {
+        let bar = self.bar;
+        let atr = match self.atr.as_ref() {
+            Some(atr_state) => atr_state.peek(bar.high, bar.low),
+            None => bar.atr,
+        };
+        let mut supertrend = self.supertrend;
+        (supertrend.update(bar.high, bar.low, bar.close, atr), atr)
+    }
+}
+
+#[derive(Deserialize)]
+struct SuperTrendResampledKwargs {
+    upper_multiplier: f64,
+    lower_multiplier: f64,
+    atr_period: Option<i64>,
+    smoothing: String,
+    developing: bool,
+    include_atr: bool,
+    output_dtype: String,
+}
+
+/// 對 [start, end) 範圍內的列以區間邊界聚合並計算，範圍開頭重設狀態
+#[allow(clippy::too_many_arguments)]
+fn supertrend_resampled_range(
+    high: &Prices,
+    low: &Prices,
+    close: &Prices,
+    atr: Option<&Prices>,
+    new_bucket: &[bool],
+    (start, end): (usize, usize),
+    kwargs: &SuperTrendResampledKwargs,
+    builder: &mut SuperTrendBuilder,
+) -> PolarsResult<()> {
+    let atr_state = match kwargs.atr_period {
+        Some(period) => {
+            polars_ensure!(period > 0, InvalidOperation: "atr_period must be positive");
+            Some(AtrState::new(
+                period as usize,
+                Smoothing::parse(&kwargs.smoothing)?,
+            )?)
+        },
+        None => None,
+    };
+    let mut state = ResampledState {
+        atr: atr_state,
+        supertrend: SuperTrendState::new(kwargs.upper_multiplier, kwargs.lower_multiplier),
+        bar: BucketBar::EMPTY,
+        completed: None,
+        completed_atr: f64::NAN,
+    };
+
+    for i in start..end {
+        if i > start && new_bucket[i] {
+            state.complete();
+        }
+        state.bar.merge(
+            high.get(i),
+            low.get(i),
+            close.get(i),
+            atr.map_or(f64::NAN, |atr| atr.get(i)),
+        );
+
+        let (bar, atr) = if kwargs.developing {
+            state.developing()
+        } else {
+            (state.completed, state.completed_atr)
+        };
+        builder.push_atr(atr);
+        builder.push(bar);
+    }
+    Ok(())
+}
+
+/// 高時間框架 SuperTrend - 在核心內依區間鍵即時聚合 OHLC，不需 group_by_dynamic 與 join
+///
+/// 輸入依序為 high, low, close, 區間鍵, atr（指定 atr_period 時忽略），可選的分組鍵；
+/// 區間鍵相同且連續的列屬於同一根高時間框架 K 棒。每列輸出最近一根已完成 K 棒的值，
+/// developing 為 True 時改為輸出包含當列在內、尚未完成的 K 棒的試算值。
+#[polars_expr(output_type_func_with_kwargs=supertrend_resampled_output_type)]
+fn supertrend_resampled(
+    inputs: &[Series],
+    kwargs: SuperTrendResampledKwargs,
+) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("supertrend_resampled", inputs);
+    let precision = Precision::parse(&kwargs.output_dtype)?;
+    let high = Prices::new(&inputs[0])?;
+    let low = Prices::new(&inputs[1])?;
+    let close = Prices::new(&inputs[2])?;
+    let bucket = &inputs[3];
+    let atr = match kwargs.atr_period {
+        None => Some(Prices::new(&inputs[4])?),
+        Some(_) => None,
+    };
+
+    let len = high.len();
+    polars_ensure!(
+        low.len() == len
+            && close.len() == len
+            && bucket.len() == len
+            && atr.as_ref().map_or(true, |atr| atr.len() == len),
+        ShapeMismatch: "supertrend_resampled: inputs must have the same length"
+    );
+
+    let mut new_bucket = vec![false; len];
+    for (start, _) in group_slices(bucket)? {
+        new_bucket[start] = true;
+    }
+
+    let new_builder = |len: usize| {
+        let builder = SuperTrendBuilder::with_capacity(len).with_precision(precision);
+        if kwargs.include_atr {
+            builder.with_atr()
+        } else {
+            builder
+        }
+    };
+
+    // 指定分組鍵時，每組開頭重設狀態，各組平行計算
+    let groups = match inputs.get(5) {
+        Some(by) => {
+            polars_ensure!(
+                by.len() == len,
+                ShapeMismatch: "supertrend_resampled: by must have the same length as the inputs"
+            );
+            group_slices(by)?
+        },
+        None => vec![(0, len)],
+    };
+    par_map_groups(&groups, |groups| {
+        let (start, end) = batch_range(groups);
+        let mut builder = new_builder(end - start);
+        for &range in groups {
+            supertrend_resampled_range(
+                &high,
+                &low,
+                &close,
+                atr.as_ref(),
+                &new_bucket,
+                range,
+                &kwargs,
+                &mut builder,
+            )?;
+        }
+        profiling::build(|| builder.finish("supertrend"))
+    })
+}
+
+fn supertrend_resampled_output_type(
+    _input_fields: &[Field],
+    kwargs: SuperTrendResampledKwargs,
+) -> PolarsResult<Field> {
+    Ok(Field::new(
+        "supertrend".into(),
+        supertrend_dtype(&kwargs.output_dtype, kwargs.include_atr)?,
+    ))
+}
@@ -0,0 +1,768 @@
+#![allow(clippy::unused_unit)]
+use std::borrow::Cow;
+
+use polars::prelude::*;
+use polars_arrow::bitmap::MutableBitmap;
+use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
+use serde::Deserialize;
+
+use crate::profiling;
+use crate::supertrend::into_validity;
+use crate::values::Prices;
+
+/// 單根 K 棒的持倉運行狀態
+#[derive(Clone, Copy, Debug)]
+pub(crate) struct IntradeBar {
+    pub(crate) entry_idx: usize,
+    pub(crate) entry_price: f64,
+    pub(crate) highest_high: f64,
+    pub(crate) lowest_low: f64,
+    pub(crate) holding_idx: usize,
+}
+
+/// 持倉期間的遞迴狀態，positions_out 變化時視為新的一筆交易並重設
+///
+/// 最高價、最低價包含進場當根，缺值（NaN）不參與極值計算。
+#[derive(Clone, Copy, Debug)]
+pub(crate) struct IntradeState {
+    position_id: i64,
+    bar: IntradeBar,
+}
+
+impl IntradeState {
+    pub(crate) fn new() -> Self {
+        Self {
+            position_id: -1,
+            bar: IntradeBar {
+                entry_idx: 0,
+                entry_price: f64::NAN,
+                highest_high: f64::NAN,
+                lowest_low: f64::NAN,
+                holding_idx: 0,
+            },
+        }
+    }
+
+    /// 推進一根 K 棒，不在持倉中（position < 0）時返回 None
+    #[inline(always)]
+    pub(crate) fn update(
+        &mut self,
+        idx: usize,
+        position: i64,
+        high: f64,
+        low: f64,
+        entry_price: f64,
+    ) -> Option<IntradeBar> {
+        if position < 0 {
+            self.position_id = -1;
+            return None;
+        }
+
+        let bar = &mut self.bar;
+        if position != self.position_id {
+            self.position_id = position;
+            *bar = IntradeBar {
+                entry_idx: idx,
+                entry_price,
+                highest_high: high,
+                lowest_low: low,
+                holding_idx: 0,
+            };
+        } else {
+            // f64::max / f64::min 會略過 NaN
+            bar.highest_high = bar.highest_high.max(high);
+            bar.lowest_low = bar.lowest_low.min(low);
+            bar.holding_idx = idx - bar.entry_idx;
+        }
+        Some(*bar)
+    }
+}
+
+/// 持倉運行欄位的輸出緩衝區
+struct IntradeBuilder {
+    entry_idx: Vec<i64>,
+    entry_price: Vec<f64>,
+    highest_high: Vec<f64>,
+    lowest_low: Vec<f64>,
+    holding_idx: Vec<i64>,
+    valid: MutableBitmap,
+}
+
+impl IntradeBuilder {
+    fn with_capacity(len: usize) -> Self {
+        Self {
+            entry_idx: Vec::with_capacity(len),
+            entry_price: Vec::with_capacity(len),
+            highest_high: Vec::with_capacity(len),
+            lowest_low: Vec::with_capacity(len),
+            holding_idx: Vec::with_capacity(len),
+            valid: MutableBitmap::with_capacity(len),
+        }
+    }
+
+    #[inline(always)]
+    fn push(&mut self, bar: Option<IntradeBar>) {
+        let bar = match bar {
+            Some(bar) => {
+                self.valid.push(true);
+                bar
+            },
+            None => {
+                self.valid.push(false);
+                IntradeBar {
+                    entry_idx: 0,
+                    entry_price: 0.0,
+                    highest_high: 0.0,
+                    lowest_low: 0.0,
+                    holding_idx: 0,
+                }
+            },
+        };
+        self.entry_idx.push(bar.entry_idx as i64);
+        self.entry_price.push(bar.entry_price);
+        self.highest_high.push(bar.highest_high);
+        self.lowest_low.push(bar.lowest_low);
+        self.holding_idx.push(bar.holding_idx as i64);
+    }
+
+    fn finish(self) -> PolarsResult<Series> {
+        let len = self.entry_idx.len();
+        let valid = into_validity(self.valid);
+        let fields = vec![
+            Int64Chunked::from_vec_validity("entry_idx".into(), self.entry_idx, valid.clone())
+                .into_series(),
+            Float64Chunked::from_vec_validity("entry_price".into(), self.entry_price, valid.clone())
+                .into_series(),
+            Float64Chunked::from_vec_validity(
+                "highest_high".into(),
+                self.highest_high,
+                valid.clone(),
+            )
+            .into_series(),
+            Float64Chunked::from_vec_validity("lowest_low".into(), self.lowest_low, valid.clone())
+                .into_series(),
+            Int64Chunked::from_vec_validity("holding_idx".into(), self.holding_idx, valid)
+                .into_series(),
+        ];
+        Ok(StructChunked::from_series("intrade_context".into(), len, fields.iter())?.into_series())
+    }
+}
+
+/// 單次掃描計算持倉期間的運行欄位
+///
+/// 以 positions_out 區分交易，取代多個 cum_max().over(position_id) 的分區計算；
+/// 不在持倉中的列輸出 null。
+#[polars_expr(output_type_func=intrade_context_output_type)]
+fn intrade_context(inputs: &[Series]) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("intrade_context", inputs);
+    let positions_ca: &Int64Chunked = inputs[0].i64()?;
+    let high = Prices::new(&inputs[1])?;
+    let low = Prices::new(&inputs[2])?;
+    let price = Prices::new(&inputs[3])?;
+
+    let len = positions_ca.len();
+    polars_ensure!(
+        high.len() == len && low.len() == len && price.len() == len,
+        ShapeMismatch: "intrade_context: inputs must have the same length"
+    );
+
+    let mut state = IntradeState::new();
+    let mut builder = IntradeBuilder::with_capacity(len);
+    for (i, position) in positions_ca.into_iter().enumerate() {
+        builder.push(state.update(
+            i,
+            position.unwrap_or(-1),
+            high.get(i),
+            low.get(i),
+            price.get(i),
+        ));
+    }
+    profiling::build(|| builder.finish())
+}
+
+fn intrade_context_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+    let fields = vec![
+        Field::new("entry_idx".into(), DataType::Int64),
+        Field::new("entry_price".into(), DataType::Float64),
+        Field::new("highest_high".into(), DataType::Float64),
+        Field::new("lowest_low".into(), DataType::Float64),
+        Field::new("holding_idx".into(), DataType::Int64),
+    ];
+    Ok(Field::new("intrade_context".into(), DataType::Struct(fields)))
+}
+
+/// 取得連續的 i64 持倉ID，單一 chunk 且無缺值時零複製，否則以 -1 表示缺值
+fn position_values(ca: &Int64Chunked) -> Cow<'_, [i64]> {
+    if ca.chunks().len() == 1 && ca.null_count() == 0 {
+        Cow::Borrowed(ca.downcast_iter().next().unwrap().values().as_slice())
+    } else {
+        Cow::Owned(ca.into_iter().map(|v| v.unwrap_or(-1)).collect())
+    }
+}
+
+/// 交易方向
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub(crate) enum TradeDirection {
+    Long,
+    Short,
+}
+
+impl TradeDirection {
+    pub(crate) fn parse(value: &str) -> PolarsResult<Self> {
+        match value {
+            "long" => Ok(Self::Long),
+            "short" => Ok(Self::Short),
+            _ => polars_bail!(
+                InvalidOperation: "direction must be one of 'long' or 'short', got '{}'", value
+            ),
+        }
+    }
+
+    /// 多單為 1.0、空單為 -1.0，用於將空單的價格比較轉為與多單相同的方向
+    #[inline(always)]
+    pub(crate) fn sign(self) -> f64 {
+        match self {
+            Self::Long => 1.0,
+            Self::Short => -1.0,
+        }
+    }
+}
+
+/// 出場原因
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+enum ExitReason {
+    StopLoss,
+    TakeProfit,
+    TrailingStop,
+    BreakEven,
+}
+
+impl ExitReason {
+    fn as_str(self) -> &'static str {
+        match self {
+            Self::StopLoss => "stop_loss",
+            Self::TakeProfit => "take_profit",
+            Self::TrailingStop => "trailing_stop",
+            Self::BreakEven => "break_even",
+        }
+    }
+}
+
+/// 單筆交易的出場參數，皆為相對進場價的比例，NaN 表示停用
+#[derive(Clone, Copy, Debug)]
+struct ExitParams {
+    stop_loss: f64,
+    take_profit: f64,
+    trailing_stop: f64,
+    break_even: f64,
+}
+
+impl ExitParams {
+    const DISABLED: Self = Self {
+        stop_loss: f64::NAN,
+        take_profit: f64::NAN,
+        trailing_stop: f64::NAN,
+        break_even: f64::NAN,
+    };
+}
+
+/// 進階出場的遞迴狀態，每筆交易在進場當根以 enter 重設
+struct ExitState {
+    params: ExitParams,
+    done: bool,
+}
+
+impl ExitState {
+    fn new(params: ExitParams) -> Self {
+        Self { params, done: false }
+    }
+
+    #[inline(always)]
+    fn enter(&mut self, params: ExitParams) {
+        self.params = params;
+        self.done = false;
+    }
+
+    /// 以前一根為止的持倉狀態計算停損與停利價，檢查當根是否觸發
+    ///
+    /// 只使用已完成 K 棒的最高/最低價更新移動停損，避免前視；
+    /// 同一根同時觸及停損與停利時保守地視為先觸及停損，並假設以觸發價成交。
+    #[inline(always)]
+    fn check(
+        &mut self,
+        direction: TradeDirection,
+        prev: &IntradeBar,
+        high: f64,
+        low: f64,
+    ) -> Option<(f64, ExitReason)> {
+        if self.done {
+            return None;
+        }
+
+        let d = direction.sign();
+        let p = &self.params;
+        let entry = prev.entry_price;
+        let (favorable_extreme, adverse, favorable) = match direction {
+            TradeDirection::Long => (prev.highest_high, low, high),
+            TradeDirection::Short => (prev.lowest_low, high, low),
+        };
+
+        // 多個停損來源取最緊的一個（多單取最高、空單取最低）
+        let mut stop = f64::NAN;
+        let mut stop_reason = ExitReason::StopLoss;
+        let mut tighten = |level: f64, reason: ExitReason| {
+            if !level.is_nan() && (stop.is_nan() || d * (level - stop) > 0.0) {
+                stop = level;
+                stop_reason = reason;
+            }
+        };
+        tighten(entry * (1.0 - d * p.stop_loss), ExitReason::StopLoss);
+        if d * (favorable_extreme - entry) >= entry * p.break_even {
+            tighten(entry, ExitReason::BreakEven);
+        }
+        tighten(favorable_extreme * (1.0 - d * p.trailing_stop), ExitReason::TrailingStop);
+
+        let hit = if d * (adverse - stop) <= 0.0 {
+            Some((stop, stop_reason))
+        } else {
+            let target = entry * (1.0 + d * p.take_profit);
+            (d * (favorable - target) >= 0.0).then_some((target, ExitReason::TakeProfit))
+        };
+        self.done = hit.is_some();
+        hit
+    }
+}
+
+/// 進階出場的輸出緩衝區
+struct ExitBuilder {
+    mask: MutableBitmap,
+    price: Vec<f64>,
+    reason: Vec<Option<&'static str>>,
+    valid: MutableBitmap,
+}
+
+impl ExitBuilder {
+    fn with_capacity(len: usize) -> Self {
+        Self {
+            mask: MutableBitmap::with_capacity(len),
+            price: Vec::with_capacity(len),
+            reason: Vec::with_capacity(len),
+            valid: MutableBitmap::with_capacity(len),
+        }
+    }
+
+    #[inline(always)]
+    fn push(&mut self, exit: Option<(f64, ExitReason)>) {
+        match exit {
+            Some((price, reason)) => {
+                self.mask.push(true);
+                self.price.push(price);
+                self.reason.push(Some(reason.as_str()));
+                self.valid.push(true);
+            },
+            None => {
+                self.mask.push(false);
+                self.price.push(0.0);
+                self.reason.push(None);
+                self.valid.push(false);
+            },
+        }
+    }
+
+    fn finish(self, name: &str) -> PolarsResult<Series> {
+        let len = self.price.len();
+        let fields = vec![
+            BooleanChunked::from_bitmap("exit_mask".into(), self.mask.into()).into_series(),
+            Float64Chunked::from_vec_validity(
+                "exit_price".into(),
+                self.price,
+                into_validity(self.valid),
+            )
+            .into_series(),
+            StringChunked::from_iter_options("exit_reason".into(), self.reason.into_iter())
+                .into_series(),
+        ];
+        Ok(StructChunked::from_series(name.into(), len, fields.iter())?.into_series())
+    }
+}
+
+fn exit_fields() -> Vec<Field> {
+    vec![
+        Field::new("exit_mask".into(), DataType::Boolean),
+        Field::new("exit_price".into(), DataType::Float64),
+        Field::new("exit_reason".into(), DataType::String),
+    ]
+}
+
+#[derive(Deserialize)]
+struct ExitParamsKwargs {
+    stop_loss: Option<f64>,
+    take_profit: Option<f64>,
+    trailing_stop: Option<f64>,
+    break_even: Option<f64>,
+}
+
+impl ExitParamsKwargs {
+    fn params(&self) -> ExitParams {
+        ExitParams {
+            stop_loss: self.stop_loss.unwrap_or(f64::NAN),
+            take_profit: self.take_profit.unwrap_or(f64::NAN),
+            trailing_stop: self.trailing_stop.unwrap_or(f64::NAN),
+            break_even: self.break_even.unwrap_or(f64::NAN),
+        }
+    }
+
+    /// 參數列表模式的字段名稱，例如 "sl=0.02_tp=0.05"，全部停用時為 "none"
+    fn name(&self) -> String {
+        let parts: Vec<String> = [
+            ("sl", self.stop_loss),
+            ("tp", self.take_profit),
+            ("ts", self.trailing_stop),
+            ("be", self.break_even),
+        ]
+        .iter()
+        .filter_map(|(key, value)| value.map(|v| format!("{key}={v:?}")))
+        .collect();
+        if parts.is_empty() {
+            "none".to_string()
+        } else {
+            parts.join("_")
+        }
+    }
+}
+
+#[derive(Deserialize)]
+struct AdvancedExitKwargs {
+    direction: String,
+    params: Option<Vec<ExitParamsKwargs>>,
+}
+
+/// 逐列的出場參數，長度為 1 時廣播到所有列
+struct RowParams<'a> {
+    stop_loss: Prices<'a>,
+    take_profit: Prices<'a>,
+    trailing_stop: Prices<'a>,
+    break_even: Prices<'a>,
+}
+
+impl RowParams<'_> {
+    #[inline(always)]
+    fn at(&self, i: usize) -> ExitParams {
+        #[inline(always)]
+        fn value(values: &Prices, i: usize) -> f64 {
+            if values.len() == 1 {
+                values.get(0)
+            } else {
+                values.get(i)
+            }
+        }
+        ExitParams {
+            stop_loss: value(&self.stop_loss, i),
+            take_profit: value(&self.take_profit, i),
+            trailing_stop: value(&self.trailing_stop, i),
+            break_even: value(&self.break_even, i),
+        }
+    }
+}
+
+/// 單一執行緒負責一組出場參數：只掃描輸入一次，內層迴圈依序更新各組合的狀態
+///
+/// row_params 為 Some 時各組合改用進場當根的逐列參數。
+fn advanced_exit_task(
+    positions: &[i64],
+    high: &Prices,
+    low: &Prices,
+    entry_price: &Prices,
+    direction: TradeDirection,
+    row_params: Option<&RowParams>,
+    specs: &[(String, ExitParams)],
+) -> PolarsResult<Vec<Series>> {
+    let len = positions.len();
+    let mut context = IntradeState::new();
+    let mut prev: Option<IntradeBar> = None;
+    let mut states: Vec<ExitState> = specs.iter().map(|(_, p)| ExitState::new(*p)).collect();
+    let mut builders: Vec<ExitBuilder> =
+        specs.iter().map(|_| ExitBuilder::with_capacity(len)).collect();
+
+    for i in 0..len {
+        let (h, l) = (high.get(i), low.get(i));
+        let bar = context.update(i, positions[i], h, l, entry_price.get(i));
+        match (bar, prev) {
+            (Some(bar), Some(prev)) if bar.holding_idx > 0 => {
+                for (state, builder) in states.iter_mut().zip(builders.iter_mut()) {
+                    builder.push(state.check(direction, &prev, h, l));
+                }
+            },
+            (Some(_), _) => {
+                // 進場當根：以收盤進場，自下一根開始檢查出場
+                for ((state, builder), (_, params)) in
+                    states.iter_mut().zip(builders.iter_mut()).zip(specs)
+                {
+                    state.enter(row_params.map_or(*params, |rows| rows.at(i)));
+                    builder.push(None);
+                }
+            },
+            (None, _) => builders.iter_mut().for_each(|b| b.push(None)),
+        }
+        prev = bar;
+    }
+
+    builders
+        .into_iter()
+        .zip(specs)
+        .map(|(builder, (name, _))| profiling::build(|| builder.finish(name)))
+        .collect()
+}
+
+/// 進階出場：單次掃描解析停損、停利、移動停損與保本停損的首次觸發
+///
+/// 輸入依序為 positions_out, high, low, entry_price 與逐列的
+/// stop_loss, take_profit, trailing_stop, break_even；
+/// 指定參數列表時忽略逐列參數，返回每組參數一個字段的寬結構體。
+#[polars_expr(output_type_func_with_kwargs=advanced_exit_output_type)]
+fn advanced_exit(inputs: &[Series], kwargs: AdvancedExitKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("advanced_exit", inputs);
+    let direction = TradeDirection::parse(&kwargs.direction)?;
+    let positions_ca: &Int64Chunked = inputs[0].i64()?;
+    let high = Prices::new(&inputs[1])?;
+    let low = Prices::new(&inputs[2])?;
+    let price = Prices::new(&inputs[3])?;
+
+    let len = positions_ca.len();
+    polars_ensure!(
+        high.len() == len && low.len() == len && price.len() == len,
+        ShapeMismatch: "advanced_exit: inputs must have the same length"
+    );
+
+    let positions = position_values(positions_ca);
+
+    let Some(param_list) = kwargs.params else {
+        let mut columns = Vec::with_capacity(4);
+        for s in &inputs[4..8] {
+            let values = Prices::new(s)?;
+            polars_ensure!(
+                values.len() == 1 || values.len() == len,
+                ShapeMismatch: "advanced_exit: exit parameters must be scalars or have the same length as the inputs"
+            );
+            columns.push(values);
+        }
+        let mut columns = columns.into_iter();
+        let row_params = RowParams {
+            stop_loss: columns.next().unwrap(),
+            take_profit: columns.next().unwrap(),
+            trailing_stop: columns.next().unwrap(),
+            break_even: columns.next().unwrap(),
+        };
+        let spec = ("advanced_exit".to_string(), ExitParams::DISABLED);
+        return advanced_exit_task(
+            &positions,
+            &high,
+            &low,
+            &price,
+            direction,
+            Some(&row_params),
+            std::slice::from_ref(&spec),
+        )
+        .map(|mut fields| fields.pop().unwrap());
+    };
+
+    polars_ensure!(
+        !param_list.is_empty(),
+        InvalidOperation: "advanced_exit: params must not be empty"
+    );
+    let specs: Vec<(String, ExitParams)> =
+        param_list.iter().map(|p| (p.name(), p.params())).collect();
+
+    // 依執行緒數切分參數組合，每個執行緒各自掃描一次輸入
+    let chunk_size = specs.len().div_ceil(rayon::current_num_threads().max(1));
+    let fields: Vec<Series> = specs
+        .par_chunks(chunk_size.max(1))
+        .map(|chunk| advanced_exit_task(&positions, &high, &low, &price, direction, None, chunk))
+        .collect::<PolarsResult<Vec<_>>>()?
+        .into_iter()
+        .flatten()
+        .collect();
+
+    profiling::build(|| {
+        Ok(StructChunked::from_series("advanced_exit".into(), len, fields.iter())?.into_series())
+    })
+}
+
+fn advanced_exit_output_type(
+    _input_fields: &[Field],
+    kwargs: AdvancedExitKwargs,
+) -> PolarsResult<Field> {
+    let dtype = match kwargs.params {
+        None => DataType::Struct(exit_fields()),
+        Some(param_list) => DataType::Struct(
+            param_list
+                .iter()
+                .map(|p| Field::new(p.name().into(), DataType::Struct(exit_fields())))
+                .collect(),
+        ),
+    };
+    Ok(Field::new("advanced_exit".into(), dtype))
+}
+
+/// 掃描中的交易與其最大不利/有利偏移
+struct ExcursionTrade {
+    position_id: i64,
+    entry_idx: usize,
+    entry_price: f64,
+    mae: f64,
+    mfe: f64,
+    mae_offset: usize,
+    mfe_offset: usize,
+}
+
+impl ExcursionTrade {
+    fn new(position_id: i64, entry_idx: usize, entry_price: f64) -> Self {
+        // 進場價缺值時偏移無法計算，以 NaN 表示且之後的比較皆不成立
+        let zero = if entry_price.is_nan() { f64::NAN } else { 0.0 };
+        Self {
+            position_id,
+            entry_idx,
+            entry_price,
+            mae: zero,
+            mfe: zero,
+            mae_offset: 0,
+            mfe_offset: 0,
+        }
+    }
+
+    /// 以進場後的一根 K 棒更新偏移，偏移為相對進場價的比例
+    #[inline(always)]
+    fn update(&mut self, idx: usize, direction: TradeDirection, high: f64, low: f64) {
+        let d = direction.sign();
+        let (adverse, favorable) = match direction {
+            TradeDirection::Long => (low, high),
+            TradeDirection::Short => (high, low),
+        };
+        let adverse = d * (adverse - self.entry_price) / self.entry_price;
+        let favorable = d * (favorable - self.entry_price) / self.entry_price;
+        if adverse < self.mae {
+            self.mae = adverse;
+            self.mae_offset = idx - self.entry_idx;
+        }
+        if favorable > self.mfe {
+            self.mfe = favorable;
+            self.mfe_offset = idx - self.entry_idx;
+        }
+    }
+}
+
+/// 每筆交易一列的 MAE/MFE 輸出緩衝區
+#[derive(Default)]
+struct ExcursionBuilder {
+    position_id: Vec<i64>,
+    entry_idx: Vec<i64>,
+    exit_idx: Vec<i64>,
+    entry_price: Vec<f64>,
+    exit_price: Vec<f64>,
+    mae: Vec<f64>,
+    mfe: Vec<f64>,
+    mae_offset: Vec<i64>,
+    mfe_offset: Vec<i64>,
+}
+
+impl ExcursionBuilder {
+    fn push(&mut self, trade: &ExcursionTrade, exit_idx: usize, exit_price: f64) {
+        self.position_id.push(trade.position_id);
+        self.entry_idx.push(trade.entry_idx as i64);
+        self.exit_idx.push(exit_idx as i64);
+        self.entry_price.push(trade.entry_price);
+        self.exit_price.push(exit_price);
+        self.mae.push(trade.mae);
+        self.mfe.push(trade.mfe);
+        self.mae_offset.push(trade.mae_offset as i64);
+        self.mfe_offset.push(trade.mfe_offset as i64);
+    }
+
+    fn finish(self) -> PolarsResult<Series> {
+        let len = self.position_id.len();
+        let float = |name: &str, values: Vec<f64>| -> Series {
+            let validity = values.iter().map(|v| !v.is_nan()).collect::<MutableBitmap>();
+            Float64Chunked::from_vec_validity(name.into(), values, into_validity(validity))
+                .into_series()
+        };
+        let fields = vec![
+            Int64Chunked::from_vec("position_id".into(), self.position_id).into_series(),
+            Int64Chunked::from_vec("entry_idx".into(), self.entry_idx).into_series(),
+            Int64Chunked::from_vec("exit_idx".into(), self.exit_idx).into_series(),
+            float("entry_price", self.entry_price),
+            float("exit_price", self.exit_price),
+            float("mae", self.mae),
+            float("mfe", self.mfe),
+            Int64Chunked::from_vec("mae_offset".into(), self.mae_offset).into_series(),
+            Int64Chunked::from_vec("mfe_offset".into(), self.mfe_offset).into_series(),
+        ];
+        Ok(StructChunked::from_series("trade_excursions".into(), len, fields.iter())?.into_series())
+    }
+}
+
+#[derive(Deserialize)]
+struct TradeExcursionsKwargs {
+    direction: String,
+}
+
+/// 每筆交易的最大不利偏移（MAE）與最大有利偏移（MFE）
+///
+/// 單次掃描 positions_out，每個連續且相同的持倉ID（>= 0）區段為一筆交易；
+/// 偏移以進場價為起點（0），只計入進場後到出場當根的最高/最低價。
+#[polars_expr(output_type_func=trade_excursions_output_type)]
+fn trade_excursions(inputs: &[Series], kwargs: TradeExcursionsKwargs) -> PolarsResult<Series> {
+    let _profile = profiling::Scope::new("trade_excursions", inputs);
+    let direction = TradeDirection::parse(&kwargs.direction)?;
+    let positions_ca: &Int64Chunked = inputs[0].i64()?;
+    let high = Prices::new(&inputs[1])?;
+    let low = Prices::new(&inputs[2])?;
+    let entry_price = Prices::new(&inputs[3])?;
+    let exit_price = Prices::new(&inputs[4])?;
+
+    let len = positions_ca.len();
+    polars_ensure!(
+        high.len() == len && low.len() == len && entry_price.len() == len && exit_price.len() == len,
+        ShapeMismatch: "trade_excursions: inputs must have the same length"
+    );
+
+    let positions = position_values(positions_ca);
+
+    let mut builder = ExcursionBuilder::default();
+    let mut current: Option<ExcursionTrade> = None;
+    for (i, &position) in positions.iter().enumerate() {
+        match current.as_mut() {
+            Some(trade) if trade.position_id == position => {
+                trade.update(i, direction, high.get(i), low.get(i));
+                continue;
+            },
+            _ => {},
+        }
+        if let Some(trade) = current.take() {
+            builder.push(&trade, i - 1, exit_price.get(i - 1));
+        }
+        if position >= 0 {
+            current = Some(ExcursionTrade::new(position, i, entry_price.get(i)));
+        }
+    }
+    if let Some(trade) = current.take() {
+        builder.push(&trade, len - 1, exit_price.get(len - 1));
+    }
+
+    profiling::build(|| builder.finish())
+}
+
+fn trade_excursions_output_type(_input_fields: &[Field]) -> PolarsResult<Field> {
+    let fields = vec![
+        Field::new("position_id".into(), DataType::Int64),
+        Field::new("entry_idx".into(), DataType::Int64),
+        Field::new("exit_idx".into(), DataType::Int64),
+        Field::new("entry_price".into(), DataType::Float64),
+        Field::new("exit_price".into(), DataType::Float64),
+        Field::new("mae".into(), DataType::Float64),
+        Field::new("mfe".into(), DataType::Float64),
+        Field::new("mae_offset".into(), DataType::Int64),
+        Field::new("mfe_offset".into(), DataType::Int64),
+    ];
+    Ok(Field::new("trade_excursions".into(), DataType::Struct(fields)))
+}
@@ -0,0 +1,171 @@
+use polars::prelude::*;
+use polars_arrow::bitmap::Bitmap;
+
+/// 數值輸入的唯讀視圖，內部一律以 f64 累加
+///
+/// Float64/Float32/Int32/Int64 在單一 chunk 且無缺值時直接讀取原始緩衝區，
+/// 不做升型複製；其餘情況（多 chunk、含缺值或其他數值型別）才複製一次為 f64，
+/// 並以 NaN 表示缺值。
+pub(crate) enum Prices<'a> {
+    F64(&'a [f64]),
+    F32(&'a [f32]),
+    I32(&'a [i32]),
+    I64(&'a [i64]),
+    Owned(Vec<f64>),
+}
+
+/// 單一 chunk 且無缺值時取得原始切片
+fn contiguous<T: PolarsNumericType>(ca: &ChunkedArray<T>) -> Option<&[T::Native]> {
+    (ca.chunks().len() == 1 && ca.null_count() == 0)
+        .then(|| ca.downcast_iter().next().unwrap().values().as_slice())
+}
+
+impl<'a> Prices<'a> {
+    pub(crate) fn new(s: &'a Series) -> PolarsResult<Self> {
+        let borrowed = match s.dtype() {
+            DataType::Float64 => contiguous(s.f64()?).map(Self::F64),
+            DataType::Float32 => contiguous(s.f32()?).map(Self::F32),
+            DataType::Int32 => contiguous(s.i32()?).map(Self::I32),
+            DataType::Int64 => contiguous(s.i64()?).map(Self::I64),
+            dtype if dtype.is_primitive_numeric() => None,
+            dtype => polars_bail!(
+                SchemaMismatch: "expected a numeric column, got {} for '{}'", dtype, s.name()
+            ),
+        };
+        Ok(match borrowed {
+            Some(prices) => prices,
+            None => {
+                let values = s.cast(&DataType::Float64)?;
+                Self::Owned(
+                    values
+                        .f64()?
+                        .into_iter()
+                        .map(|v| v.unwrap_or(f64::NAN))
+                        .collect(),
+                )
+            },
+        })
+    }
+
+    #[inline(always)]
+    pub(crate) fn len(&self) -> usize {
+        match self {
+            Self::F64(values) => values.len(),
+            Self::F32(values) => values.len(),
+            Self::I32(values) => values.len(),
+            Self::I64(values) => values.len(),
+            Self::Owned(values) => values.len(),
+        }
+    }
+
+    #[inline(always)]
+    pub(crate) fn get(&self, i: usize) -> f64 {
+        match self {
+            Self::F64(values) => values[i],
+            Self::F32(values) => values[i] as f64,
+            Self::I32(values) => values[i] as f64,
+            Self::I64(values) => values[i] as f64,
+            Self::Owned(values) => values[i],
+        }
+    }
+
+    /// 純量參數（長度為 1 的欄位）的值，缺值時返回 default
+    pub(crate) fn scalar(&self, default: f64) -> f64 {
+        if self.len() == 0 {
+            return default;
+        }
+        let value = self.get(0);
+        if value.is_nan() {
+            default
+        } else {
+            value
+        }
+    }
+}
+
+/// 浮點輸出精度，由呼叫端指定；內部計算一律使用 f64，只在輸出時轉換
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub(crate) enum Precision {
+    Float32,
+    #[default]
+    Float64,
+}
+
+impl Precision {
+    pub(crate) fn parse(value: &str) -> PolarsResult<Self> {
+        match value.to_ascii_lowercase().as_str() {
+            "float32" | "f32" => Ok(Self::Float32),
+            "float64" | "f64" => Ok(Self::Float64),
+            _ => polars_bail!(
+                InvalidOperation: "output dtype must be one of 'float32' or 'float64', got '{}'", value
+            ),
+        }
+    }
+
+    pub(crate) fn dtype(self) -> DataType {
+        match self {
+            Self::Float32 => DataType::Float32,
+            Self::Float64 => DataType::Float64,
+        }
+    }
+
+    /// 由 f64 緩衝區建立輸出欄位，Float32 時逐值轉換一次
+    pub(crate) fn series(
+        self,
+        name: PlSmallStr,
+        values: Vec<f64>,
+        validity: Option<Bitmap>,
+    ) -> Series {
+        match self {
+            Self::Float64 => Float64Chunked::from_vec_validity(name, values, validity).into_series(),
+            Self::Float32 => {
+                let values: Vec<f32> = values.into_iter().map(|v| v as f32).collect();
+                Float32Chunked::from_vec_validity(name, values, validity).into_series()
+            },
+        }
+    }
+}
+
+/// 依 s 的 chunk 邊界返回各段的 (offset, len)，略過空 chunk；空輸入返回單一空段
+pub(crate) fn chunk_ranges(s: &Series) -> Vec<(usize, usize)> {
+    let mut offset = 0usize;
+    let mut ranges: Vec<(usize, usize)> = s
+        .chunk_lengths()
+        .filter(|&len| len > 0)
+        .map(|len| {
+            let range = (offset, len);
+            offset += len;
+            range
+        })
+        .collect();
+    if ranges.is_empty() {
+        ranges.push((0, 0));
+    }
+    ranges
+}
+
+/// 依第一個輸入的 chunk 邊界逐段執行 kernel，輸出以 chunk 形式依序串接
+///
+/// kernel 收到各輸入對應該段的零複製切片，狀態由閉包跨段延續；輸出的 chunk 佈局
+/// 與第一個輸入相同，不需先 rechunk 整個歷史。其他輸入的 chunk 邊界不一致時，
+/// 該段切片可能含多個 chunk，此時只複製該段。
+pub(crate) fn map_chunks<F>(inputs: &[&Series], mut kernel: F) -> PolarsResult<Series>
+where
+    F: FnMut(&[Series]) -> PolarsResult<Series>,
+{
+    let mut out: Option<Series> = None;
+    for (offset, len) in chunk_ranges(inputs[0]) {
+        let sliced: Vec<Series> = inputs
+            .iter()
+            .map(|s| s.slice(offset as i64, len))
+            .collect();
+        let part = kernel(&sliced)?;
+        match out.as_mut() {
+            Some(out) => {
+                out.append_owned(part)?;
+            },
+            None => out = Some(part),
+        }
+    }
+    Ok(out.unwrap())
+}
@@ -0,0 +1,95 @@
+import polars as pl
+import pytest
+from polars_indicator import (
+    clean_enex_position,
+    extract_trades,
+    supertrend,
+    supertrend_from_ohlc,
+)
+from polars_indicator.backtest import expand_grid, run_grid
+
+
+def random_walk_ohlc(n: int = 300) -> pl.DataFrame:
+    """輔助函數：產生可重現的隨機漫步 OHLC"""
+    close, rows = 100.0, []
+    state = 12345
+    for _ in range(n):
+        state = (state * 1103515245 + 12345) % 2**31
+        close += (state / 2**31 - 0.5) * 2.0
+        spread = 0.2 + (state % 100) / 100.0
+        rows.append((close + spread, close - spread, close))
+    return pl.DataFrame(rows, schema=["high", "low", "close"], orient="row")
+
+
+def test_expand_grid():
+    """測試網格展開與預設參數"""
+    variants = expand_grid({"upper_multiplier": [1.5, 2.0], "atr_period": [10, 14]})
+    assert len(variants) == 4
+    assert variants[0]["lower_multiplier"] == 2.0
+    assert {(v["upper_multiplier"], v["atr_period"]) for v in variants} == {
+        (1.5, 10),
+        (1.5, 14),
+        (2.0, 10),
+        (2.0, 14),
+    }
+
+    with pytest.raises(ValueError):
+        expand_grid([{"unknown": 1}])
+
+
+def test_run_grid_matches_single_variant(tmp_path):
+    """測試網格回測與單獨計算一個組合的交易結果一致"""
+    df = random_walk_ohlc()
+    grid = {
+        "upper_multiplier": [1.0, 2.0],
+        "lower_multiplier": [1.0, 2.0],
+        "atr_period": [5, 14],
+    }
+
+    summary = run_grid(df, grid, max_workers=2, trades_dir=tmp_path)
+
+    assert summary.height == 8
+    assert summary["variant"].to_list() == list(range(8))
+    assert summary["count"].min() > 0
+
+    # 單獨計算第一個組合
+    direction = pl.col("supertrend").struct.field("direction")
+    expected = (
+        df.with_columns(
+            atr=supertrend_from_ohlc(atr_period=5, include_atr=True).struct.field("atr")
+        )
+        .with_columns(supertrend(upper_multiplier=1.0, lower_multiplier=1.0))
+        .with_columns(
+            clean_enex_position(
+                (direction == 1) & (direction.shift(1) == -1),
+                (direction == -1) & (direction.shift(1) == 1),
+            )
+        )
+        .select(extract_trades())
+        .unnest("trades")
+    )
+    trades = pl.read_parquet(summary["trades_path"][0])
+    assert trades.drop("returns").equals(expected)
+    assert summary["count"][0] == expected.height
+
+
+def test_run_grid_advanced_exit(tmp_path):
+    """測試停損以觸發價出場，且改變了只用信號出場的交易結果"""
+    df = random_walk_ohlc()
+    summary = run_grid(df, [{}, {"stop_loss": 0.005}], trades_dir=tmp_path)
+
+    assert summary["stop_loss"].to_list() == [None, 0.005]
+    signal_only = pl.read_parquet(summary["trades_path"][0])
+    with_stop = pl.read_parquet(summary["trades_path"][1])
+
+    # 停損以進場價的 99.5% 成交，其餘交易以收盤價出場，虧損不會超過停損比例
+    stopped = with_stop.filter(
+        (pl.col("exit_price") - pl.col("entry_price") * 0.995).abs() < 1e-9
+    )
+    assert stopped.height > 0
+    assert stopped["returns"].to_list() == pytest.approx([-0.005] * stopped.height)
+    assert with_stop["returns"].min() == pytest.approx(-0.005)
+
+    # 只用信號出場時有虧損超過停損比例的交易，停損確實改變了結果
+    assert signal_only["returns"].min() < -0.005
+    assert summary["total_return"][0] != summary["total_return"][1]
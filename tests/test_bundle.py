@@ -0,0 +1,125 @@
+import numpy as np
+import polars as pl
+import pytest
+from polars_indicator import (
+    atr,
+    clean_enex_position,
+    indicator_bundle,
+    supertrend,
+    supertrend_from_ohlc,
+)
+
+
+def random_walk(n: int = 300, seed: int = 13) -> pl.DataFrame:
+    """輔助函數：產生隨機漫步的 OHLC、ATR 與兩組進出場信號"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0.0, 0.5, n))
+    spread = np.abs(rng.normal(0.0, 0.3, n)) + 0.05
+    return pl.DataFrame(
+        {
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "atr": spread * 2.0,
+            "entry": rng.random(n) < 0.1,
+            "exit": rng.random(n) < 0.1,
+            "fast_entry": rng.random(n) < 0.3,
+            "fast_exit": rng.random(n) < 0.3,
+        }
+    )
+
+
+def test_indicator_bundle_matches_individual_calls():
+    """測試每個字段與單獨呼叫對應函數的結果一致"""
+    df = random_walk()
+    result = df.select(
+        indicator_bundle(
+            {
+                "st_2": {"kind": "supertrend"},
+                "st_3": {
+                    "kind": "supertrend",
+                    "upper_multiplier": 3.0,
+                    "lower_multiplier": 3.0,
+                },
+                "atr_7": {"kind": "atr", "period": 7, "smoothing": "ema"},
+                "pos": {"kind": "clean_enex_position"},
+                "pos_fast": {
+                    "kind": "clean_enex_position",
+                    "entries": "fast_entry",
+                    "exits": pl.col("fast_exit"),
+                    "entry_first": False,
+                },
+            }
+        )
+    ).unnest("indicator_bundle")
+
+    expected = df.select(
+        supertrend().alias("st_2"),
+        supertrend(upper_multiplier=3.0, lower_multiplier=3.0).alias("st_3"),
+        atr(period=7, smoothing="ema").alias("atr_7"),
+        clean_enex_position("entry", "exit").alias("pos"),
+        clean_enex_position("fast_entry", "fast_exit", False).alias("pos_fast"),
+    )
+    assert result.equals(expected)
+
+
+def test_indicator_bundle_shared_inputs_with_nulls_and_chunks():
+    """測試含缺值、多個 chunk 的共用輸入，以及由 OHLC 計算 ATR 的 supertrend_from_ohlc"""
+    df = random_walk().with_columns(
+        close=pl.when(pl.int_range(pl.len()) % 17 == 5)
+        .then(None)
+        .otherwise(pl.col("close"))
+    )
+    df = pl.concat([df[:100], df[100:]], rechunk=False)
+    assert df["high"].n_chunks() == 2
+
+    result = df.select(
+        indicator_bundle(
+            {
+                "st": {"kind": "supertrend"},
+                "st_ohlc": {
+                    "kind": "supertrend_from_ohlc",
+                    "atr_period": 10,
+                    "smoothing": "sma",
+                    "upper_multiplier": 3.0,
+                },
+                "atr_10": {"kind": "atr", "period": 10, "smoothing": "sma"},
+            }
+        )
+    ).unnest("indicator_bundle")
+
+    expected = df.select(
+        supertrend().alias("st"),
+        supertrend_from_ohlc(
+            atr_period=10, smoothing="sma", upper_multiplier=3.0
+        ).alias("st_ohlc"),
+        atr(period=10, smoothing="sma").alias("atr_10"),
+    )
+    assert result.equals(expected)
+
+
+def test_indicator_bundle_output_dtype():
+    """測試 output_dtype 套用到所有浮點字段"""
+    df = random_walk(50)
+    schema = (
+        df.lazy()
+        .select(
+            indicator_bundle(
+                {"st": {"kind": "supertrend"}, "atr": {"kind": "atr"}},
+                output_dtype="float32",
+            )
+        )
+        .collect_schema()
+    )
+
+    fields = {f.name: f.dtype for f in schema["indicator_bundle"].fields}
+    assert fields["atr"] == pl.Float32
+    assert fields["st"].fields[1].dtype == pl.Float32
+
+
+def test_indicator_bundle_invalid_spec():
+    """測試未知的指標種類或多餘的鍵會報錯"""
+    with pytest.raises(ValueError, match="unknown kind"):
+        indicator_bundle({"x": {"kind": "macd"}})
+    with pytest.raises(ValueError, match="unexpected keys"):
+        indicator_bundle({"x": {"kind": "atr", "upper_multiplier": 2.0}})
@@ -0,0 +1,132 @@
+import numpy as np
+import polars as pl
+import pytest
+from polars_indicator import (
+    atr,
+    clean_enex_position,
+    supertrend,
+    supertrend_from_ohlc,
+)
+from polars_indicator._internal import fingerprint_blocks
+from polars_indicator.cache import IndicatorCache
+
+
+def random_walk(n: int = 300, seed: int = 9) -> pl.DataFrame:
+    """輔助函數：產生隨機漫步的 OHLC、ATR 與進出場信號"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0.0, 0.5, n))
+    spread = np.abs(rng.normal(0.0, 0.3, n)) + 0.05
+    return pl.DataFrame(
+        {
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "atr": spread * 2.0,
+            "entry": rng.random(n) < 0.1,
+            "exit": rng.random(n) < 0.1,
+        }
+    )
+
+
+def test_fingerprint_ignores_chunk_layout():
+    """測試指紋只取決於內容，與 chunk 佈局無關"""
+    s = pl.Series("x", [1.0, None, 3.0, 4.0, 5.0])
+    chunked = pl.concat([s[:2], s[2:]], rechunk=False)
+    assert chunked.n_chunks() == 2
+
+    assert fingerprint_blocks([s], 2) == fingerprint_blocks([chunked], 2)
+    assert len(fingerprint_blocks([s], 2)) == 3
+    assert fingerprint_blocks([s], 2) != fingerprint_blocks([s.fill_null(0.0)], 2)
+
+
+def test_cache_hit(tmp_path):
+    """測試第二次呼叫由快取讀回，結果與直接計算一致"""
+    df = random_walk()
+    cache = IndicatorCache(tmp_path, block_size=64)
+    expected = df.select(supertrend())["supertrend"]
+
+    first = cache.supertrend(df)
+    files = sorted(tmp_path.glob("*/*.arrow"))
+    second = cache.supertrend(df)
+
+    assert first.equals(expected)
+    assert second.equals(expected)
+    assert sorted(tmp_path.glob("*/*.arrow")) == files
+    assert len(files) == 1
+
+
+def test_cache_append_reuses_prefix(tmp_path):
+    """測試附加資料時重用快取的前綴，並從保存的狀態接續計算"""
+    df = random_walk()
+    cache = IndicatorCache(tmp_path, block_size=64)
+    cache.supertrend(df[:150])
+    cache.clean_enex_position(df[:150])
+
+    st = cache.supertrend(df)
+    enex = cache.clean_enex_position(df)
+
+    assert st.n_chunks() > 1
+    assert st.equals(df.select(supertrend())["supertrend"])
+    assert enex.equals(
+        df.select(clean_enex_position("entry", "exit"))["clean_enex_position"]
+    )
+
+
+def test_cache_append_reuses_atr_state(tmp_path):
+    """測試 atr 與 supertrend_from_ohlc 附加資料時從快取的 ATR 狀態接續計算"""
+    df = random_walk()
+    cache = IndicatorCache(tmp_path, block_size=64)
+    for smoothing in ["rma", "sma"]:
+        cache.atr(df[:150], period=10, smoothing=smoothing)
+        cache.supertrend_from_ohlc(df[:150], atr_period=10, smoothing=smoothing)
+
+        result = cache.atr(df, period=10, smoothing=smoothing)
+        st = cache.supertrend_from_ohlc(df, atr_period=10, smoothing=smoothing)
+
+        # 由前綴與新增部分兩個 chunk 組成，而不是整段重新計算
+        assert result.n_chunks() > 1
+        assert st.n_chunks() > 1
+        assert result.equals(df.select(atr(period=10, smoothing=smoothing))["atr"])
+        assert st.equals(
+            df.select(supertrend_from_ohlc(atr_period=10, smoothing=smoothing))[
+                "supertrend"
+            ]
+        )
+
+    st = cache.supertrend_from_ohlc(df, include_atr=True)
+    assert st.equals(df.select(supertrend_from_ohlc(include_atr=True))["supertrend"])
+
+
+def test_cache_select_and_eviction(tmp_path):
+    """測試任意表達式的快取，以及超過大小上限時淘汰最久未使用的項目"""
+    df = random_walk()
+    cache = IndicatorCache(tmp_path)
+    expected = df.select(atr(period=14))
+
+    assert cache.select(df, atr(period=14)).equals(expected)
+    assert cache.select(df, atr(period=14)).equals(expected)
+
+    cache.max_bytes = cache.size()
+    cache.select(df, atr(period=7))
+    assert len(list(tmp_path.glob("*/*.arrow"))) == 1
+    assert cache.size() <= cache.max_bytes
+
+
+def test_cache_select_resolves_wildcard_inputs(tmp_path):
+    """測試 pl.all()、nth、正規表示式依實際讀取的欄位建立鍵，同列數的不同資料不會誤命中"""
+    df = random_walk().select("high", "low", "close")
+    other = df.with_columns(pl.col("close") + 1.0)
+    cache = IndicatorCache(tmp_path)
+
+    for frame in [df, other, df]:
+        assert cache.select(frame, pl.all().sum()).equals(frame.select(pl.all().sum()))
+    assert cache.select(other, pl.nth(2)).equals(other.select(pl.nth(2)))
+    regex = pl.col("^(high|low)$").max()
+    assert cache.select(df, regex).equals(df.select(regex))
+
+    # 內容相同但欄位名稱不同時，輸出名稱也不同
+    renamed = df.rename({"close": "last"})
+    assert cache.select(renamed, pl.all().sum()).columns == ["high", "low", "last"]
+
+    with pytest.raises(ValueError, match="cannot resolve"):
+        cache.select(df, pl.col("missing"))
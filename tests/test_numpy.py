@@ -0,0 +1,111 @@
+import numpy as np
+import polars as pl
+import pytest
+from polars_indicator import SuperTrendState, clean_enex_position, supertrend
+from polars_indicator._internal import clean_enex_position_np, supertrend_np
+
+
+def random_walk(n: int = 200, seed: int = 3) -> pl.DataFrame:
+    """輔助函數：產生隨機漫步的 OHLC 與 ATR"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0.0, 0.5, n))
+    spread = np.abs(rng.normal(0.0, 0.3, n)) + 0.05
+    return pl.DataFrame(
+        {
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "atr": spread * 2.0,
+        }
+    )
+
+
+def test_supertrend_np_matches_expression():
+    """測試寫入輸出陣列的結果與表達式一致，且可分批以狀態接續"""
+    df = random_walk()
+    expected = df.select(supertrend()).unnest("supertrend")
+    high, low, close, atr = (df[c].to_numpy() for c in ["high", "low", "close", "atr"])
+
+    n = df.height
+    direction = np.empty(n, dtype=np.int32)
+    long, short, trend = (np.empty(n) for _ in range(3))
+    supertrend_np(high, low, close, atr, direction, long, short, trend)
+
+    assert direction.tolist() == expected["direction"].to_list()
+    assert np.array_equal(trend, expected["trend"].to_numpy())
+    assert np.array_equal(long, expected["long"].to_numpy(), equal_nan=True)
+    assert np.array_equal(short, expected["short"].to_numpy(), equal_nan=True)
+
+    # 分兩批寫入同一組輸出陣列的不同區段
+    state = SuperTrendState()
+    batched = np.empty(n)
+    for part in [slice(0, 50), slice(50, n)]:
+        supertrend_np(
+            high[part], low[part], close[part], atr[part],
+            np.empty(part.stop - part.start, dtype=np.int32),
+            np.empty(part.stop - part.start),
+            np.empty(part.stop - part.start),
+            batched[part],
+            state=state,
+        )  # fmt: skip
+    assert np.array_equal(batched, trend)
+
+
+def test_supertrend_np_validates_buffers():
+    """測試長度不一致、唯讀或與輸入重疊的輸出會報錯"""
+    x = np.ones(4)
+    direction = np.empty(4, dtype=np.int32)
+    with pytest.raises(ValueError):
+        supertrend_np(x, x, x, x, direction, np.empty(3), np.empty(4), np.empty(4))
+
+    readonly = np.empty(4)
+    readonly.flags.writeable = False
+    with pytest.raises(ValueError):
+        supertrend_np(x, x, x, x, direction, readonly, np.empty(4), np.empty(4))
+
+    with pytest.raises(ValueError):
+        supertrend_np(x, x, x, x, direction, x, np.empty(4), np.empty(4))
+
+
+def test_clean_enex_position_np_matches_expression():
+    """測試結果與表達式一致，返回的最終狀態可接續下一批"""
+    rng = np.random.default_rng(5)
+    entries = rng.random(300) < 0.1
+    exits = rng.random(300) < 0.1
+    expected = (
+        pl.DataFrame({"entry": entries, "exit": exits})
+        .select(clean_enex_position("entry", "exit"))
+        .unnest("clean_enex_position")
+    )
+
+    entries_out = np.empty(300, dtype=bool)
+    exits_out = np.empty(300, dtype=bool)
+    positions_out = np.empty(300, dtype=np.int64)
+    phase, position_id = -1, -1
+    for part in [slice(0, 100), slice(100, 300)]:
+        phase, position_id = clean_enex_position_np(
+            entries[part],
+            exits[part],
+            entries_out[part],
+            exits_out[part],
+            positions_out[part],
+            initial_phase=phase,
+            initial_position_id=position_id,
+        )
+
+    assert entries_out.tolist() == expected["entries_out"].to_list()
+    assert exits_out.tolist() == expected["exits_out"].to_list()
+    assert positions_out.tolist() == expected["positions_out"].to_list()
+    assert position_id == expected["positions_out"].max()
+
+    # 已進場的初始狀態必須帶有倉位編號
+    with pytest.raises(ValueError, match=">= 0"):
+        clean_enex_position_np(
+            entries,
+            exits,
+            entries_out,
+            exits_out,
+            positions_out,
+            initial_phase=1,
+            initial_position_id=-1,
+        )
@@ -0,0 +1,110 @@
+import math
+
+import polars as pl
+import pytest
+from polars_indicator import performance_summary
+
+
+def test_performance_summary():
+    """測試績效摘要與逐項計算的結果一致"""
+    returns = [0.1, -0.05, 0.02, -0.1, 0.03, None, 0.05]
+    df = pl.DataFrame({"returns": returns})
+
+    result = df.select(performance_summary("returns")).unnest("performance_summary")
+    row = result.row(0, named=True)
+
+    valid = [r for r in returns if r is not None]
+    equity, peak, max_drawdown = 1.0, 1.0, 0.0
+    for r in valid:
+        equity *= 1.0 + r
+        peak = max(peak, equity)
+        max_drawdown = min(max_drawdown, equity / peak - 1.0)
+    series = pl.Series(valid)
+    downside = math.sqrt(sum(min(r, 0.0) ** 2 for r in valid) / len(valid))
+
+    assert row["total_return"] == pytest.approx(equity - 1.0)
+    assert row["max_drawdown"] == pytest.approx(max_drawdown)
+    assert row["max_drawdown_duration"] == 5
+    assert row["sharpe"] == pytest.approx(series.mean() / series.std() * math.sqrt(252))
+    assert row["sortino"] == pytest.approx(series.mean() / downside * math.sqrt(252))
+    assert row["profit_factor"] == pytest.approx(0.2 / 0.15)
+    assert (row["count"], row["wins"], row["losses"]) == (6, 4, 2)
+    assert row["win_rate"] == pytest.approx(4 / 6)
+
+
+def test_performance_summary_group_by():
+    """測試 group_by().agg() 時每組各自計算，並支援價格與部位曝險輸入"""
+    df = pl.DataFrame(
+        {
+            "strategy_id": [0, 0, 0, 0, 1, 1, 1, 1],
+            "close": [100.0, 110.0, 99.0, 108.9, 100.0, 110.0, 99.0, 108.9],
+            "position": [1, 1, 0, 0, 0, 0, 1, 0],
+        }
+    )
+
+    result = (
+        df.group_by("strategy_id", maintain_order=True)
+        .agg(performance_summary(price="close", position="position"))
+        .unnest("performance_summary")
+    )
+
+    # 以前一根的曝險計算報酬：策略 0 為 +10%、-10%、0；策略 1 為 0、0、+10%
+    # 策略 0 持有一筆交易（+10% 後 -10%，複利為 -1%），策略 1 持有一筆 +10% 的交易
+    assert result["total_return"].to_list() == pytest.approx([-0.01, 0.1])
+    assert result["count"].to_list() == [1, 1]
+    assert result["wins"].to_list() == [0, 1]
+    assert result["losses"].to_list() == [1, 0]
+    assert result["win_rate"].to_list() == pytest.approx([0.0, 1.0])
+    assert result["profit_factor"][0] == pytest.approx(0.0)
+    assert result["profit_factor"][1] is None
+
+
+def test_performance_summary_trades_split_on_position_change():
+    """測試曝險改變（反手）時切分交易，未平倉的最後一筆不計入"""
+    df = pl.DataFrame(
+        {
+            "close": [100.0, 110.0, 121.0, 108.9, 119.79, 131.769],
+            "position": [1, 1, -1, 0, 1, 1],
+        }
+    )
+
+    row = (
+        df.select(performance_summary(price="close", position="position"))
+        .unnest("performance_summary")
+        .row(0, named=True)
+    )
+
+    # 多單 +10%、+10%（複利 +21%），空單 -(-10%) = +10%，最後一筆多單尚未平倉
+    assert (row["count"], row["wins"], row["losses"]) == (2, 2, 0)
+    assert row["win_rate"] == pytest.approx(1.0)
+
+
+def test_performance_summary_native_dtypes():
+    """測試整數價格、整數部位與 Float32 報酬直接計算，結果與 Float64 一致"""
+    df = pl.DataFrame(
+        {
+            "close": [1000, 1100, 1210, 1089, 1198, 1318],
+            "position": [1, 1, -1, 0, 1, 1],
+            "returns": [0.5, -0.25, 0.125, None, 0.25, 0.0],
+        }
+    )
+
+    def run(frame):
+        return frame.select(
+            by_price=performance_summary(price="close", position="position"),
+            by_returns=performance_summary("returns"),
+        )
+
+    expected = run(df.cast(pl.Float64))
+    for dtype in [pl.Int64, pl.Int32]:
+        result = run(df.with_columns(pl.col("close", "position").cast(dtype)))
+        assert result["by_price"].equals(expected["by_price"])
+    # 報酬值可由 Float32 精確表示
+    result = run(df.with_columns(pl.col("returns").cast(pl.Float32)))
+    assert result.equals(expected)
+
+
+def test_performance_summary_requires_input():
+    """測試未傳入報酬或價格與部位時報錯"""
+    with pytest.raises(ValueError):
+        performance_summary(price="close")
@@ -1,10 +1,49 @@
+import random
+
 import polars as pl
+import pytest
 from polars_indicator import (
+    EnexPositionState,
+    advanced_exit,
     clean_enex_position,
+    clean_enex_position_state,
+    extract_trades,
+    intrade_context,
     reshape_position_id_array,
+    reshape_position_id_diagnostics,
+    trade_excursions,
 )
 
 
+def reference_clean_enex(entries, exits, entry_first=True):
+    """輔助函數：逐列的參考實作，用於驗證 bitmap kernel"""
+    phase, position_id = -1, -1
+    entries_out, exits_out, positions_out = [], [], []
+    for entry, exit_ in zip(entries, exits):
+        entry, exit_ = bool(entry), bool(exit_)
+        if entry and exit_:
+            if entry_first:
+                exit_ = False
+            else:
+                entry = False
+        if entry and phase != 1:
+            phase = 1
+            position_id += 1
+            entries_out.append(True)
+            exits_out.append(False)
+            positions_out.append(position_id)
+        elif not entry and exit_ and phase == 1:
+            phase = 0
+            entries_out.append(False)
+            exits_out.append(True)
+            positions_out.append(position_id)
+        else:
+            entries_out.append(False)
+            exits_out.append(False)
+            positions_out.append(position_id if phase == 1 else -1)
+    return entries_out, exits_out, positions_out
+
+
 class TestPosition:
     def test_clean_enex_position_multi_entries(self):
         """測試多個連續進場信號"""
@@ -232,6 +271,143 @@ class TestPosition:
 
         assert result.height == 0
 
+    def test_clean_enex_position_by(self):
+        """測試 by 分組時每組重新編號並與 .over() 一致"""
+        df = pl.DataFrame(
+            {
+                "symbol": ["A", "A", "A", "A", "B", "B", "B", "B"],
+                "entry": [True, False, False, False, False, True, False, False],
+                "exit": [False, False, False, False, False, False, True, False],
+            }
+        )
+
+        result = df.select(
+            clean_enex_position("entry", "exit", True, by="symbol")
+        ).unnest("clean_enex_position")
+        expected = df.select(
+            clean_enex_position("entry", "exit", True).over("symbol")
+        ).unnest("clean_enex_position")
+
+        assert result.equals(expected)
+        assert result["positions_out"].to_list() == [0, 0, 0, 0, -1, 0, 0, -1]
+
+        # 初始狀態屬於單一延續的序列，不能套用到每個分組
+        with pytest.raises(ValueError, match="by cannot be combined"):
+            clean_enex_position("entry", "exit", initial_phase=1, by="symbol")
+        with pytest.raises(ValueError, match="by cannot be combined"):
+            clean_enex_position("entry", "exit", initial_position_id=3, by="symbol")
+
+    def test_clean_enex_position_resume_chunks(self):
+        """測試分段處理並延續狀態後與整段一次計算一致"""
+        df = pl.DataFrame(
+            {
+                "entry": [False, True, False, False, True, False, True, False],
+                "exit": [False, False, False, True, False, False, False, True],
+            }
+        )
+        expected = df.select(clean_enex_position("entry", "exit"))
+
+        # 在持倉中間切段
+        first, second = df.head(5), df.tail(3)
+        state = first.select(clean_enex_position_state("entry", "exit")).unnest(
+            "clean_enex_position_state"
+        )
+        assert state.to_dicts() == [{"phase": 1, "position_id": 1}]
+
+        result = pl.concat(
+            [
+                first.select(clean_enex_position("entry", "exit")),
+                second.select(
+                    clean_enex_position(
+                        "entry",
+                        "exit",
+                        initial_phase=state["phase"].item(),
+                        initial_position_id=state["position_id"].item(),
+                    )
+                ),
+            ]
+        )
+
+        assert result.equals(expected)
+        assert result.unnest("clean_enex_position")["positions_out"].to_list() == [
+            -1,
+            0,
+            0,
+            0,
+            1,
+            1,
+            1,
+            1,
+        ]
+
+    def test_clean_enex_position_invalid_initial_state(self):
+        """測試已進場或已出場的初始狀態必須帶有倉位編號"""
+        df = pl.DataFrame({"entry": [False, True], "exit": [True, False]})
+        for phase in [0, 1]:
+            with pytest.raises(pl.exceptions.ComputeError, match=">= 0"):
+                df.select(
+                    clean_enex_position(
+                        "entry", "exit", initial_phase=phase, initial_position_id=-1
+                    )
+                )
+            with pytest.raises(ValueError, match=">= 0"):
+                EnexPositionState(phase=phase, position_id=-1)
+
+        assert EnexPositionState(phase=1, position_id=0).position_id == 0
+
+    def test_clean_enex_position_matches_reference(self):
+        """測試跨越多個 64 位元字組、含缺值的信號與參考實作一致"""
+        rng = random.Random(7)
+        for density in [0.01, 0.3, 0.9]:
+            for entry_first in [True, False]:
+                n = 300
+                entries = [
+                    None if rng.random() < 0.05 else rng.random() < density
+                    for _ in range(n)
+                ]
+                exits = [
+                    None if rng.random() < 0.05 else rng.random() < density
+                    for _ in range(n)
+                ]
+                df = pl.DataFrame(
+                    {"entry": entries, "exit": exits},
+                    schema={"entry": pl.Boolean, "exit": pl.Boolean},
+                )
+
+                result = df.select(
+                    clean_enex_position("entry", "exit", entry_first)
+                ).unnest("clean_enex_position")
+                expected = reference_clean_enex(entries, exits, entry_first)
+
+                assert result["entries_out"].to_list() == expected[0]
+                assert result["exits_out"].to_list() == expected[1]
+                assert result["positions_out"].to_list() == expected[2]
+
+    def test_clean_enex_position_multi_chunk(self):
+        """測試多 chunk 輸入跨 chunk 延續狀態，且輸出保留相同的 chunk 佈局"""
+        rng = random.Random(11)
+        parts = [
+            pl.DataFrame(
+                {
+                    "entry": [rng.random() < 0.2 for _ in range(n)],
+                    "exit": [rng.random() < 0.2 for _ in range(n)],
+                }
+            )
+            for n in [70, 5, 130]
+        ]
+        df = pl.concat(parts, rechunk=False)
+        assert df["entry"].n_chunks() == 3
+
+        result = df.select(clean_enex_position("entry", "exit"))["clean_enex_position"]
+        expected = df.rechunk().select(clean_enex_position("entry", "exit"))
+
+        assert result.n_chunks() == 3
+        assert result.equals(expected["clean_enex_position"])
+
+        state = df.select(clean_enex_position_state("entry", "exit")).item()
+        positions = expected["clean_enex_position"].struct.field("positions_out")
+        assert state["position_id"] == positions.max()
+
     def test_reshape_position_id_array(self):
         """測試 reshape_position_id_array 函數"""
         df = pl.DataFrame(
@@ -273,3 +449,298 @@ class TestPosition:
         position_array = result["position_array"].to_list()
         expected = [0, 0, 0]
         assert position_array == expected
+
+    def test_reshape_position_id_array_overlap_policy(self):
+        """測試重疊交易的處理方式"""
+        df = pl.DataFrame(
+            {
+                "position_id": [0, 1],
+                "entry_idx": [1, 3],
+                "exit_idx": [4, 5],
+            }
+        )
+
+        def reshape(overlap: str) -> list:
+            return (
+                df.select(
+                    reshape_position_id_array(
+                        7, "position_id", "entry_idx", "exit_idx", overlap=overlap
+                    )
+                )
+                .to_series()
+                .to_list()
+            )
+
+        assert reshape("last") == [-1, 0, 0, 1, 1, 1, -1]
+        assert reshape("first") == [-1, 0, 0, 0, 0, 1, -1]
+        assert reshape("count") == [0, 1, 1, 2, 2, 1, 0]
+
+        # count 輸出的是涵蓋筆數，欄位名稱與位置ID區分
+        for overlap, name in [("last", "_position_id"), ("count", "overlap_count")]:
+            expr = reshape_position_id_array(
+                7, "position_id", "entry_idx", "exit_idx", overlap=overlap
+            )
+            assert df.select(expr).columns == [name]
+            assert df.lazy().select(expr).collect_schema().names() == [name]
+        with pytest.raises(pl.exceptions.ComputeError):
+            reshape("error")
+
+    def test_reshape_position_id_array_integer_dtypes(self):
+        """測試任意整數型別的索引"""
+        df = pl.DataFrame(
+            {
+                "position_id": pl.Series([0, 1], dtype=pl.UInt32),
+                "entry_idx": pl.Series([0, 3], dtype=pl.Int32),
+                "exit_idx": pl.Series([1, 4], dtype=pl.UInt16),
+            }
+        )
+
+        result = df.select(
+            reshape_position_id_array(5, "position_id", "entry_idx", "exit_idx")
+        )
+        assert result.to_series().to_list() == [0, 0, -1, 1, 1]
+
+        # 超過 Int64 範圍的 UInt64 position id 報錯，而不是截斷後合併成同一筆交易
+        overflow = df.with_columns(
+            pl.Series("position_id", [2**63, 2**63 + 1], dtype=pl.UInt64)
+        )
+        with pytest.raises(pl.exceptions.ComputeError, match="out of range"):
+            overflow.select(
+                reshape_position_id_array(5, "position_id", "entry_idx", "exit_idx")
+            )
+
+    def test_reshape_position_id_diagnostics(self):
+        """測試被拒絕與重疊交易的統計"""
+        df = pl.DataFrame(
+            {
+                "position_id": [0, 1, 2, 3, 4, 5],
+                "entry_idx": [0, 2, None, 8, 6, 1],
+                "exit_idx": [1, 4, 3, 20, 5, 2],
+            }
+        )
+
+        result = df.select(
+            reshape_position_id_diagnostics(10, "position_id", "entry_idx", "exit_idx")
+        ).unnest("reshape_position_id_diagnostics")
+
+        assert result.to_dicts() == [
+            {
+                "trades": 6,
+                "applied": 3,
+                "null": 1,
+                "out_of_range": 1,
+                "inverted": 1,
+                "overlapping": 3,
+            }
+        ]
+
+    def test_extract_trades(self):
+        """測試由清理後的信號產生交易列表"""
+        df = pl.DataFrame(
+            {
+                "entry": [False, True, False, False, False, False, True, False],
+                "exit": [False, False, False, True, False, False, False, False],
+                "close": [10.0, 11.0, 12.0, 13.0, 14.0, 15.0, 16.0, 17.0],
+            }
+        )
+
+        trades = df.select(
+            extract_trades(clean_enex_position("entry", "exit"), "close")
+        ).unnest("trades")
+
+        assert trades.to_dicts() == [
+            {
+                "position_id": 0,
+                "entry_idx": 1,
+                "exit_idx": 3,
+                "entry_price": 11.0,
+                "exit_price": 13.0,
+                "bars_held": 2,
+                "closed": True,
+            },
+            {
+                "position_id": 1,
+                "entry_idx": 6,
+                "exit_idx": 7,
+                "entry_price": 16.0,
+                "exit_price": 17.0,
+                "bars_held": 1,
+                "closed": False,
+            },
+        ]
+
+        # 交易列表可直接還原為位置ID數組
+        position_array = trades.select(
+            reshape_position_id_array(df.height, "position_id", "entry_idx", "exit_idx")
+        ).to_series()
+        cleaned = df.select(clean_enex_position("entry", "exit")).unnest(
+            "clean_enex_position"
+        )
+        assert position_array.to_list() == cleaned["positions_out"].to_list()
+
+    def test_intrade_context_matches_over(self):
+        """測試持倉運行欄位與 cum_max().over(position_id) 的結果一致"""
+        df = pl.DataFrame(
+            {
+                "entry": [False, True, False, False, False, True, False, False],
+                "exit": [False, False, False, True, False, False, False, True],
+                "high": [5.0, 6.0, 8.0, 7.0, 9.0, 4.0, 6.0, 5.0],
+                "low": [4.0, 5.0, 6.0, 3.0, 8.0, 3.0, 2.0, 4.0],
+                "close": [4.5, 5.5, 7.0, 4.0, 8.5, 3.5, 5.0, 4.5],
+            }
+        )
+
+        result = (
+            df.with_columns(clean_enex_position("entry", "exit"))
+            .select(intrade_context())
+            .unnest("intrade_context")
+        )
+
+        position = pl.col("clean_enex_position").struct.field("positions_out")
+        in_position = position >= 0
+        expected = (
+            df.with_columns(clean_enex_position("entry", "exit"))
+            .with_columns(row=pl.int_range(pl.len()), position=position)
+            .select(
+                entry_idx=pl.col("row").first().over("position"),
+                entry_price=pl.col("close").first().over("position"),
+                highest_high=pl.col("high").cum_max().over("position"),
+                lowest_low=pl.col("low").cum_min().over("position"),
+                holding_idx=(pl.col("row") - pl.col("row").first()).over("position"),
+                in_position=in_position,
+            )
+            .select(pl.when("in_position").then(pl.exclude("in_position")).name.keep())
+        )
+
+        assert result.equals(expected)
+        assert result["holding_idx"].to_list() == [None, 0, 1, 2, None, 0, 1, 2]
+        assert result["highest_high"].to_list() == [
+            None,
+            6.0,
+            8.0,
+            8.0,
+            None,
+            4.0,
+            6.0,
+            6.0,
+        ]
+
+    def test_advanced_exit(self):
+        """測試停損、停利、移動停損與保本停損的首次觸發"""
+        df = pl.DataFrame(
+            {
+                "entry": [False, True, False, False, False],
+                "exit": [False, False, False, False, True],
+                "high": [100.0, 101.0, 104.0, 111.0, 100.0],
+                "low": [99.0, 99.0, 100.0, 97.0, 95.0],
+                "close": [100.0, 100.0, 103.0, 105.0, 96.0],
+            }
+        ).with_columns(clean_enex_position("entry", "exit"))
+
+        params = [
+            {"take_profit": 0.1},
+            {"stop_loss": 0.02},
+            {"trailing_stop": 0.05},
+            {"break_even": 0.03},
+            {"stop_loss": 0.02, "take_profit": 0.1},
+        ]
+        grid = df.select(advanced_exit(params=params)).unnest("advanced_exit")
+        assert grid.columns == [
+            "tp=0.1",
+            "sl=0.02",
+            "ts=0.05",
+            "be=0.03",
+            "sl=0.02_tp=0.1",
+        ]
+
+        expected = {
+            "tp=0.1": (110.0, "take_profit"),
+            "sl=0.02": (98.0, "stop_loss"),
+            "ts=0.05": (98.8, "trailing_stop"),
+            "be=0.03": (100.0, "break_even"),
+            # 同一根同時觸及停損與停利時視為先停損
+            "sl=0.02_tp=0.1": (98.0, "stop_loss"),
+        }
+        for name, (price, reason) in expected.items():
+            result = grid[name].struct.unnest()
+            assert result["exit_mask"].to_list() == [False, False, False, True, False]
+            assert result["exit_price"][3] == pytest.approx(price)
+            assert result["exit_reason"].to_list() == [None, None, None, reason, None]
+
+        # 逐列參數與參數列表模式一致
+        single = df.select(advanced_exit(stop_loss=0.02)).unnest("advanced_exit")
+        assert single.equals(grid["sl=0.02"].struct.unnest())
+
+        short = df.select(advanced_exit(take_profit=0.03, direction="short")).unnest(
+            "advanced_exit"
+        )
+        assert short["exit_reason"].to_list() == [None, None, None, "take_profit", None]
+        assert short["exit_price"][3] == pytest.approx(97.0)
+
+        with pytest.raises(ValueError):
+            advanced_exit(stop_loss=0.02, params=params)
+        # 重複的參數組合會產生同名字段
+        with pytest.raises(ValueError, match="duplicate"):
+            advanced_exit(
+                params=[{"stop_loss": 0.02}, {"stop_loss": 0.02, "break_even": None}]
+            )
+        # 拼錯的參數名稱不能被靜默忽略
+        with pytest.raises(ValueError, match="unexpected keys"):
+            advanced_exit(params=[{"stoploss": 0.02}])
+
+    def test_trade_excursions(self):
+        """測試每筆交易的 MAE/MFE 與發生位置"""
+        df = pl.DataFrame(
+            {
+                "entry": [True, False, False, False, True, False, False],
+                "exit": [False, False, False, True, False, False, True],
+                "high": [100.0, 104.0, 102.0, 101.0, 50.0, 51.0, 55.0],
+                "low": [99.0, 101.0, 95.0, 99.0, 49.0, 45.0, 50.0],
+                "close": [100.0, 103.0, 97.0, 100.0, 50.0, 48.0, 52.0],
+            }
+        ).with_columns(clean_enex_position("entry", "exit"))
+
+        result = df.select(trade_excursions()).unnest("trade_excursions")
+
+        assert result["position_id"].to_list() == [0, 1]
+        assert result["exit_idx"].to_list() == [3, 6]
+        assert result["exit_price"].to_list() == [100.0, 52.0]
+        assert result["mae"].to_list() == pytest.approx([-0.05, -0.1])
+        assert result["mfe"].to_list() == pytest.approx([0.04, 0.1])
+        assert result["mae_offset"].to_list() == [2, 1]
+        assert result["mfe_offset"].to_list() == [1, 2]
+
+        short = df.select(trade_excursions(direction="short")).unnest(
+            "trade_excursions"
+        )
+        assert short["mae"].to_list() == pytest.approx([-0.04, -0.1])
+        assert short["mfe"].to_list() == pytest.approx([0.05, 0.1])
+
+    def test_trade_kernels_native_dtypes(self):
+        """測試 Float32 與整數價格直接傳入交易相關 kernel，結果與 Float64 一致"""
+        df = pl.DataFrame(
+            {
+                "entry": [True, False, False, False, True, False, False],
+                "exit": [False, False, False, True, False, False, True],
+                "high": [1000, 1040, 1020, 1010, 500, 510, 550],
+                "low": [990, 1010, 950, 990, 490, 450, 500],
+                "close": [1000, 1030, 970, 1000, 500, 480, 520],
+            }
+        ).with_columns(clean_enex_position("entry", "exit"))
+        prices = ["high", "low", "close"]
+
+        def run(frame):
+            # 逐列輸出與每筆交易一列的輸出長度不同，分開計算
+            per_row = frame.select(
+                intrade_context(),
+                advanced_exit(stop_loss=0.02, take_profit=pl.col("take_profit")),
+            )
+            per_trade = frame.select(trade_excursions(), extract_trades())
+            return per_row, per_trade
+
+        df = df.with_columns(take_profit=pl.lit(0.05, dtype=pl.Float32))
+        expected = run(df.with_columns(pl.col(prices).cast(pl.Float64)))
+        for dtype in [pl.Int64, pl.Int32, pl.Float32]:
+            result = run(df.with_columns(pl.col(prices).cast(dtype)))
+            for actual, wanted in zip(result, expected):
+                assert actual.equals(wanted)
@@ -0,0 +1,41 @@
+import polars as pl
+from polars_indicator import clean_enex_position, profiling, supertrend_from_ohlc
+
+
+def test_profiling_records_calls():
+    """測試開啟統計後記錄各插件函數的呼叫次數與列數，關閉後不再累計"""
+    df = pl.DataFrame(
+        {
+            "high": [10.0, 11.0, 12.0, 11.5, 12.5],
+            "low": [9.0, 10.0, 11.0, 10.5, 11.0],
+            "close": [9.5, 10.5, 11.5, 11.0, 12.0],
+            "entry": [True, False, False, True, False],
+            "exit": [False, False, True, False, True],
+        }
+    )
+
+    with profiling.profile():
+        assert profiling.is_enabled()
+        df.select(supertrend_from_ohlc(atr_period=2))
+        df.select(supertrend_from_ohlc(atr_period=2))
+        df.select(clean_enex_position("entry", "exit"))
+    assert not profiling.is_enabled()
+
+    stats = profiling.stats()
+    assert stats.columns == ["function", "calls", "rows", "ns", "build_ns", "bytes"]
+    rows = {row["function"]: row for row in stats.iter_rows(named=True)}
+    assert rows["supertrend_from_ohlc"]["calls"] == 2
+    assert rows["supertrend_from_ohlc"]["rows"] == 10
+    assert rows["clean_enex_position"]["calls"] == 1
+    assert rows["clean_enex_position"]["ns"] > 0
+    # 輸出建構的耗時與整體耗時分開記錄
+    assert (
+        0 < rows["clean_enex_position"]["build_ns"] <= rows["clean_enex_position"]["ns"]
+    )
+
+    # 關閉後不再累計
+    df.select(clean_enex_position("entry", "exit"))
+    assert profiling.stats().equals(stats)
+
+    profiling.reset()
+    assert profiling.stats().height == 0
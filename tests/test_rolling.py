@@ -0,0 +1,107 @@
+import polars as pl
+import polars_talib as plta
+import pytest
+from polars.testing import assert_series_equal
+from polars_indicator import (
+    atr,
+    ema,
+    rma,
+    rolling_max,
+    rolling_min,
+    sma,
+    true_range,
+)
+
+
+def sample_ohlc() -> pl.DataFrame:
+    """輔助函數：產生測試用 OHLC 資料"""
+    return pl.DataFrame(
+        {
+            "high": [
+                102.0, 103.5, 104.2, 103.8, 105.1, 106.3, 105.9, 107.2,
+                108.1, 107.8, 109.5, 108.9, 110.2, 111.0, 109.8, 112.1,
+            ],
+            "low": [
+                100.2, 101.8, 102.1, 101.9, 103.2, 104.5, 103.8, 105.1,
+                106.2, 105.9, 107.1, 106.8, 108.5, 109.2, 107.9, 110.3,
+            ],
+            "close": [
+                101.5, 102.8, 103.1, 102.9, 104.2, 105.8, 104.9, 106.5,
+                107.3, 106.8, 108.9, 107.5, 109.8, 110.1, 108.7, 111.5,
+            ],
+        }
+    )  # fmt: skip
+
+
+def reference_average(values, period, alpha):
+    """輔助函數：以前 period 個值的簡單平均為初始值的遞推參考實作"""
+    out, value = [], None
+    for i, x in enumerate(values):
+        if i + 1 < period:
+            out.append(None)
+            continue
+        if i + 1 == period:
+            value = sum(values[:period]) / period
+        else:
+            value = value + alpha * (x - value)
+        out.append(value)
+    return out
+
+
+def test_moving_averages():
+    """測試 RMA/EMA/SMA 與參考實作一致"""
+    df = sample_ohlc()
+    close = df["close"].to_list()
+
+    result = df.select(
+        rma("close", 5).alias("rma"),
+        ema("close", 5).alias("ema"),
+        sma("close", 5).alias("sma"),
+    )
+
+    assert result["rma"].to_list() == pytest.approx(
+        reference_average(close, 5, 1 / 5), nan_ok=True
+    )
+    assert result["ema"].to_list() == pytest.approx(
+        reference_average(close, 5, 2 / 6), nan_ok=True
+    )
+    assert_series_equal(
+        result["sma"], df["close"].rolling_mean(5), check_names=False, atol=1e-9
+    )
+
+
+def test_moving_average_skips_nulls():
+    """測試缺值不更新狀態且該列輸出 null"""
+    df = pl.DataFrame({"x": [1.0, None, 2.0, 3.0, float("nan"), 4.0]})
+
+    result = df.select(sma("x", 2))["x"].to_list()
+
+    assert result == [None, None, 1.5, 2.5, None, 3.5]
+
+
+def test_rolling_extremum():
+    """測試滾動最大/最小值與 Polars rolling_max/rolling_min 一致"""
+    df = sample_ohlc()
+
+    result = df.select(
+        rolling_max("high", 4).alias("max"),
+        rolling_min("low", 4).alias("min"),
+    )
+
+    assert_series_equal(result["max"], df["high"].rolling_max(4), check_names=False)
+    assert_series_equal(result["min"], df["low"].rolling_min(4), check_names=False)
+
+
+def test_atr_matches_talib():
+    """測試原生 True Range 與 ATR 與 TA-Lib 一致"""
+    df = sample_ohlc()
+
+    result = df.select(true_range(), atr(period=5))
+    expected = df.select(
+        plta.trange().alias("true_range"), plta.atr(timeperiod=5).alias("atr")
+    )
+
+    assert_series_equal(
+        result["true_range"], expected["true_range"].fill_nan(None), atol=1e-9
+    )
+    assert_series_equal(result["atr"], expected["atr"].fill_nan(None), atol=1e-9)
@@ -0,0 +1,143 @@
+import numpy as np
+import polars as pl
+from polars_indicator import (
+    AtrState,
+    EnexPositionState,
+    atr,
+    clean_enex_position,
+    supertrend,
+    supertrend_from_ohlc,
+)
+from polars_indicator import streaming
+
+
+def random_walk(n: int = 500, seed: int = 5) -> pl.DataFrame:
+    """輔助函數：產生隨機漫步的 OHLC 與 ATR"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0.0, 0.5, n))
+    spread = np.abs(rng.normal(0.0, 0.3, n)) + 0.05
+    return pl.DataFrame(
+        {
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "atr": spread * 2.0,
+        }
+    )
+
+
+direction = pl.col("supertrend").struct.field("direction")
+signals = {
+    "entry": (direction == 1) & (direction.shift(1) == -1),
+    "exit": (direction == -1) & (direction.shift(1) == 1),
+}
+
+
+def test_process_matches_full_computation():
+    """測試分批處理與整段計算的結果一致，包含跨批次邊界的 shift 與 position id"""
+    df = random_walk()
+    expected = (
+        df.with_columns(supertrend_from_ohlc(atr_period=14))
+        .with_columns(**signals)
+        .with_columns(clean_enex_position("entry", "exit"))
+    )
+
+    # ATR 的狀態也跨批次延續，不需要預先計算 atr 欄位
+    steps = [
+        streaming.SuperTrendFromOhlc(atr_period=14),
+        streaming.WithColumns(**signals, lookback=1),
+        streaming.CleanEnexPosition("entry", "exit"),
+    ]
+    batches = list(streaming.process(df.lazy(), steps, batch_size=37))
+
+    assert all(0 < b.height <= 37 for b in batches)
+    assert pl.concat(batches).equals(expected)
+
+
+def test_supertrend_from_ohlc_include_atr():
+    """測試 include_atr 時結構體欄位與 supertrend_from_ohlc 一致"""
+    df = random_walk(200).select("high", "low", "close")
+    expected = df.with_columns(
+        supertrend_from_ohlc(atr_period=10, smoothing="ema", include_atr=True)
+    )
+
+    step = streaming.SuperTrendFromOhlc(
+        atr_period=10, smoothing="ema", include_atr=True
+    )
+    batches = list(streaming.process(df, [step], batch_size=23))
+
+    assert pl.concat(batches).equals(expected)
+
+
+def test_atr_state_round_trip():
+    """測試 AtrState 逐批、逐根推進與狀態序列化後與 atr 表達式一致"""
+    df = random_walk(120)
+    for smoothing in ["rma", "sma", "ema"]:
+        expected = df.select(atr(period=7, smoothing=smoothing))["atr"]
+
+        state = AtrState(7, smoothing)
+        first = state.update_batch(df["high"][:50], df["low"][:50], df["close"][:50])
+        restored = AtrState.from_dict(state.to_dict())
+        rows = [
+            restored.update(high, low, close)
+            for high, low, close in df[50:].select("high", "low", "close").iter_rows()
+        ]
+
+        assert first.equals(expected[:50])
+        assert rows == expected[50:].to_list()
+        assert restored.value == expected[-1]
+
+
+def test_iter_batches_runs_plan_once():
+    """測試上游有 with_columns/filter 的 LazyFrame 只執行一次查詢計畫，而非每批重跑"""
+    df = random_walk(300)
+    calls = []
+
+    def counted(s: pl.Series) -> pl.Series:
+        calls.append(s.len())
+        return s * 2.0
+
+    lazy = (
+        df.lazy()
+        .with_columns(
+            doubled=pl.col("close").map_batches(counted, return_dtype=pl.Float64)
+        )
+        .filter(pl.col("atr") > 0.1)
+    )
+    batches = list(streaming.iter_batches(lazy, batch_size=16))
+
+    assert len(calls) == 1
+    assert all(0 < b.height <= 16 for b in batches)
+    assert pl.concat(batches).equals(lazy.collect())
+
+
+def test_sink_parquet(tmp_path):
+    """測試寫出的分段檔依檔名順序讀回後與整段計算一致"""
+    df = random_walk(200)
+    expected = df.with_columns(supertrend())
+
+    rows = streaming.sink_parquet(
+        df, tmp_path / "out", [streaming.SuperTrend()], batch_size=64
+    )
+
+    assert rows == df.height
+    assert len(list((tmp_path / "out").glob("part-*.parquet"))) == 4
+    result = pl.read_parquet(tmp_path / "out" / "*.parquet")
+    assert result.equals(expected)
+
+
+def test_enex_position_state_round_trip():
+    """測試 EnexPositionState 逐批推進與狀態序列化"""
+    entries = pl.Series("entry", [True, False, False, True, False, True])
+    exits = pl.Series("exit", [False, True, False, False, True, False])
+    expected = pl.DataFrame({"entry": entries, "exit": exits}).select(
+        clean_enex_position("entry", "exit")
+    )["clean_enex_position"]
+
+    state = EnexPositionState()
+    first = state.update_batch(entries[:4], exits[:4])
+    restored = EnexPositionState.from_dict(state.to_dict())
+    second = restored.update_batch(entries[4:], exits[4:])
+
+    assert first.append(second).equals(expected, check_names=False)
+    assert restored.position_id == 2
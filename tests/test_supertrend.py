@@ -1,6 +1,13 @@
 import polars as pl
 import polars_talib as plta
-from polars_indicator import supertrend
+from polars.testing import assert_series_equal
+import pytest
+from polars_indicator import (
+    SuperTrendState,
+    supertrend,
+    supertrend_from_ohlc,
+    supertrend_grid,
+)
 
 
 def calculate_atr(df: pl.DataFrame, period: int = 14) -> pl.DataFrame:
@@ -267,3 +274,301 @@ def test_supertrend_with_nan():
     assert direction_values[2] is None  # low 是 None
     assert direction_values[3] is None  # close 是 None
     assert direction_values[4] is None  # atr 是 None
+
+
+def sample_ohlc() -> pl.DataFrame:
+    """輔助函數：產生測試用 OHLC 資料"""
+    return pl.DataFrame(
+        {
+            "high": [
+                102.0, 103.5, 104.2, 103.8, 105.1, 106.3, 105.9, 107.2,
+                108.1, 107.8, 109.5, 108.9, 110.2, 111.0, 109.8, 112.1,
+                111.4, 110.2, 108.9, 109.7,
+            ],
+            "low": [
+                100.2, 101.8, 102.1, 101.9, 103.2, 104.5, 103.8, 105.1,
+                106.2, 105.9, 107.1, 106.8, 108.5, 109.2, 107.9, 110.3,
+                109.1, 107.6, 106.2, 107.4,
+            ],
+            "close": [
+                101.5, 102.8, 103.1, 102.9, 104.2, 105.8, 104.9, 106.5,
+                107.3, 106.8, 108.9, 107.5, 109.8, 110.1, 108.7, 111.5,
+                109.6, 108.0, 107.1, 109.2,
+            ],
+        }
+    )  # fmt: skip
+
+
+def test_supertrend_from_ohlc_matches_talib_atr():
+    """測試融合 ATR 版本與 polars_talib ATR + supertrend 結果一致"""
+    df = sample_ohlc()
+
+    expected = calculate_atr(df, 5).with_columns(supertrend()).unnest("supertrend")
+    result = df.with_columns(
+        supertrend_from_ohlc(atr_period=5, include_atr=True)
+    ).unnest("supertrend")
+
+    # talib 的暖機期可能為 NaN，只比較 ATR 就緒後的值
+    assert result["atr"][:5].null_count() == 5
+    assert_series_equal(result["atr"][5:], expected["atr"][5:])
+    for field in ["direction", "long", "short", "trend"]:
+        assert_series_equal(result[field], expected[field])
+
+
+def test_supertrend_from_ohlc_schema():
+    """測試 include_atr 控制輸出字段"""
+    df = sample_ohlc()
+
+    result = df.with_columns(supertrend_from_ohlc(atr_period=5))
+    assert result.schema["supertrend"] == pl.Struct(
+        {
+            "direction": pl.Int32,
+            "long": pl.Float64,
+            "short": pl.Float64,
+            "trend": pl.Float64,
+        }
+    )
+
+    result = df.with_columns(supertrend_from_ohlc(atr_period=5, include_atr=True))
+    assert result.schema["supertrend"] == pl.Struct(
+        {
+            "direction": pl.Int32,
+            "long": pl.Float64,
+            "short": pl.Float64,
+            "trend": pl.Float64,
+            "atr": pl.Float64,
+        }
+    )
+
+
+def test_supertrend_from_ohlc_sma():
+    """測試 SMA 平滑等同於 True Range 的簡單移動平均"""
+    df = sample_ohlc()
+
+    prev_close = pl.col("close").shift(1)
+    true_range = pl.max_horizontal(
+        pl.col("high") - pl.col("low"),
+        (pl.col("high") - prev_close).abs(),
+        (pl.col("low") - prev_close).abs(),
+    )
+    expected = df.select(
+        atr=pl.when(prev_close.is_not_null()).then(true_range).rolling_mean(5)
+    )["atr"]
+
+    result = df.select(
+        supertrend_from_ohlc(
+            atr_period=5, smoothing="sma", include_atr=True
+        ).struct.field("atr")
+    )["atr"]
+
+    assert result[:5].null_count() == 5
+    assert_series_equal(result[5:], expected[5:])
+
+
+def test_supertrend_grid_matches_single_calls():
+    """測試參數網格結果與逐一呼叫 supertrend 一致"""
+    df = calculate_atr(sample_ohlc(), 5)
+
+    result = df.select(
+        supertrend_grid(upper_multipliers=[1.5, 2.0], lower_multipliers=[1.0, 3.0])
+    ).unnest("supertrend_grid")
+
+    assert result.columns == ["1.5_1.0", "1.5_3.0", "2.0_1.0", "2.0_3.0"]
+    for upper, lower in [(1.5, 1.0), (1.5, 3.0), (2.0, 1.0), (2.0, 3.0)]:
+        expected = df.select(
+            supertrend(upper_multiplier=upper, lower_multiplier=lower)
+        )["supertrend"]
+        assert_series_equal(result[f"{upper}_{lower}"], expected, check_names=False)
+
+
+def test_supertrend_grid_with_atr_periods():
+    """測試指定 ATR 週期時與 supertrend_from_ohlc 一致"""
+    df = sample_ohlc()
+
+    result = df.select(
+        supertrend_grid(upper_multipliers=[2.0, 3.0], atr_periods=[3, 5])
+    ).unnest("supertrend_grid")
+
+    assert result.columns == ["3_2.0_2.0", "3_3.0_3.0", "5_2.0_2.0", "5_3.0_3.0"]
+    for period in [3, 5]:
+        for mult in [2.0, 3.0]:
+            expected = df.select(
+                supertrend_from_ohlc(
+                    atr_period=period,
+                    upper_multiplier=mult,
+                    lower_multiplier=mult,
+                )
+            )["supertrend"]
+            assert_series_equal(
+                result[f"{period}_{mult}_{mult}"], expected, check_names=False
+            )
+
+    # 字段名稱與 Python 的 float 格式一致，可直接用 f-string 組出
+    result = df.select(
+        supertrend_grid(upper_multipliers=[1e-5, 2.0], atr_periods=[3])
+    ).unnest("supertrend_grid")
+    assert result.columns == ["3_1e-05_1e-05", "3_2.0_2.0"]
+    for mult in [1e-5, 2.0]:
+        assert f"3_{mult}_{mult}" in result.columns
+
+    # 重複的參數組合會產生同名字段
+    for kwargs in [
+        {"upper_multipliers": [2.0, 3.0, 2.0], "atr_periods": [3]},
+        {"upper_multipliers": [2.0], "atr_periods": [3, 5, 3]},
+    ]:
+        with pytest.raises(pl.exceptions.PolarsError, match="duplicate"):
+            df.select(supertrend_grid(**kwargs))
+
+
+def test_supertrend_by_matches_over():
+    """測試 by 分組結果與 .over() 一致"""
+    single = calculate_atr(sample_ohlc(), 5)
+    df = pl.concat(
+        [
+            single.with_columns(symbol=pl.lit("AAA")),
+            single.with_columns(symbol=pl.lit("BBB"), close=pl.col("close") * 1.01),
+        ]
+    )
+
+    result = df.select(supertrend(by="symbol"))["supertrend"]
+    expected = df.select(supertrend().over("symbol"))["supertrend"]
+    assert_series_equal(result, expected)
+
+    result = df.select(supertrend_from_ohlc(atr_period=5, by="symbol"))
+    expected = df.select(supertrend_from_ohlc(atr_period=5).over("symbol"))
+    assert_series_equal(result["supertrend"], expected["supertrend"])
+
+
+def test_supertrend_state_matches_batch():
+    """測試增量狀態逐根更新與批次計算完全一致"""
+    df = calculate_atr(sample_ohlc(), 5)
+    expected = df.select(supertrend())["supertrend"].struct.unnest()
+
+    # 以前半段歷史建立狀態，後半段逐根更新
+    split = 12
+    history = df.head(split)
+    state = SuperTrendState.from_history(
+        history["high"], history["low"], history["close"], history["atr"]
+    )
+
+    for i, row in enumerate(df.tail(df.height - split).iter_rows(named=True)):
+        bar = state.update(row["high"], row["low"], row["close"], row["atr"])
+        assert bar == tuple(expected.row(split + i))
+
+    # 還原狀態後以批次更新也應一致
+    state = SuperTrendState.from_dict(
+        SuperTrendState.from_history(
+            history["high"], history["low"], history["close"], history["atr"]
+        ).to_dict()
+    )
+    tail = df.tail(df.height - split)
+    result = state.update_batch(tail["high"], tail["low"], tail["close"], tail["atr"])
+    assert result.struct.unnest().equals(expected.tail(df.height - split))
+
+
+def test_supertrend_state_from_bands():
+    """測試以最後一根的方向、上下軌與收盤價接續計算，與整段計算一致"""
+    df = calculate_atr(sample_ohlc(), 5)
+    expected = df.select(supertrend(upper_multiplier=3.0))["supertrend"].struct.unnest()
+
+    split = 12
+    history = df.head(split)
+    previous = SuperTrendState.from_history(
+        history["high"], history["low"], history["close"], history["atr"], 3.0
+    )
+    # 表達式輸出的當前軌道與狀態物件的軌道一致
+    last = expected.row(split - 1, named=True)
+    band = previous.lower_band if last["direction"] == 1 else previous.upper_band
+    assert last["trend"] == band
+
+    state = SuperTrendState.from_bands(
+        previous.direction,
+        previous.upper_band,
+        previous.lower_band,
+        history["close"][-1],
+        upper_multiplier=3.0,
+    )
+    tail = df.tail(df.height - split)
+    result = state.update_batch(tail["high"], tail["low"], tail["close"], tail["atr"])
+    assert result.struct.unnest().equals(expected.tail(df.height - split))
+
+    with pytest.raises(ValueError):
+        SuperTrendState.from_bands(0, 1.0, 0.5, 1.0)
+
+
+def test_supertrend_bucket_matches_resample():
+    """測試以 bucket 在核心內聚合的高時間框架結果與先聚合再 join 一致"""
+    df = sample_ohlc().with_columns(bucket=pl.int_range(pl.len()) // 4)
+
+    # 先聚合為高時間框架 K 棒再計算，每列取上一根已完成 K 棒的值
+    higher = (
+        df.group_by("bucket", maintain_order=True)
+        .agg(pl.col("high").max(), pl.col("low").min(), pl.col("close").last())
+        .with_columns(supertrend_from_ohlc(atr_period=2, include_atr=True))
+        .select(pl.col("bucket") + 1, "supertrend")
+    )
+    expected = df.join(higher, on="bucket", how="left")["supertrend"]
+
+    result = df.select(
+        supertrend_from_ohlc(atr_period=2, include_atr=True, bucket="bucket")
+    )["supertrend"]
+    assert result.struct.unnest().equals(expected.struct.unnest())
+
+    # developing 模式下每根高時間框架 K 棒的最後一列即為完成後的值
+    developing = df.select(
+        "bucket",
+        supertrend_from_ohlc(
+            atr_period=2, include_atr=True, bucket="bucket", developing=True
+        ),
+    )
+    last_rows = developing.group_by("bucket", maintain_order=True).last()
+    assert (
+        last_rows["supertrend"]
+        .struct.unnest()
+        .equals(higher["supertrend"].struct.unnest())
+    )
+
+
+def test_supertrend_native_dtypes():
+    """測試 Float32 與整數價格直接計算，結果與轉為 Float64 後一致"""
+    # 以 0.1 為跳動單位的整數價格
+    ticks = sample_ohlc().select((pl.all() * 10).round().cast(pl.Int64))
+    expected = ticks.cast(pl.Float64).select(supertrend_from_ohlc(atr_period=5))
+
+    for dtype in [pl.Int64, pl.Int32, pl.Float32]:
+        result = ticks.cast(dtype).select(supertrend_from_ohlc(atr_period=5))
+        assert result.equals(expected)
+
+    # 指定輸出精度為 Float32
+    result = ticks.cast(pl.Float32).select(
+        supertrend_from_ohlc(atr_period=5, include_atr=True, output_dtype="float32")
+    )
+    assert result.schema["supertrend"] == pl.Struct(
+        {
+            "direction": pl.Int32,
+            "long": pl.Float32,
+            "short": pl.Float32,
+            "trend": pl.Float32,
+            "atr": pl.Float32,
+        }
+    )
+    unnested = result.unnest("supertrend")
+    assert_series_equal(
+        unnested["trend"], expected.unnest("supertrend")["trend"].cast(pl.Float32)
+    )
+
+
+def test_supertrend_multi_chunk():
+    """測試多 chunk 輸入跨 chunk 延續狀態，且輸出保留相同的 chunk 佈局"""
+    df = sample_ohlc()
+    chunked = pl.concat([df[:7], df[7:8], df[8:]], rechunk=False)
+    assert chunked["high"].n_chunks() == 3
+
+    result = chunked.select(supertrend_from_ohlc(atr_period=5))["supertrend"]
+    expected = df.select(supertrend_from_ohlc(atr_period=5))["supertrend"]
+    assert result.n_chunks() == 3
+    assert result.equals(expected)
+
+    chunked = calculate_atr(chunked, 5)
+    result = chunked.select(supertrend())["supertrend"]
+    assert result.equals(calculate_atr(df, 5).select(supertrend())["supertrend"])
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+from polars_indicator import align_timeframe
+
+
+def test_align_timeframe():
+    """測試高時間框架只在 K 棒完成後才對齊，缺失的 K 棒標記為 is_gap"""
+    lower = pl.DataFrame(
+        {
+            "timestamp": pl.datetime_range(
+                datetime(2024, 1, 1, 9, 0),
+                datetime(2024, 1, 1, 9, 14),
+                "1m",
+                eager=True,
+            ),
+        }
+    )
+    # 缺少 09:05 的 5m K 棒
+    higher = pl.DataFrame(
+        {
+            "timestamp": [datetime(2024, 1, 1, 9, 0), datetime(2024, 1, 1, 9, 10)],
+            "trend": [1.0, 2.0],
+        }
+    )
+
+    result = lower.select(
+        align_timeframe(higher, higher_period=timedelta(minutes=5))
+    ).unnest("aligned")
+
+    assert result.columns == ["trend", "is_gap"]
+    assert result["trend"].to_list() == [None] * 5 + [1.0] * 10
+    assert result["is_gap"].to_list() == [True] * 5 + [False] * 5 + [True] * 5
+
+    # 與 join_asof 以完成時間對齊的結果一致
+    expected = lower.join_asof(
+        higher.with_columns(pl.col("timestamp") + timedelta(minutes=5)),
+        on="timestamp",
+    )
+    assert result["trend"].equals(expected["trend"])
+
+
+def test_align_timeframe_completion_time():
+    """測試未指定週期時以時間戳作為完成時間，整數時間戳亦可"""
+    lower = pl.DataFrame({"t": list(range(10))})
+    higher = pl.DataFrame({"t": [2, 5, 9], "a": [10, 20, 30], "b": ["x", "y", "z"]})
+
+    result = lower.select(align_timeframe(higher, time="t", on="t")).unnest("aligned")
+
+    assert result["a"].to_list() == [None, None, 10, 10, 10, 20, 20, 20, 20, 30]
+    assert result["b"].to_list() == [None, None, "x", "x", "x", "y", "y", "y", "y", "z"]
+    assert result["is_gap"].to_list() == [True, True] + [False] * 8
+
+
+def test_align_timeframe_lazy():
+    """測試低時間框架可為 LazyFrame，高時間框架為 LazyFrame 時明確報錯"""
+    lower = pl.DataFrame({"t": list(range(10))})
+    higher = pl.DataFrame({"t": [2, 5, 9], "a": [10, 20, 30]})
+
+    eager = lower.select(align_timeframe(higher, time="t", on="t"))
+    lazy = lower.lazy().select(align_timeframe(higher, time="t", on="t")).collect()
+    assert lazy.equals(eager)
+
+    with pytest.raises(TypeError, match="eager DataFrame"):
+        align_timeframe(higher.lazy(), time="t", on="t")